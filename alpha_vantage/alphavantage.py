@@ -1,9 +1,10 @@
-import requests
 import os
+import json
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 import inspect
 import sys
-import re
+import time
 # Pandas became an optional dependency, but we still want to track it
 try:
     import pandas
@@ -11,6 +12,39 @@ try:
 except ImportError:
     _PANDAS_FOUND = False
 import csv
+from .cache import SeriesCache, choose_outputsize
+from .hooks import observe_call, current_event, response_received, \
+    report_cached
+from .tracing import get_tracer, trace_call, stage, stage_since, \
+    set_attributes, trace_response, is_tracing, propagate
+from .store import series_key
+from .keypool import KeyPool, is_throttled, mask_key
+from .transport import RequestsTransport
+from .profiling import Profiler
+from .usage import UsageMeter
+
+
+def _decode_json(body, treat_info_as_error):
+    """ Decode the body of a json response. It raises a ValueError when the
+    api returned an error (a module function, so that it can be sent to a
+    process pool)
+
+    Keyword Arguments:
+        body: The body of the response
+        treat_info_as_error: Treat the information and note messages as
+            errors
+    """
+    json_response = json.loads(body)
+    if not json_response:
+        raise ValueError(
+            'Error getting data from the api, no return was given.')
+    elif "Error Message" in json_response:
+        raise ValueError(json_response["Error Message"])
+    elif "Information" in json_response and treat_info_as_error:
+        raise ValueError(json_response["Information"])
+    elif "Note" in json_response and treat_info_as_error:
+        raise ValueError(json_response["Note"])
+    return json_response
 
 
 class AlphaVantage(object):
@@ -25,12 +59,19 @@ class AlphaVantage(object):
 
     _RAPIDAPI_URL = "https://alpha-vantage.p.rapidapi.com/query?"
 
+    # Keyword arguments accepted by every api call that configure the call
+    # itself and are never sent to the api.
+    _CALL_OPTIONS = ('start', 'priority', 'deadline', 'tag')
+
     def __init__(self, key=None, output_format='json',
-                 treat_info_as_error=True, indexing_type='date', proxy=None, rapidapi=False):
+                 treat_info_as_error=True, indexing_type='date', proxy=None, rapidapi=False,
+                 cache=None, store=None, scheduler=None, base_url=None,
+                 transport=None, hooks=None, tracer=None, usage=None):
         """ Initialize the class
 
         Keyword Arguments:
-            key:  Alpha Vantage api key
+            key:  Alpha Vantage api key, or a KeyPool to spread the calls
+            across several keys
             retries:  Maximum amount of retries in case of faulty connection or
                 server not able to answer the call.
             treat_info_as_error: Treat information from the api as errors
@@ -43,10 +84,37 @@ class AlphaVantage(object):
             the URL of the proxy.
             rapidapi: Boolean describing whether or not the API key is
             through the RapidAPI platform or not
+            cache: A SeriesCache where the time series are merged and kept,
+            True to create a new one or None to disable caching. The cache
+            is used by outputsize='auto' to choose between 'compact' and
+            'full' calls, which return the merged series.
+            store: A SeriesStore where the time series returned by the api
+            are appended, None to disable it.
+            scheduler: A RequestScheduler dispatching the calls within the
+            rate limit of the key, in the order given by the priority and
+            deadline options of the calls. It may be shared between the
+            clients using the same key.
+            base_url: The url the calls are sent to, for instance a local
+            caching proxy (http://localhost:8080/query). Default the alpha
+            vantage api or the RapidAPI endpoint when rapidapi is True.
+            transport: The object sending the calls, it takes the url,
+            headers and proxy of a call and returns a TransportResponse
+            (status, body bytes and headers). Default a RequestsTransport,
+            see the transport module for replay and endpoint transports.
+            hooks: A list of callables given a CallEvent at the end of every
+            api call (timings, bytes, cache and retries of the call), see the
+            LoggingHook and PrometheusHook of the hooks module.
+            tracer: Trace every api call with a span and child spans per
+            stage (url_build, queue_wait, http, decode, format). True to use
+            OpenTelemetry, or a tracer (an OpenTelemetry tracer or a
+            tracing.SpanRecorder). None (default) disables tracing.
+            usage: A UsageMeter accounting for the calls of the client by
+            function, symbol, key and tag (the tag option of the calls), True
+            to create a new one. It may be shared between clients.
         """
         if key is None:
             key = os.getenv('ALPHAVANTAGE_API_KEY')
-        if not key or not isinstance(key, str):
+        if not key or not isinstance(key, (str, KeyPool)):
             raise ValueError('The AlphaVantage API key must be provided '
                              'either through the key parameter or '
                              'through the environment variable '
@@ -60,6 +128,10 @@ class AlphaVantage(object):
                 'x-rapidapi-key': key
             }
         self.rapidapi = rapidapi
+        if base_url is None:
+            base_url = AlphaVantage._RAPIDAPI_URL if rapidapi \
+                else AlphaVantage._ALPHA_VANTAGE_API_URL
+        self.base_url = self._query_url(base_url)
         self.key = key
         self.output_format = output_format
         if self.output_format == 'pandas' and not _PANDAS_FOUND:
@@ -72,6 +144,28 @@ class AlphaVantage(object):
         self._append_type = True
         self.indexing_type = indexing_type
         self.proxy = proxy or {}
+        self.transport = transport if transport is not None \
+            else RequestsTransport()
+        self.cache = SeriesCache() if cache is True else cache
+        self.store = store
+        self.scheduler = scheduler
+        self.hooks = list(hooks or [])
+        self.tracer = get_tracer(tracer)
+        self.profiler = None
+        self.usage = UsageMeter() if usage is True else usage
+        if self.usage is not None:
+            self.hooks.append(self.usage)
+
+    @staticmethod
+    def _query_url(url):
+        """ Make sure a url is ready for its query parameters to be appended
+
+        Keyword Arguments:
+            url: The url of the api (i.e. http://localhost:8080/query)
+        """
+        if url.endswith(('?', '&')):
+            return url
+        return '{}{}'.format(url, '&' if '?' in url else '?')
 
     @classmethod
     def _call_api_on_func(cls, func):
@@ -108,6 +202,10 @@ class AlphaVantage(object):
 
         @wraps(func)
         def _call_wrapper(self, *args, **kwargs):
+            # Options of the call itself that are not sent to the api
+            build_start = time.time_ns()
+            call_options = {k: kwargs.pop(k) for k in list(kwargs)
+                            if k in AlphaVantage._CALL_OPTIONS}
             used_kwargs = kwargs.copy()
             # Get the used positional arguments given to the function
             used_kwargs.update(zip(argspec.args[positional_count:],
@@ -121,13 +219,26 @@ class AlphaVantage(object):
             # key for it and for its meta data.
             function_name, data_key, meta_data_key = func(
                 self, *args, **kwargs)
-            base_url = AlphaVantage._RAPIDAPI_URL if self.rapidapi else AlphaVantage._ALPHA_VANTAGE_API_URL
-            url = "{}function={}".format(base_url, function_name)
+            url = "{}function={}".format(self.base_url, function_name)
+            call_params = {}
             for idx, arg_name in enumerate(argspec.args[1:]):
                 try:
-                    arg_value = args[idx]
+                    call_params[arg_name] = args[idx]
                 except IndexError:
-                    arg_value = used_kwargs[arg_name]
+                    call_params[arg_name] = used_kwargs[arg_name]
+            event = current_event()
+            if event is not None:
+                event.function = function_name
+                event.tag = call_options.get('tag')
+                event.symbol = self._call_symbol(call_params)
+            if is_tracing():
+                set_attributes(function=function_name,
+                               symbol=self._call_symbol(call_params))
+            auto = call_params.get('outputsize') == 'auto'
+            if auto:
+                call_params['outputsize'] = self._resolve_outputsize(
+                    function_name, call_params, call_options.get('start'))
+            for arg_name, arg_value in call_params.items():
                 if 'matype' in arg_name and arg_value:
                     # If the argument name has matype, we gotta map the string
                     # or the integer
@@ -151,15 +262,41 @@ class AlphaVantage(object):
                 raise ValueError("Output format: {} not recognized, only json,"
                                  "pandas and csv are supported".format(
                                      self.output_format.lower()))
-            apikey_parameter = "" if self.rapidapi else "&apikey={}".format(
-                self.key)
-            if self._append_type:
-                url = '{}{}&datatype={}'.format(url, apikey_parameter, oformat)
-            else:
-                url = '{}{}'.format(url, apikey_parameter)
-            return self._handle_api_call(url), data_key, meta_data_key
+            if event is not None:
+                event.lap('url_build')
+            stage_since('url_build', build_start)
+            call_response = self._request(url, oformat, call_options)
+            if self.cache is not None and 'outputsize' in call_params \
+                    and isinstance(call_response, dict):
+                cache_key = SeriesCache.make_key(function_name, call_params)
+                if event is not None:
+                    event.cache = 'miss' if self.cache.coverage(
+                        cache_key) is None else 'partial'
+                call_response = self.cache.update(
+                    cache_key, call_response, data_key,
+                    call_params['outputsize'], merge=auto)
+            if self.store is not None and isinstance(call_response, dict):
+                self.store.save(function_name, call_params, call_response,
+                                data_key)
+            response_received(event)
+            trace_response()
+            return call_response, data_key, meta_data_key
         return _call_wrapper
 
+    @staticmethod
+    def _observed(func):
+        """ Decorator giving the events of the calls to the hooks of the
+        client and opening their spans when the client has a tracer
+        """
+        @wraps(func)
+        def _observed_wrapper(self, *args, **kwargs):
+            if not self.hooks and self.tracer is None:
+                return func(self, *args, **kwargs)
+            with observe_call(self.hooks), \
+                    trace_call(self.tracer, func.__name__):
+                return func(self, *args, **kwargs)
+        return _observed_wrapper
+
     @classmethod
     def _output_format_sector(cls, func, override=None):
         """ Decorator in charge of giving the output its right format, either
@@ -175,34 +312,19 @@ class AlphaVantage(object):
         def _format_wrapper(self, *args, **kwargs):
             json_response, data_key, meta_data_key = func(
                 self, *args, **kwargs)
-            if isinstance(data_key, list):
-                # Replace the strings into percentage
-                data = {key: {k: self.percentage_to_float(v)
-                              for k, v in json_response[key].items()} for key in data_key}
-            else:
-                data = json_response[data_key]
-            # TODO: Fix orientation in a better way
-            meta_data = json_response[meta_data_key]
             # Allow to override the output parameter in the call
             if override is None:
                 output_format = self.output_format.lower()
             elif 'json' or 'pandas' in override.lower():
                 output_format = override.lower()
             # Choose output format
-            if output_format == 'json':
-                return data, meta_data
-            elif output_format == 'pandas':
-                data_pandas = pandas.DataFrame.from_dict(data,
-                                                         orient='columns')
-                # Rename columns to have a nicer name
-                col_names = [re.sub(r'\d+.', '', name).strip(' ')
-                             for name in list(data_pandas)]
-                data_pandas.columns = col_names
-                return data_pandas, meta_data
-            else:
+            if output_format not in ('json', 'pandas'):
                 raise ValueError('Format: {} is not supported'.format(
                     self.output_format))
-        return _format_wrapper
+            # Replace the strings into percentage, once per snapshot
+            return self.sector_parser.parse(json_response, data_key,
+                                            meta_data_key, output_format)
+        return cls._observed(_format_wrapper)
 
     @classmethod
     def _output_format(cls, func, override=None):
@@ -298,7 +420,7 @@ class AlphaVantage(object):
             else:
                 raise ValueError('Format: {} is not supported'.format(
                     self.output_format))
-        return _format_wrapper
+        return cls._observed(_format_wrapper)
 
     def set_proxy(self, proxy=None):
         """ Set a new proxy configuration
@@ -309,6 +431,219 @@ class AlphaVantage(object):
         """
         self.proxy = proxy or {}
 
+    def add_hook(self, hook):
+        """ Add a hook called with the CallEvent of every api call
+
+        Keyword Arguments:
+            hook: A callable taking a CallEvent
+        """
+        self.hooks.append(hook)
+
+    def enable_profiling(self, profiler=None):
+        """ Switch on the profiling of the calls of the client and return
+        the Profiler aggregating their CPU time per endpoint and stage
+
+        Keyword Arguments:
+            profiler: The Profiler used, it may be shared by several clients.
+                Default a new one
+        """
+        self.disable_profiling()
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.hooks.append(self.profiler)
+        return self.profiler
+
+    def disable_profiling(self):
+        """ Switch off the profiling of the calls of the client
+        """
+        if self.profiler is not None:
+            self.hooks.remove(self.profiler)
+            self.profiler = None
+
+    def _gather(self, calls, workers, then):
+        """ Make a batch of api calls concurrently and return
+        then(results), the results being in the order of the calls. A call
+        failing with a ValueError gives its error as its result.
+
+        Keyword Arguments:
+            calls: The calls, callables without argument
+            workers: The number of calls made at the same time
+            then: The callable building the result of the batch
+        """
+        def _call(call):
+            try:
+                return call()
+            except ValueError as error:
+                return error
+        if not calls:
+            return then([])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # One copy of the context per call, for the spans and events
+            results = [f.result() for f in [
+                executor.submit(propagate(_call), call) for call in calls]]
+        return then(results)
+
+    def _report_cached(self, function_name, symbol=None):
+        """ Give the hooks the event of a call answered by a local cache of
+        the client, the api not being called
+
+        Keyword Arguments:
+            function_name: The alpha vantage function of the call
+            symbol: The symbol of the call, None when the call has none
+        """
+        report_cached(self.hooks, function_name, symbol)
+
+    @staticmethod
+    def _call_symbol(call_params):
+        """ The symbol of a call (the currency pair for the fx and crypto
+        calls), None when it has none
+        """
+        if call_params.get('symbol'):
+            symbol = call_params['symbol']
+            if call_params.get('market'):
+                symbol = '{}/{}'.format(symbol, call_params['market'])
+            return symbol
+        for base, quote in (('from_symbol', 'to_symbol'),
+                            ('from_currency', 'to_currency')):
+            if call_params.get(base):
+                return '{}/{}'.format(call_params[base],
+                                      call_params.get(quote))
+        return None
+
+    @staticmethod
+    def _record_response(event, response):
+        """ Record the size, the network timings and the cache status (set
+        by a caching proxy) of a response in the event of the call
+        """
+        event.requests += 1
+        event.bytes += len(response.body)
+        for step, duration in (response.timings or {}).items():
+            if duration is not None:
+                setattr(event, step, (getattr(event, step) or 0.) + duration)
+        cache = response.headers.get('X-Cache')
+        if cache and event.cache is None:
+            event.cache = cache.lower()
+
+    def _resolve_outputsize(self, function_name, call_params, start=None):
+        """ Choose the outputsize of a call made with outputsize='auto',
+        looking at what the cache (or else the store) already holds for the
+        series and the oldest date needed by the caller. The choice is given
+        to the hooks in the CallEvent of the call.
+
+        Keyword Arguments:
+            function_name: The alpha vantage function (i.e. TIME_SERIES_DAILY)
+            call_params: Dictionary with the parameters of the call
+            start: The oldest date needed, None for the whole history
+        """
+        coverage = None
+        if self.cache is not None:
+            coverage = self.cache.coverage(
+                SeriesCache.make_key(function_name, call_params))
+        if coverage is None and self.store is not None:
+            key = series_key(function_name, call_params)
+            if key is not None:
+                coverage = self.store.coverage(*key)
+        outputsize = choose_outputsize(
+            function_name, interval=call_params.get('interval'),
+            coverage=coverage, start=start)
+        event = current_event()
+        if event is not None:
+            event.outputsize = outputsize
+        if is_tracing():
+            set_attributes(outputsize=outputsize)
+        return outputsize
+
+    def _authorize(self, url, key, oformat):
+        """ Add the key and the datatype to the url of a call and return
+        the url with the headers to send along
+
+        Keyword Arguments:
+            url: The url of the call, without key nor datatype
+            key: The api key used for the call
+            oformat: The datatype asked to the api
+        """
+        headers = self.headers
+        if self.rapidapi:
+            headers = dict(self.headers)
+            headers['x-rapidapi-key'] = key
+            apikey_parameter = ""
+        else:
+            apikey_parameter = "&apikey={}".format(key)
+        if self._append_type:
+            url = '{}{}&datatype={}'.format(url, apikey_parameter, oformat)
+        else:
+            url = '{}{}'.format(url, apikey_parameter)
+        return url, headers
+
+    @staticmethod
+    def _throttle_message(call_response):
+        """ Return the throttle message of a response returned despite it,
+        which happens when the information is not treated as an error
+        """
+        if isinstance(call_response, dict):
+            message = call_response.get('Note') or \
+                call_response.get('Information')
+            if message and is_throttled(message):
+                return message
+        return None
+
+    def _request(self, url, oformat, call_options):
+        """ Send an api call and return its response. The key is taken
+        from the pool when the client has one, calls throttled on a key of
+        the pool are retried with another key. The call waits for the
+        scheduler of the client when there is one.
+
+        Keyword Arguments:
+            url: The url of the call, without key nor datatype
+            oformat: The datatype asked to the api
+            call_options: Dictionary with the options of the call
+        """
+        pool = self.key if isinstance(self.key, KeyPool) else None
+        attempts = len(pool) if pool is not None else 1
+        event = current_event()
+        for attempt in range(attempts):
+            waiting = time.perf_counter()
+            waiting_start = time.time_ns()
+            key = pool.checkout() if pool is not None else self.key
+            key_url, headers = self._authorize(url, key, oformat)
+            if self.scheduler is not None:
+                self.scheduler.acquire(
+                    priority=call_options.get('priority', 0),
+                    deadline=call_options.get('deadline'))
+            if pool is not None or self.scheduler is not None:
+                stage_since('queue_wait', waiting_start)
+            if event is not None:
+                event.key = mask_key(key)
+                event.retries = attempt
+                event.queue_wait += time.perf_counter() - waiting
+                event.lap('queue_wait')
+            try:
+                call_response = self._handle_api_call(key_url,
+                                                      headers=headers)
+            except ValueError as error:
+                if event is not None and is_throttled(error):
+                    event.throttled += 1
+                if pool is None:
+                    raise
+                if not is_throttled(error):
+                    pool.report(key)
+                    raise
+                pool.report(key, error)
+                if attempt == attempts - 1:
+                    raise
+                continue
+            except Exception as error:
+                if pool is not None:
+                    pool.report(key, error)
+                raise
+            message = self._throttle_message(call_response)
+            if message and event is not None:
+                event.throttled += 1
+            if pool is not None:
+                pool.report(key, ValueError(message) if message else None)
+                if message and attempt < attempts - 1:
+                    continue
+            return call_response
+
     def map_to_matype(self, matype):
         """ Convert to the alpha vantage math type integer. It returns an
         integer correspondent to the type of math to apply to a function. It
@@ -338,32 +673,45 @@ class AlphaVantage(object):
             value = AlphaVantage._ALPHA_VANTAGE_MATH_MAP.index(matype)
         return value
 
-    def _handle_api_call(self, url):
+    def _handle_api_call(self, url, headers=None):
         """ Handle the return call from the  api and return a data and meta_data
         object. It raises a ValueError on problems
 
         Keyword Arguments:
             url:  The url of the service
-            data_key:  The key for getting the data from the jso object
-            meta_data_key:  The key for getting the meta data information out
-            of the json object
+            headers:  The headers of the call, default the client headers
+        """
+        with stage('http'):
+            response = self.transport.send(
+                url, headers=self.headers if headers is None else headers,
+                proxy=self.proxy)
+        set_attributes(bytes=len(response.body), status=response.status)
+        event = current_event()
+        if event is not None:
+            event.lap('http')
+            self._record_response(event, response)
+        decoding = time.perf_counter()
+        try:
+            with stage('decode'):
+                return self._decode_response(response)
+        finally:
+            if event is not None:
+                event.decode += time.perf_counter() - decoding
+                event.lap('decode')
+
+    def _decode_response(self, response):
+        """ Decode the TransportResponse of a call and return the data and
+        meta_data object. It raises a ValueError on problems
+
+        Keyword Arguments:
+            response: The TransportResponse of the call
         """
-        response = requests.get(url, proxies=self.proxy, headers=self.headers)
         if 'json' in self.output_format.lower() or 'pandas' in \
                 self.output_format.lower():
-            json_response = response.json()
-            if not json_response:
-                raise ValueError(
-                    'Error getting data from the api, no return was given.')
-            elif "Error Message" in json_response:
-                raise ValueError(json_response["Error Message"])
-            elif "Information" in json_response and self.treat_info_as_error:
-                raise ValueError(json_response["Information"])
-            elif "Note" in json_response and self.treat_info_as_error:
-                raise ValueError(json_response["Note"])
-            return json_response
+            return _decode_json(response.body, self.treat_info_as_error)
         else:
-            csv_response = csv.reader(response.text.splitlines())
+            csv_response = csv.reader(
+                response.body.decode('utf-8').splitlines())
             if not csv_response:
                 raise ValueError(
                     'Error getting data from the api, no return was given.')
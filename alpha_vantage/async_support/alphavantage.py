@@ -1,7 +1,11 @@
-import aiohttp
-from functools import wraps
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import ContextVar
+import json
+import time
+from functools import partial, wraps
 import inspect
-import re
 # Pandas became an optional dependency, but we still want to track it
 try:
     import pandas
@@ -9,7 +13,86 @@ try:
 except ImportError:
     _PANDAS_FOUND = False
 import csv
-from ..alphavantage import AlphaVantage as AlphaVantageBase
+from ..alphavantage import AlphaVantage as AlphaVantageBase, _decode_json
+from ..cache import SeriesCache
+from ..hooks import observe_call, current_event, response_received
+from ..tracing import trace_call, stage, stage_since, set_attributes, \
+    trace_response, is_tracing, propagate
+from ..keypool import KeyPool, is_throttled, mask_key
+from .transport import AiohttpTransport
+
+# The data frame a call formatted as pandas wants, when it may be built along
+# with the decoding of the response in the parse executor
+_framing = ContextVar('alpha_vantage_framing', default=None)
+# The data frame and meta data of a response decoded in the parse executor
+_Framed = namedtuple('_Framed', ['data', 'meta_data'])
+
+
+def _data_frame(data, data_key, indexing_type):
+    """ Convert the data of a response into a data frame (a module function,
+    so that it can be sent to a process pool)
+
+    Keyword Arguments:
+        data: The data of the response
+        data_key: The key of the data in the response
+        indexing_type: Either 'date' or 'integer'
+    """
+    if isinstance(data, list):
+        # If the call returns a list, then we will append them
+        # in the resulting data frame. If in the future
+        # alphavantage decides to do more with returning arrays
+        # this might become buggy. For now will do the trick.
+        if not data:
+            data_pandas = pandas.DataFrame()
+        else:
+            data_array = []
+            for val in data:
+                data_array.append([v for _, v in val.items()])
+            data_pandas = pandas.DataFrame(data_array, columns=[
+                k for k, _ in data[0].items()])
+    else:
+        try:
+            data_pandas = pandas.DataFrame.from_dict(data, orient='index',
+                                                     dtype='float')
+        # This is for Global quotes or any other new Alpha Vantage
+        # data that is added.
+        # It will have to be updated so that we can get exactly
+        # The dataframes we want moving forward
+        except ValueError:
+            data = {data_key: data}
+            return pandas.DataFrame.from_dict(data, orient='index',
+                                              dtype='object')
+
+    if 'integer' in indexing_type:
+        # Set Date as an actual column so a new numerical index
+        # will be created, but only when specified by the user.
+        data_pandas.reset_index(level=0, inplace=True)
+        data_pandas.index.name = 'index'
+    else:
+        data_pandas.index.name = 'date'
+        # convert to pandas._libs.tslibs.timestamps.Timestamp
+        data_pandas.index = pandas.to_datetime(data_pandas.index)
+    return data_pandas
+
+
+def _decode_frame(body, treat_info_as_error, data_key, meta_data_key,
+                  indexing_type):
+    """ Decode the body of a json response and convert its data into a data
+    frame in one step, so that only the frame comes back from a process pool
+
+    Keyword Arguments:
+        body: The body of the response
+        treat_info_as_error: Treat the information and note messages as
+            errors
+        data_key: The key of the data in the response
+        meta_data_key: The key of the meta data in the response, or None
+        indexing_type: Either 'date' or 'integer'
+    """
+    json_response = _decode_json(body, treat_info_as_error)
+    meta_data = json_response[meta_data_key] \
+        if meta_data_key is not None else None
+    return _Framed(_data_frame(json_response[data_key], data_key,
+                               indexing_type), meta_data)
 
 
 class AlphaVantage(AlphaVantageBase):
@@ -18,10 +101,61 @@ class AlphaVantage(AlphaVantageBase):
     the other classes of this python wrapper will inherit from.
     """
 
-    def __init__(self, *args, proxy=None, **kwargs):
-        super(AlphaVantage, self).__init__(*args, **kwargs)
-        self.session = None
+    # The csv responses are parsed by chunks of lines, the event loop running
+    # the other tasks in between, so that a slice of extended intraday does
+    # not stall it
+    _CSV_CHUNK_LINES = 2048
+
+    def __init__(self, *args, proxy=None, transport=None,
+                 parse_executor=None, parse_bytes=1 << 17, parse_rows=1000,
+                 **kwargs):
+        """ Initialize the class, see the keyword arguments of the sync
+        client for the others
+
+        Keyword Arguments:
+            proxy: String URL of the proxy.
+            transport: The object sending the calls, default an
+            AiohttpTransport.
+            parse_executor: Where the large responses are decoded and
+            converted to data frames instead of the event loop: 'thread' or
+            'process' to create a pool (shut down by close()), or any
+            concurrent.futures executor. None (default) parses them inline.
+            The json decoding holds the GIL, so a thread pool only shortens
+            the pauses of the loop, a process pool removes them: when the
+            response is wanted as a data frame, without cache nor store,
+            the frame is built in the same step and only it is copied back.
+            parse_bytes: The size of the json bodies from which they are
+            decoded in the executor (default 128 kB)
+            parse_rows: The number of entries of the data from which the
+            data frames are built in the executor (default 1000)
+        """
+        super(AlphaVantage, self).__init__(
+            *args, transport=transport if transport is not None
+            else AiohttpTransport(), **kwargs)
         self.proxy = proxy or ''
+        self._owns_executor = isinstance(parse_executor, str)
+        if parse_executor == 'thread':
+            parse_executor = ThreadPoolExecutor()
+        elif parse_executor == 'process':
+            parse_executor = ProcessPoolExecutor()
+        elif self._owns_executor:
+            raise ValueError("Parse executor: {} not recognized, only "
+                             "'thread' and 'process' are supported".format(
+                                 parse_executor))
+        self.parse_executor = parse_executor
+        self.parse_bytes = parse_bytes
+        self.parse_rows = parse_rows
+
+    @property
+    def session(self):
+        """ The aiohttp session of the transport, None until the first call
+        or when the transport has none
+        """
+        return getattr(self.transport, 'session', None)
+
+    @session.setter
+    def session(self, session):
+        self.transport.session = session
 
     @classmethod
     def _call_api_on_func(cls, func):
@@ -54,6 +188,10 @@ class AlphaVantage(AlphaVantageBase):
 
         @wraps(func)
         async def _call_wrapper(self, *args, **kwargs):
+            # Options of the call itself that are not sent to the api
+            build_start = time.time_ns()
+            call_options = {k: kwargs.pop(k) for k in list(kwargs)
+                            if k in AlphaVantage._CALL_OPTIONS}
             used_kwargs = kwargs.copy()
             # Get the used positional arguments given to the function
             used_kwargs.update(zip(argspec.args[positional_count:],
@@ -67,13 +205,26 @@ class AlphaVantage(AlphaVantageBase):
             # key for it and for its meta data.
             function_name, data_key, meta_data_key = func(
                 self, *args, **kwargs)
-            base_url = AlphaVantage._RAPIDAPI_URL if self.rapidapi else AlphaVantage._ALPHA_VANTAGE_API_URL
-            url = "{}function={}".format(base_url, function_name)
+            url = "{}function={}".format(self.base_url, function_name)
+            call_params = {}
             for idx, arg_name in enumerate(argspec.args[1:]):
                 try:
-                    arg_value = args[idx]
+                    call_params[arg_name] = args[idx]
                 except IndexError:
-                    arg_value = used_kwargs[arg_name]
+                    call_params[arg_name] = used_kwargs[arg_name]
+            event = current_event()
+            if event is not None:
+                event.function = function_name
+                event.tag = call_options.get('tag')
+                event.symbol = self._call_symbol(call_params)
+            if is_tracing():
+                set_attributes(function=function_name,
+                               symbol=self._call_symbol(call_params))
+            auto = call_params.get('outputsize') == 'auto'
+            if auto:
+                call_params['outputsize'] = self._resolve_outputsize(
+                    function_name, call_params, call_options.get('start'))
+            for arg_name, arg_value in call_params.items():
                 if 'matype' in arg_name and arg_value:
                     # If the argument name has matype, we gotta map the string
                     # or the integer
@@ -97,15 +248,56 @@ class AlphaVantage(AlphaVantageBase):
                 raise ValueError("Output format: {} not recognized, only json,"
                                  "pandas and csv are supported".format(
                                      self.output_format.lower()))
-            apikey_parameter = "" if self.rapidapi else "&apikey={}".format(
-                self.key)
-            if self._append_type:
-                url = '{}{}&datatype={}'.format(url, apikey_parameter, oformat)
+            if event is not None:
+                event.lap('url_build')
+            stage_since('url_build', build_start)
+            framing = _framing.get()
+            if framing is not None and data_key is not None and \
+                    self.cache is None and self.store is None:
+                # No cache nor store needs the decoded response, the keys
+                # are set for this call only
+                framing = _framing.set(dict(framing, data_key=data_key,
+                                            meta_data_key=meta_data_key))
             else:
-                url = '{}{}'.format(url, apikey_parameter)
-            return await self._handle_api_call(url), data_key, meta_data_key
+                framing = None
+            try:
+                call_response = await self._request(url, oformat,
+                                                    call_options)
+            finally:
+                if framing is not None:
+                    _framing.reset(framing)
+            if self.cache is not None and 'outputsize' in call_params \
+                    and isinstance(call_response, dict):
+                cache_key = SeriesCache.make_key(function_name, call_params)
+                if event is not None:
+                    event.cache = 'miss' if self.cache.coverage(
+                        cache_key) is None else 'partial'
+                call_response = self.cache.update(
+                    cache_key, call_response, data_key,
+                    call_params['outputsize'], merge=auto)
+            if self.store is not None and isinstance(call_response, dict):
+                self.store.save(function_name, call_params, call_response,
+                                data_key)
+            response_received(event)
+            trace_response()
+            return call_response, data_key, meta_data_key
         return _call_wrapper
 
+    @staticmethod
+    def _observed(func):
+        """
+        Decorator giving the events of the calls to the hooks of the client
+        and opening their spans when the client has a tracer
+        """
+        @wraps(func)
+        async def _observed_wrapper(self, *args, **kwargs):
+            if not self.hooks and self.tracer is None:
+                return await func(self, *args, **kwargs)
+            with observe_call(self.hooks), \
+                    trace_call(self.tracer, func.__name__):
+                return await func(self, *args, **kwargs)
+        return _observed_wrapper
+
     @classmethod
     def _output_format_sector(cls, func, override=None):
         """ Decorator in charge of giving the output its right format, either
@@ -121,34 +313,19 @@ class AlphaVantage(AlphaVantageBase):
         async def _format_wrapper(self, *args, **kwargs):
             json_response, data_key, meta_data_key = await func(
                 self, *args, **kwargs)
-            if isinstance(data_key, list):
-                # Replace the strings into percentage
-                data = {key: {k: self.percentage_to_float(v)
-                              for k, v in json_response[key].items()} for key in data_key}
-            else:
-                data = json_response[data_key]
-            # TODO: Fix orientation in a better way
-            meta_data = json_response[meta_data_key]
             # Allow to override the output parameter in the call
             if override is None:
                 output_format = self.output_format.lower()
             elif 'json' or 'pandas' in override.lower():
                 output_format = override.lower()
             # Choose output format
-            if output_format == 'json':
-                return data, meta_data
-            elif output_format == 'pandas':
-                data_pandas = pandas.DataFrame.from_dict(data,
-                                                         orient='columns')
-                # Rename columns to have a nicer name
-                col_names = [re.sub(r'\d+.', '', name).strip(' ')
-                             for name in list(data_pandas)]
-                data_pandas.columns = col_names
-                return data_pandas, meta_data
-            else:
+            if output_format not in ('json', 'pandas'):
                 raise ValueError('Format: {} is not supported'.format(
                     self.output_format))
-        return _format_wrapper
+            # Replace the strings into percentage, once per snapshot
+            return self.sector_parser.parse(json_response, data_key,
+                                            meta_data_key, output_format)
+        return cls._observed(_format_wrapper)
 
     @classmethod
     def _output_format(cls, func, override=None):
@@ -161,8 +338,20 @@ class AlphaVantage(AlphaVantageBase):
         """
         @wraps(func)
         async def _format_wrapper(self, *args, **kwargs):
-            call_response, data_key, meta_data_key = await func(
-                self, *args, **kwargs)
+            framing = None
+            if self.parse_executor is not None and \
+                    self.output_format.lower() == 'pandas' and \
+                    (override is None or override.lower() == 'pandas'):
+                # A large response is turned into its data frame right away
+                framing = _framing.set({'indexing_type': self.indexing_type})
+            try:
+                call_response, data_key, meta_data_key = await func(
+                    self, *args, **kwargs)
+            finally:
+                if framing is not None:
+                    _framing.reset(framing)
+            if isinstance(call_response, _Framed):
+                return call_response.data, call_response.meta_data
             if 'json' in self.output_format.lower() or 'pandas' \
                     in self.output_format.lower():
                 data = call_response[data_key]
@@ -180,49 +369,16 @@ class AlphaVantage(AlphaVantageBase):
                 if output_format == 'json':
                     return data, meta_data
                 elif output_format == 'pandas':
-                    if isinstance(data, list):
-                        # If the call returns a list, then we will append them
-                        # in the resulting data frame. If in the future
-                        # alphavantage decides to do more with returning arrays
-                        # this might become buggy. For now will do the trick.
-                        data_array = []
-                        for val in data:
-                            data_array.append([v for _, v in val.items()])
-                        data_pandas = pandas.DataFrame(data_array, columns=[
-                            k for k, _ in data[0].items()])
-                    else:
-                        try:
-                            data_pandas = pandas.DataFrame.from_dict(data,
-                                                                     orient='index',
-                                                                     dtype='float')
-                        # This is for Global quotes or any other new Alpha Vantage
-                        # data that is added.
-                        # It will have to be updated so that we can get exactly
-                        # The dataframes we want moving forward
-                        except ValueError:
-                            data = {data_key: data}
-                            data_pandas = pandas.DataFrame.from_dict(data,
-                                                                     orient='index',
-                                                                     dtype='object')
-                            return data_pandas, meta_data
-
-                    if 'integer' in self.indexing_type:
-                        # Set Date as an actual column so a new numerical index
-                        # will be created, but only when specified by the user.
-                        data_pandas.reset_index(level=0, inplace=True)
-                        data_pandas.index.name = 'index'
-                    else:
-                        data_pandas.index.name = 'date'
-                        # convert to pandas._libs.tslibs.timestamps.Timestamp
-                        data_pandas.index = pandas.to_datetime(
-                            data_pandas.index)
+                    data_pandas = await self._parse(
+                        len(data) >= self.parse_rows, _data_frame, data,
+                        data_key, self.indexing_type)
                     return data_pandas, meta_data
             elif 'csv' in self.output_format.lower():
                 return call_response, None
             else:
                 raise ValueError('Format: {} is not supported'.format(
                     self.output_format))
-        return _format_wrapper
+        return cls._observed(_format_wrapper)
 
     def set_proxy(self, proxy=None):
         """
@@ -233,40 +389,183 @@ class AlphaVantage(AlphaVantageBase):
         """
         self.proxy = proxy or ''
 
-    async def _handle_api_call(self, url):
+    async def _gather(self, calls, workers, then):
+        """
+        Make a batch of api calls concurrently and return then(results), the
+        results being in the order of the calls. A call failing with a
+        ValueError gives its error as its result.
+
+        Keyword Arguments:
+            calls: The calls, callables without argument returning awaitables
+            workers: The number of calls made at the same time
+            then: The callable building the result of the batch
+        """
+        semaphore = asyncio.Semaphore(workers)
+
+        async def _call(call):
+            async with semaphore:
+                try:
+                    return await call()
+                except ValueError as error:
+                    return error
+        return then(await asyncio.gather(*(_call(call) for call in calls)))
+
+    async def _request(self, url, oformat, call_options):
+        """
+        Send an api call and return its response. The key is taken from the
+        pool when the client has one, calls throttled on a key of the pool
+        are retried with another key. The call waits for the scheduler of
+        the client when there is one.
+
+        Keyword Arguments:
+            url: The url of the call, without key nor datatype
+            oformat: The datatype asked to the api
+            call_options: Dictionary with the options of the call
+        """
+        pool = self.key if isinstance(self.key, KeyPool) else None
+        attempts = len(pool) if pool is not None else 1
+        event = current_event()
+        for attempt in range(attempts):
+            waiting = time.perf_counter()
+            waiting_start = time.time_ns()
+            key = self.key
+            while pool is not None:
+                key, wait = pool.try_checkout()
+                if key is not None:
+                    break
+                await asyncio.sleep(wait)
+            key_url, headers = self._authorize(url, key, oformat)
+            if self.scheduler is not None:
+                await self.scheduler.acquire(
+                    priority=call_options.get('priority', 0),
+                    deadline=call_options.get('deadline'))
+            if pool is not None or self.scheduler is not None:
+                stage_since('queue_wait', waiting_start)
+            if event is not None:
+                event.key = mask_key(key)
+                event.retries = attempt
+                event.queue_wait += time.perf_counter() - waiting
+                event.lap('queue_wait')
+            try:
+                call_response = await self._handle_api_call(key_url,
+                                                            headers=headers)
+            except ValueError as error:
+                if event is not None and is_throttled(error):
+                    event.throttled += 1
+                if pool is None:
+                    raise
+                if not is_throttled(error):
+                    pool.report(key)
+                    raise
+                pool.report(key, error)
+                if attempt == attempts - 1:
+                    raise
+                continue
+            except Exception as error:
+                if pool is not None:
+                    pool.report(key, error)
+                raise
+            message = self._throttle_message(call_response)
+            if message and event is not None:
+                event.throttled += 1
+            if pool is not None:
+                pool.report(key, ValueError(message) if message else None)
+                if message and attempt < attempts - 1:
+                    continue
+            return call_response
+
+    async def _handle_api_call(self, url, headers=None):
         """
         Handle the return call from the  api and return a data and meta_data
         object. It raises a ValueError on problems
 
         Keyword Arguments:
             url:  The url of the service
+            headers:  The headers of the call, default the client headers
         """
-        if not self.session:
-            self.session = aiohttp.ClientSession()
-        response = await self.session.get(url, proxy=self.proxy, headers=self.headers)
-        if 'json' in self.output_format.lower() or 'pandas' in \
-                self.output_format.lower():
-            json_response = await response.json()
-            if not json_response:
-                raise ValueError(
-                    'Error getting data from the api, no return was given.')
-            elif "Error Message" in json_response:
-                raise ValueError(json_response["Error Message"])
-            elif "Information" in json_response and self.treat_info_as_error:
-                raise ValueError(json_response["Information"])
-            elif "Note" in json_response and self.treat_info_as_error:
-                raise ValueError(json_response["Note"])
-            return json_response
-        else:
-            csv_response = csv.reader(response.text.splitlines())
-            if not csv_response:
-                raise ValueError(
-                    'Error getting data from the api, no return was given.')
-            return csv_response
+        with stage('http'):
+            response = await self.transport.send(
+                url, headers=self.headers if headers is None else headers,
+                proxy=self.proxy)
+        set_attributes(bytes=len(response.body), status=response.status)
+        event = current_event()
+        if event is not None:
+            event.lap('http')
+            self._record_response(event, response)
+        decoding = time.perf_counter()
+        try:
+            with stage('decode'):
+                if 'csv' in self.output_format.lower():
+                    return await self._decode_csv(response.body)
+                offload = len(response.body) >= self.parse_bytes
+                framing = _framing.get()
+                if offload and framing is not None and 'data_key' in framing:
+                    return await self._parse(
+                        offload, _decode_frame, response.body,
+                        self.treat_info_as_error, framing['data_key'],
+                        framing['meta_data_key'], framing['indexing_type'])
+                return await self._parse(offload, _decode_json, response.body,
+                                         self.treat_info_as_error)
+        finally:
+            if event is not None:
+                event.decode += time.perf_counter() - decoding
+                event.lap('decode')
+
+    async def _parse(self, offload, func, *args):
+        """
+        Run a parsing step, in the parse executor when there is one and the
+        payload is large enough, inline otherwise
+
+        Keyword Arguments:
+            offload: Whether the payload is large enough to be offloaded
+            func: The parsing function, a module function
+            args: The arguments of the function
+        """
+        if self.parse_executor is None or not offload:
+            return func(*args)
+        if not isinstance(self.parse_executor, ProcessPoolExecutor):
+            # The spans opened in a thread are children of the call
+            func = propagate(func)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.parse_executor, partial(func, *args))
+
+    async def _decode_csv(self, body):
+        """
+        Parse the body of a csv response and return an iterator over its
+        rows. It raises a ValueError on problems. The rows are parsed at
+        once, by chunks of lines yielding to the event loop, instead of
+        lazily while they are iterated.
+
+        Keyword Arguments:
+            body: The body of the response
+        """
+        if body.lstrip().startswith(b'{'):
+            # The errors are given in json whatever the datatype asked
+            message = json.loads(body)
+            raise ValueError(message.get('Error Message') or
+                             message.get('Information') or
+                             message.get('Note') or
+                             'Error getting data from the api')
+        lines = body.decode('utf-8').splitlines()
+        if not lines:
+            raise ValueError(
+                'Error getting data from the api, no return was given.')
+        rows = []
+        for start in range(0, len(lines), self._CSV_CHUNK_LINES):
+            if start:
+                await asyncio.sleep(0)
+            rows.extend(csv.reader(
+                lines[start:start + self._CSV_CHUNK_LINES]))
+        return iter(rows)
 
     async def close(self):
         """
-        Close the underlying aiohttp session
+        Close the underlying transport (and its aiohttp session), and the
+        parse executor when it was created here
         """
-        if self.session and not self.session.closed:
-            await self.session.close()
+        close = getattr(self.transport, 'close', None)
+        if close is not None:
+            await close()
+        if self._owns_executor and self.parse_executor is not None:
+            self.parse_executor.shutdown(wait=False)
+            self.parse_executor = None
@@ -0,0 +1,3 @@
+from ..cache import FundamentalsCache, SeriesCache, choose_outputsize
+
+__all__ = ['FundamentalsCache', 'SeriesCache', 'choose_outputsize']
@@ -0,0 +1 @@
+../fundamentaldata.py
\ No newline at end of file
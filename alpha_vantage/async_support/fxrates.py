@@ -0,0 +1,93 @@
+import asyncio
+from ..fxrates import spanning_pairs, parse_rate, cross_rates
+
+
+async def _fetch_legs(client, currencies, base, tag=None):
+    """ Fetch the legs of the base against the currencies concurrently and
+    return a dictionary of the legs fetched and a list of the errors
+    """
+    pairs = spanning_pairs(currencies, base)
+    options = {'tag': tag} if tag is not None else {}
+    results = await asyncio.gather(
+        *(client.get_currency_exchange_rate(from_currency=b, to_currency=c,
+                                            **options) for b, c in pairs),
+        return_exceptions=True)
+    legs, errors = {}, []
+    for (_, currency), result in zip(pairs, results):
+        if isinstance(result, Exception):
+            errors.append((currency, result))
+        else:
+            legs[currency] = parse_rate(result[0])
+    return legs, errors
+
+
+async def fetch_rate_matrix(client, currencies, base='USD'):
+    """
+    Fetch the legs of the base against the currencies (one call per
+    currency, concurrently) and return the RateMatrix of every cross rate
+
+    Keyword Arguments:
+        client: The async ForeignExchange used for the calls
+        currencies: The currency codes
+        base: The base currency (default 'USD')
+    """
+    legs, errors = await _fetch_legs(client, currencies, base)
+    if errors:
+        raise errors[0][1]
+    return cross_rates(base, legs, currencies)
+
+
+class RateFeed(object):
+    """
+    Feed of the matrix of the exchange rates between a set of currencies.
+    Each cycle polls only the rates of the base against the other currencies
+    (n - 1 calls instead of n * (n - 1) for the directed pairs) and derives
+    every cross rate from them, so that the matrix is consistent. A leg that
+    fails keeps its previous rate, its refresh time telling how old it is.
+
+        feed = RateFeed(fx, ['EUR', 'JPY', 'GBP', 'CHF'], interval=60)
+        async for matrix in feed:
+            print(matrix.rate('EUR', 'JPY'), matrix.path('EUR', 'JPY'))
+    """
+
+    def __init__(self, client, currencies, base='USD', interval=60.,
+                 tag='rate_feed'):
+        """
+        Initialize the feed
+
+        Keyword Arguments:
+            client: The async ForeignExchange polled
+            currencies: The currency codes of the matrix
+            base: The currency every leg is quoted against (default 'USD')
+            interval: The seconds between two cycles (default 60)
+            tag: The tag of the calls, for the usage accounting
+        """
+        self.client = client
+        self.currencies = list(currencies)
+        self.base = base.upper()
+        self.interval = interval
+        self.tag = tag
+        self.legs = {}
+        self.stats = {'cycles': 0, 'calls': 0, 'errors': 0}
+        self._next = None
+
+    async def poll(self):
+        """ Poll the legs once and return the RateMatrix
+        """
+        legs, errors = await _fetch_legs(self.client, self.currencies,
+                                         self.base, tag=self.tag)
+        self.legs.update(legs)
+        self.stats['cycles'] += 1
+        self.stats['calls'] += len(legs) + len(errors)
+        self.stats['errors'] += len(errors)
+        return cross_rates(self.base, self.legs, self.currencies)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        if self._next is not None:
+            await asyncio.sleep(max(0., self._next - loop.time()))
+        self._next = loop.time() + self.interval
+        return await self.poll()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+from aiohttp import web
+import argparse
+import asyncio
+from collections import OrderedDict
+import json
+import time
+from urllib.parse import urlencode
+from ..alphavantage import AlphaVantage
+from ..keypool import KeyPool
+from .scheduler import RequestScheduler
+from .transport import AiohttpTransport
+
+
+class CachingProxy(object):
+    """
+    Local http service speaking the /query?function=... interface of the
+    alpha vantage api, meant to be shared by many worker processes pointing
+    their clients to it (base_url='http://localhost:8080/query'). It owns
+    the cache of the responses, the de-duplication of identical calls in
+    flight (only one of them reaches the api) and the rate limiting of the
+    key. The X-Cache header of the responses tells whether they came from
+    the cache (HIT), from an identical call in flight (COALESCED) or from the
+    api (MISS).
+    """
+
+    def __init__(self, key=None, upstream_url=None, ttl=60., max_entries=10000,
+                 scheduler=None, rapidapi=False, transport=None):
+        """
+        Initialize the proxy
+
+        Keyword Arguments:
+            key: Alpha Vantage api key or KeyPool used for the calls to the
+                api, None to forward the key given by each client
+            upstream_url: The url of the api, default the alpha vantage api
+                or the RapidAPI endpoint when rapidapi is True
+            ttl: Seconds a response is served from the cache (default 60)
+            max_entries: Maximum number of responses kept in the cache, the
+                least recently used go first (default 10000)
+            scheduler: A RequestScheduler rate limiting the calls to the
+                api, None to call it as fast as the clients ask
+            rapidapi: Boolean describing whether or not the key is through
+                the RapidAPI platform or not
+            transport: The async transport used for the calls to the api,
+                default an AiohttpTransport
+        """
+        if upstream_url is None:
+            upstream_url = AlphaVantage._RAPIDAPI_URL if rapidapi \
+                else AlphaVantage._ALPHA_VANTAGE_API_URL
+        self.upstream_url = AlphaVantage._query_url(upstream_url)
+        self.key = key
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.scheduler = scheduler
+        self.rapidapi = rapidapi
+        self.transport = transport if transport is not None \
+            else AiohttpTransport()
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+
+    @staticmethod
+    def _cache_key(query):
+        """
+        Key of a call in the cache, the key of the client is left out so
+        that the clients share the responses
+        """
+        return tuple(sorted((k, v) for k, v in query.items()
+                            if k != 'apikey'))
+
+    async def _fetch(self, query, client_headers):
+        """
+        Call the api and return (status, content type, body)
+        """
+        params = dict(query)
+        headers = {}
+        key = self.key
+        while isinstance(key, KeyPool):
+            pool_key, wait = self.key.try_checkout()
+            if pool_key is not None:
+                key = pool_key
+                break
+            await asyncio.sleep(wait)
+        if self.rapidapi:
+            headers['x-rapidapi-host'] = 'alpha-vantage.p.rapidapi.com'
+            headers['x-rapidapi-key'] = key or client_headers.get(
+                'x-rapidapi-key', '')
+            params.pop('apikey', None)
+        elif key is not None:
+            params['apikey'] = key
+        if self.scheduler is not None:
+            await self.scheduler.acquire()
+        url = '{}{}'.format(self.upstream_url, urlencode(params))
+        pool = self.key if isinstance(self.key, KeyPool) else None
+        try:
+            response = await self.transport.send(url, headers=headers)
+        except Exception as error:
+            if pool is not None:
+                pool.report(key, error)
+            raise
+        content_type = response.headers.get(
+            'Content-Type', 'application/json').split(';')[0].strip()
+        if pool is not None:
+            # Throttled keys cool down before the pool gives them again
+            message = self._throttle_message(response.body)
+            pool.report(key, ValueError(message) if message else None)
+        return response.status, content_type, response.body
+
+    @staticmethod
+    def _throttle_message(body):
+        """
+        The message of a response telling that the key was throttled, None
+        for the other responses
+        """
+        if not body.lstrip().startswith(b'{'):
+            return None
+        try:
+            decoded = json.loads(body)
+        except ValueError:
+            return None
+        return AlphaVantage._throttle_message(decoded)
+
+    @staticmethod
+    def _cacheable(status, content_type, body):
+        """
+        Errors and throttle messages of the api are not cached
+        """
+        if status != 200:
+            return False
+        if 'json' not in content_type and not body.lstrip().startswith(b'{'):
+            return True
+        try:
+            decoded = json.loads(body)
+        except ValueError:
+            return False
+        return bool(decoded) and not any(
+            k in decoded for k in ('Error Message', 'Information', 'Note'))
+
+    async def handle_query(self, request):
+        """
+        Answer a /query call from the cache, from a call in flight or from
+        the api
+        """
+        key = self._cache_key(request.query)
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return web.Response(body=entry[2], content_type=entry[1],
+                                headers={'X-Cache': 'HIT'})
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats['coalesced'] += 1
+            status, content_type, body = await asyncio.shield(future)
+            return web.Response(status=status, body=body,
+                                content_type=content_type,
+                                headers={'X-Cache': 'COALESCED'})
+        self.stats['misses'] += 1
+        # The call to the api is a task of its own, shared with the
+        # coalesced calls, so that it survives the cancellation of the
+        # call that started it
+        future = asyncio.ensure_future(
+            self._fetch_shared(key, request.query, request.headers))
+        self._inflight[key] = future
+        status, content_type, body = await asyncio.shield(future)
+        return web.Response(status=status, body=body,
+                            content_type=content_type,
+                            headers={'X-Cache': 'MISS'})
+
+    async def _fetch_shared(self, key, query, client_headers):
+        """
+        Call the api for the calls in flight with the given cache key and
+        cache the response
+        """
+        try:
+            result = await self._fetch(query, client_headers)
+        except Exception as error:
+            self.stats['errors'] += 1
+            result = (502, 'application/json', json.dumps(
+                {'Error Message': 'Proxy error: {}'.format(error)}).encode())
+        finally:
+            self._inflight.pop(key, None)
+        status, content_type, body = result
+        if self._cacheable(status, content_type, body):
+            self._cache[key] = (time.monotonic() + self.ttl, content_type,
+                                body)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    async def handle_stats(self, request):
+        """
+        Return the counters of the proxy
+        """
+        return web.json_response(dict(self.stats, entries=len(self._cache)))
+
+    async def close(self, app=None):
+        """
+        Close the underlying transport
+        """
+        await self.transport.close()
+
+    def make_app(self):
+        """
+        Return the aiohttp application serving the proxy
+        """
+        app = web.Application()
+        app.router.add_get('/query', self.handle_query)
+        app.router.add_get('/stats', self.handle_stats)
+        app.on_cleanup.append(self.close)
+        return app
+
+    def run(self, host='127.0.0.1', port=8080):
+        """
+        Serve the proxy until interrupted
+
+        Keyword Arguments:
+            host: The interface to listen on (default 127.0.0.1)
+            port: The port to listen on (default 8080)
+        """
+        web.run_app(self.make_app(), host=host, port=port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Local caching proxy for the Alpha Vantage api')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--key', action='append',
+                        help='api key used for the calls, repeat it to use '
+                             'a pool of keys (default the key of the clients)')
+    parser.add_argument('--ttl', type=float, default=60.)
+    parser.add_argument('--calls-per-minute', type=int, default=None)
+    parser.add_argument('--upstream-url', default=None)
+    parser.add_argument('--rapidapi', action='store_true')
+    args = parser.parse_args(argv)
+    key = None
+    if args.key:
+        key = args.key[0] if len(args.key) == 1 else KeyPool(args.key)
+    scheduler = None
+    if args.calls_per_minute:
+        scheduler = RequestScheduler(calls_per_minute=args.calls_per_minute)
+    CachingProxy(key=key, upstream_url=args.upstream_url, ttl=args.ttl,
+                 scheduler=scheduler, rapidapi=args.rapidapi).run(
+        host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
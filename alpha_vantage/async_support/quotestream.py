@@ -0,0 +1,265 @@
+import asyncio
+from collections import namedtuple, OrderedDict
+import math
+import time
+
+Quote = namedtuple('Quote', ['symbol', 'price', 'change', 'change_percent',
+                             'volume', 'day', 'received'])
+Quote.__doc__ = """ Compact record of a global quote: the symbol, the price,
+the change and change percent from the previous close, the volume, the
+latest trading day (string) and the time it was received (epoch seconds) """
+
+
+def parse_quote(data, received=None):
+    """ Return the Quote of the data of a get_quote_endpoint call
+
+    Keyword Arguments:
+        data: The dictionary (or one row data frame) of the call
+        received: The time the quote was received, default now
+    """
+    if hasattr(data, 'iloc'):
+        data = data.iloc[0].to_dict()
+
+    def _number(name):
+        value = data.get(name)
+        if value in (None, '', 'None'):
+            return None
+        return float(str(value).rstrip('%'))
+    volume = _number('06. volume')
+    return Quote(data.get('01. symbol'), _number('05. price'),
+                 _number('09. change'), _number('10. change percent'),
+                 None if volume is None else int(volume),
+                 data.get('07. latest trading day'),
+                 time.time() if received is None else received)
+
+
+class _SymbolState(object):
+    """ Polling state of a symbol of the stream
+    """
+    __slots__ = ('symbol', 'last', 'polled', 'activity')
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.last = None
+        self.polled = None
+        self.activity = 0.
+
+
+class QuoteStream(object):
+    """
+    Stream of the quotes of a set of symbols, polled with
+    get_quote_endpoint of an async TimeSeries. Only the quotes that changed
+    since the previous poll of their symbol are emitted, as Quote records.
+
+    When the quota does not allow polling every symbol at each cycle, the
+    symbols are polled by score: the most active symbols (the ones whose
+    quote changed recently) first, the stale ones catching up over time.
+    A slow consumer holds the polling back (overflow='block') or only gets
+    the latest quote of each symbol (overflow='latest').
+
+        stream = QuoteStream(ts, ['MSFT', 'AAPL'], interval=60,
+                             calls_per_minute=75)
+        async for quote in stream:
+            print(quote.symbol, quote.price)
+    """
+
+    def __init__(self, client, symbols, interval=60., calls_per_minute=None,
+                 max_pending=100, overflow='block', activity_decay=.5,
+                 priority=0, tag='quote_stream'):
+        """
+        Initialize the stream
+
+        Keyword Arguments:
+            client: The async TimeSeries polled
+            symbols: The symbols of the stream
+            interval: The seconds between two polling cycles (default 60)
+            calls_per_minute: The calls per minute the stream may use, None
+                to poll every symbol at each cycle (default None)
+            max_pending: The quotes held for the consumer before the
+                overflow policy applies (default 100)
+            overflow: 'block' to pause the polling until the consumer
+                catches up, 'latest' to keep only the latest quote of each
+                symbol (default 'block')
+            activity_decay: Weight of the past in the activity of a symbol,
+                between 0 and 1 (default 0.5)
+            priority: The base priority of the calls, for the scheduler of
+                the client. The most active symbols go up to priority + 10
+            tag: The tag of the calls, for the usage accounting
+        """
+        if overflow not in ('block', 'latest'):
+            raise ValueError('Overflow policy: {} is not supported, only '
+                             'block and latest are'.format(overflow))
+        self.client = client
+        self.interval = interval
+        self.calls_per_minute = calls_per_minute
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.activity_decay = activity_decay
+        self.priority = priority
+        self.tag = tag
+        self._symbols = OrderedDict()
+        for symbol in symbols:
+            self.add(symbol)
+        self._queue = asyncio.Queue(maxsize=max_pending) \
+            if overflow == 'block' else None
+        self._latest = OrderedDict()
+        self._ready = asyncio.Event()
+        self._task = None
+        self._closed = False
+        self.stats = {'cycles': 0, 'polls': 0, 'changes': 0, 'errors': 0,
+                      'replaced': 0}
+
+    def add(self, symbol):
+        """ Add a symbol to the stream
+        """
+        self._symbols.setdefault(symbol.upper(), _SymbolState(symbol.upper()))
+
+    def discard(self, symbol):
+        """ Remove a symbol from the stream
+        """
+        self._symbols.pop(symbol.upper(), None)
+
+    @property
+    def symbols(self):
+        return list(self._symbols)
+
+    def _budget(self):
+        """ Number of symbols polled at each cycle
+        """
+        if self.calls_per_minute is None:
+            return len(self._symbols)
+        return max(1, int(self.calls_per_minute * self.interval / 60.))
+
+    def _score(self, state, now):
+        """ Polling score of a symbol, its activity plus the cycles since it
+        was polled, the symbols never polled first
+        """
+        if state.polled is None:
+            return math.inf
+        return state.activity + (now - state.polled) / self.interval
+
+    def _select(self, now):
+        states = sorted(self._symbols.values(),
+                        key=lambda s: -self._score(s, now))
+        return states[:self._budget()]
+
+    async def _poll(self, state):
+        priority = self.priority + int(round(state.activity * 10))
+        data, _ = await self.client.get_quote_endpoint(
+            state.symbol, priority=priority, tag=self.tag)
+        quote = parse_quote(data)
+        if quote.symbol is None:
+            quote = quote._replace(symbol=state.symbol)
+        return quote
+
+    def _changed(self, state, quote):
+        last = state.last
+        return last is None or last[1:-1] != quote[1:-1]
+
+    async def _emit(self, quote):
+        if self._queue is not None:
+            await self._queue.put(quote)
+            return
+        if quote.symbol in self._latest:
+            self.stats['replaced'] += 1
+            del self._latest[quote.symbol]
+        elif len(self._latest) >= self.max_pending:
+            self._latest.popitem(last=False)
+            self.stats['replaced'] += 1
+        self._latest[quote.symbol] = quote
+        self._ready.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._closed:
+            start = loop.time()
+            now = time.time()
+            batch = self._select(now)
+            results = await asyncio.gather(
+                *(self._poll(state) for state in batch),
+                return_exceptions=True)
+            self.stats['cycles'] += 1
+            for state, result in zip(batch, results):
+                state.polled = now
+                self.stats['polls'] += 1
+                if isinstance(result, Exception):
+                    self.stats['errors'] += 1
+                    continue
+                changed = self._changed(state, result)
+                state.activity = self.activity_decay * state.activity + \
+                    (1 - self.activity_decay) * changed
+                if changed:
+                    state.last = result
+                    self.stats['changes'] += 1
+                    await self._emit(result)
+            await asyncio.sleep(max(0., start + self.interval - loop.time()))
+
+    def start(self):
+        """ Start polling, done by the first iteration of the stream
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def get(self):
+        """ Return the next quote that changed, waiting for it. The error
+        that stopped the polling is raised, and ValueError once the stream
+        is closed
+        """
+        if self._closed:
+            raise ValueError('The quote stream is closed')
+        self.start()
+        task = self._task
+        while True:
+            if self._queue is None and self._latest:
+                return self._latest.popitem(last=False)[1]
+            if task.done():
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+                raise ValueError('The quote stream is closed')
+            if self._queue is not None:
+                waiter = asyncio.ensure_future(self._queue.get())
+            else:
+                self._ready.clear()
+                waiter = asyncio.ensure_future(self._ready.wait())
+            try:
+                await asyncio.wait({waiter, task},
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                if not waiter.done():
+                    waiter.cancel()
+            if self._queue is not None and waiter.done() and \
+                    not waiter.cancelled():
+                return waiter.result()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.get()
+        except ValueError:
+            if self._closed:
+                raise StopAsyncIteration
+            raise
+
+    async def close(self):
+        """ Stop polling
+        """
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                # The error that stopped the polling is raised by get()
+                pass
+            self._task = None
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
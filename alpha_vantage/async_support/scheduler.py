@@ -0,0 +1,48 @@
+import asyncio
+from ..scheduler import RequestScheduler as RequestSchedulerBase
+from ..scheduler import DeadlineExceeded
+
+__all__ = ['DeadlineExceeded', 'RequestScheduler']
+
+
+class RequestScheduler(RequestSchedulerBase):
+    """
+    Async version of the scheduler dispatching the api calls sharing a key
+    in priority order, within the rate limit of the key.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(RequestScheduler, self).__init__(*args, **kwargs)
+        # Created on first use, so that it binds to the running loop
+        self._async_condition = None
+
+    async def acquire(self, priority=0, deadline=None):
+        """
+        Wait until the call can be dispatched and return the time spent
+        waiting in seconds.
+
+        Keyword Arguments:
+            priority: The priority of the call, higher goes first (default 0)
+            deadline: Seconds the call may wait in the queue, None to wait
+                forever (default None)
+        """
+        if self._async_condition is None:
+            self._async_condition = asyncio.Condition()
+        condition = self._async_condition
+        async with condition:
+            ticket = self._enqueue(priority, deadline)
+            try:
+                while True:
+                    wait = self._try_dispatch(ticket)
+                    if wait == 0:
+                        return self._clock() - ticket.enqueued
+                    try:
+                        await asyncio.wait_for(condition.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                ticket.cancelled = True
+                raise
+            finally:
+                # Let the next call in line check whether it can go
+                condition.notify_all()
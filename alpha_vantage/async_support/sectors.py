@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from ..sectors import RANKS, SectorParser, SectorHistory, parse_refreshed, \
+    SectorRecorder as _SectorRecorder
+
+__all__ = ['RANKS', 'SectorParser', 'SectorHistory', 'SectorRecorder',
+           'parse_refreshed']
+
+_log = logging.getLogger(__name__)
+
+
+class SectorRecorder(_SectorRecorder):
+    """
+    Recorder polling the sector performances of an async SectorPerformances
+    client on a schedule and appending the new snapshots to a SectorHistory.
+    It makes one call per interval, the snapshots the api did not refresh
+    yet being ignored.
+
+        recorder = SectorRecorder(sp, SectorHistory('sectors'), interval=300)
+        recorder.start()
+        ...
+        await recorder.close()
+    """
+
+    async def poll(self):
+        """ Poll the sector performances once and return whether the
+        snapshot was new
+        """
+        data, meta_data = await self.client.get_sector()
+        return self._record(data, meta_data)
+
+    async def run(self, cycles=None):
+        """
+        Poll every interval, cycles times or until close() is called
+
+        Keyword Arguments:
+            cycles: The number of polls, default until closed
+        """
+        loop = asyncio.get_running_loop()
+        while cycles is None or cycles > 0:
+            start = loop.time()
+            try:
+                await self.poll()
+            except Exception as error:
+                # The api and network errors must not stop the recording
+                self.stats['errors'] += 1
+                _log.warning('Sector poll failed: %r', error)
+            if cycles is not None:
+                cycles -= 1
+                if cycles == 0:
+                    break
+            await asyncio.sleep(max(0., start + self.interval - loop.time()))
+
+    def start(self):
+        """ Start polling in a task
+        """
+        if self._thread is None:
+            self._thread = asyncio.ensure_future(self.run())
+        return self
+
+    async def close(self):
+        """ Stop polling
+        """
+        if self._thread is not None:
+            self._thread.cancel()
+            try:
+                await self._thread
+            except asyncio.CancelledError:
+                pass
+            self._thread = None
+
+    def stop(self):
+        raise TypeError('Use await close() to stop an async recorder')
@@ -0,0 +1,30 @@
+from ..symbols import FIELDS, SymbolIndex, SymbolSearch as _SymbolSearch
+
+__all__ = ['FIELDS', 'SymbolIndex', 'SymbolSearch']
+
+
+class SymbolSearch(_SymbolSearch):
+    """
+    Symbol search answering from a SymbolIndex and calling the
+    SYMBOL_SEARCH function of an async TimeSeries client only on a miss.
+    The matches of the calls are merged into the index.
+
+        search = SymbolSearch(ts, SymbolIndex('symbols.json'))
+        matches = await search.search('micro')
+    """
+
+    async def search(self, keywords, limit=10):
+        """ Return the best matches of keywords as a list of dictionaries
+        in the format of the SYMBOL_SEARCH function. It raises ValueError
+        when the api call fails
+
+        Keyword Arguments:
+            keywords: The keywords to search
+            limit: The maximum number of matches (default 10)
+        """
+        matches = self._hit(keywords, limit)
+        if matches is None:
+            result, _ = await self.client.get_symbol_search(keywords)
+            self.index.record(keywords, result)
+            matches = self.index.search(keywords, limit=limit)
+        return matches
@@ -0,0 +1,133 @@
+import aiohttp
+import time
+from ..transport import TransportResponse, check_status
+from ..transport import ReplayTransport as ReplayTransportBase
+from ..transport import EndpointTransport as EndpointTransportBase
+
+
+def _trace_config():
+    """
+    aiohttp trace configuration measuring the dns, connect and transfer
+    steps of the calls in the context dictionary given to each call
+    """
+    def _mark(name):
+        async def _on_event(session, context, params):
+            timings = context.trace_request_ctx
+            if timings is not None:
+                timings[name] = time.perf_counter()
+        return _on_event
+    config = aiohttp.TraceConfig()
+    config.on_dns_resolvehost_start.append(_mark('dns_start'))
+    config.on_dns_resolvehost_end.append(_mark('dns_end'))
+    config.on_connection_create_start.append(_mark('connect_start'))
+    config.on_connection_create_end.append(_mark('connect_end'))
+    config.on_request_end.append(_mark('headers'))
+    return config
+
+
+class AiohttpTransport(object):
+    """
+    Transport sending the calls with aiohttp, the default transport of the
+    async clients
+    """
+
+    def __init__(self, session=None):
+        """
+        Initialize the transport
+
+        Keyword Arguments:
+            session: An aiohttp.ClientSession used for the calls, None to
+                create one on the first call (closed by close()). The dns
+                and connect times are only measured on the sessions created
+                here.
+        """
+        self.session = session
+        self._owns_session = session is None
+
+    async def send(self, url, headers=None, proxy=None):
+        """
+        Send a call and return its TransportResponse. It raises a ValueError
+        when the http status tells the call failed
+
+        Keyword Arguments:
+            url: The url of the call
+            headers: Dictionary with the headers of the call
+            proxy: String URL of the proxy.
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                trace_configs=[_trace_config()])
+        marks = {}
+        start = time.perf_counter()
+        async with self.session.get(url, proxy=proxy or None,
+                                    headers=headers or {},
+                                    trace_request_ctx=marks) as response:
+            body = await response.read()
+        end = time.perf_counter()
+
+        def _span(first, last):
+            if first in marks and last in marks:
+                return marks[last] - marks[first]
+            return None
+        timings = {'dns': _span('dns_start', 'dns_end'),
+                   'connect': _span('connect_start', 'connect_end'),
+                   'transfer': end - marks.get('headers', start)}
+        return check_status(TransportResponse(
+            response.status, body, dict(response.headers), timings))
+
+    async def close(self):
+        """
+        Close the underlying aiohttp session when it was created here
+        """
+        if self._owns_session and self.session and not self.session.closed:
+            await self.session.close()
+
+
+class ReplayTransport(ReplayTransportBase):
+    """
+    Async transport answering the calls from responses held in memory,
+    without any network.
+    """
+
+    async def send(self, url, headers=None, proxy=None):
+        """
+        Return the TransportResponse recorded for a call. It raises a
+        ValueError (http status 404) when none was recorded
+
+        Keyword Arguments:
+            url: The url of the call
+            headers: Dictionary with the headers of the call (ignored)
+            proxy: The proxy configuration (ignored)
+        """
+        self.calls.append(url)
+        return check_status(self._lookup(url))
+
+    async def close(self):
+        pass
+
+
+class EndpointTransport(EndpointTransportBase):
+    """
+    Async transport sending the calls to another endpoint through another
+    async transport.
+    """
+
+    def __init__(self, endpoint, transport=None):
+        super(EndpointTransport, self).__init__(
+            endpoint, transport if transport is not None
+            else AiohttpTransport())
+
+    async def send(self, url, headers=None, proxy=None):
+        """
+        Send a call to the endpoint and return its TransportResponse
+
+        Keyword Arguments:
+            url: The url of the call
+            headers: Dictionary with the headers of the call
+            proxy: The proxy configuration of the client
+        """
+        return await self.transport.send(self.rewrite(url), headers=headers,
+                                         proxy=proxy)
+
+    async def close(self):
+        await self.transport.close()
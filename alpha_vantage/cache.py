@@ -0,0 +1,451 @@
+from datetime import datetime, date, timedelta
+import calendar
+from collections import OrderedDict
+import copy
+import json
+import os
+import re
+import threading
+import time
+
+
+class SeriesCache(object):
+    """ In memory cache of the time series returned by the api. Entries are
+    keyed by the api function and the parameters of the call (excluding the
+    outputsize), so that the data coming from compact and full calls of the
+    same series is merged together. The merged series is what the calls made
+    with outputsize='auto' return, the other calls get their own response.
+
+    The adjusted series (i.e. TIME_SERIES_DAILY_ADJUSTED) change in the past
+    after a split or a dividend: a response is only merged into one when the
+    bars they share are unchanged, otherwise it replaces the cached series.
+    """
+    # Number of data points returned by a 'compact' call
+    COMPACT_SIZE = 100
+
+    def __init__(self, max_entries=1000, max_age=None):
+        """ Initialize the cache
+
+        Keyword Arguments:
+            max_entries: Maximum number of series kept in the cache, the
+                least recently used go first, None for no limit (default
+                1000)
+            max_age: Seconds a series is kept after its last update, None
+                to keep it until it is evicted (default None)
+        """
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(function_name, params):
+        """ Build the key of a series from the function name and the
+        parameters given to the api call
+
+        Keyword Arguments:
+            function_name: The alpha vantage function (i.e. TIME_SERIES_DAILY)
+            params: Dictionary with the parameters of the call
+        """
+        return (function_name,) + tuple(sorted(
+            (k, str(v)) for k, v in params.items()
+            if k != 'outputsize' and v is not None))
+
+    @staticmethod
+    def adjusted(key):
+        """ Whether the series of a key is adjusted for the splits and the
+        dividends, i.e. its past values change
+
+        Keyword Arguments:
+            key: The key of the series, as given by make_key
+        """
+        return key[0].endswith('_ADJUSTED') or \
+            ('adjusted', 'true') in key[1:]
+
+    def _entry(self, key):
+        """ The entry of a series, None when it is not cached or too old.
+        Must be called with the lock held
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.max_age is not None and \
+                time.monotonic() - entry['updated'] > self.max_age:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def update(self, key, response, data_key, outputsize, merge=False):
+        """ Merge the data of a new api response into the cached series.
+        Return the response, or with merge a copy of it holding the merged
+        data.
+
+        Keyword Arguments:
+            key: The key of the series, as given by make_key
+            response: The decoded json response of the api
+            data_key: The key for getting the data from the json object
+            outputsize: The outputsize used for the call, 'compact' or 'full'
+            merge: Whether to return the merged series (default False)
+        """
+        data = response.get(data_key)
+        if not isinstance(data, dict) or not data:
+            return response
+        with self._lock:
+            entry = self._entry(key)
+            if entry is not None and self.adjusted(key):
+                # The last bar may still be moving (today's bar)
+                shared = (data.keys() & entry['data'].keys()) - \
+                    {entry['last']}
+                if not shared or any(data[k] != entry['data'][k]
+                                     for k in shared):
+                    # The past was adjusted since it was cached
+                    entry = None
+            if entry is None:
+                entry = {'data': {}, 'full': False, 'first': min(data),
+                         'last': max(data)}
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while self.max_entries is not None and \
+                        len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            entry['data'].update(data)
+            entry['full'] = entry['full'] or outputsize == 'full'
+            entry['first'] = min(entry['first'], min(data))
+            entry['last'] = max(entry['last'], max(data))
+            entry['updated'] = time.monotonic()
+            if not merge:
+                return response
+            merged = dict(response)
+            merged[data_key] = dict(sorted(entry['data'].items(),
+                                           reverse=True))
+        return merged
+
+    def get(self, key):
+        """ Return a copy of the cached data of a series or None if the series
+        has not been cached yet.
+
+        Keyword Arguments:
+            key: The key of the series, as given by make_key
+        """
+        with self._lock:
+            entry = self._entry(key)
+            return copy.deepcopy(entry['data']) if entry else None
+
+    def coverage(self, key):
+        """ Return a tuple (first, last, full) with the first and last
+        timestamps of the cached series and whether it was ever fetched with
+        a 'full' call, or None if the series has not been cached yet.
+
+        Keyword Arguments:
+            key: The key of the series, as given by make_key
+        """
+        with self._lock:
+            entry = self._entry(key)
+            if entry is None:
+                return None
+            return entry['first'], entry['last'], entry['full']
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """ Remove all the cached series
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+def quarter_after(value):
+    """ Return the end (YYYY-MM-DD) of the fiscal quarter following the one
+    ending on a date
+
+    Keyword Arguments:
+        value: The end of a fiscal quarter (YYYY-MM-DD)
+    """
+    day = to_datetime(value)
+    month = day.month + 3
+    year = day.year + (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return date(year, month, calendar.monthrange(year, month)[1]).isoformat()
+
+
+class FundamentalsCache(object):
+    """ Cache of the fundamentals of the companies (the overview and the
+    statements) which change at most once a quarter. It records the fiscal
+    date ending of the latest report of each company and serves the cached
+    data until a new report is expected, so that a daily crawl only fetches
+    the companies that reported. A new report is expected:
+
+    - when the calendar says so, i.e. the next report date of a company
+      given with expect() (from an earnings calendar);
+    - when a newer fiscal quarter is signaled with signal() or by the
+      LatestQuarter of an overview put in the cache;
+    - otherwise from report_lag days after the end of the next fiscal
+      quarter, checking again every recheck days until it comes out;
+    - in any case once the data is older than max_age days.
+
+    With a path, the cache is kept in a json file per company and survives
+    the process, i.e. between the runs of a daily job.
+    """
+
+    def __init__(self, path=None, report_lag=30, recheck=7, max_age=120):
+        """ Initialize the cache
+
+        Keyword Arguments:
+            path: The directory where the cache is kept, None to keep it in
+                memory only (default None)
+            report_lag: The days after the end of a fiscal quarter after
+                which its report is expected (default 30)
+            recheck: The days between two checks of a report expected but
+                not out yet (default 7)
+            max_age: The days after which the data is fetched again anyway
+                (default 120)
+        """
+        self.path = path
+        self.report_lag = report_lag
+        self.recheck = recheck
+        self.max_age = max_age
+        self._companies = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def _clock():
+        return time.time()
+
+    def _file(self, symbol):
+        return os.path.join(self.path, '{}.json'.format(symbol))
+
+    def _company(self, symbol):
+        """ The entry of a company, loaded from its file when there is one
+        """
+        company = self._companies.get(symbol)
+        if company is None:
+            company = {'statements': {}, 'latest': None, 'expected': None,
+                       'signaled': None}
+            if self.path is not None and os.path.exists(self._file(symbol)):
+                with open(self._file(symbol)) as f:
+                    company = json.load(f)
+            self._companies[symbol] = company
+        return company
+
+    def _save(self, symbol, company):
+        if self.path is not None:
+            temporary = self._file(symbol) + '.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(company, f)
+            os.replace(temporary, self._file(symbol))
+
+    @staticmethod
+    def _latest(statement, response):
+        """ The fiscal date ending of the latest report of a response
+        """
+        if statement == 'overview':
+            latest = response.get('LatestQuarter')
+            return latest if latest not in (None, 'None', '-') else None
+        dates = [report.get('fiscalDateEnding')
+                 for period in ('annualReports', 'quarterlyReports')
+                 for report in response.get(period) or []]
+        dates = [d for d in dates if d not in (None, 'None')]
+        return max(dates) if dates else None
+
+    def _stale(self, company, fetched, now):
+        if now - fetched > self.max_age * 86400:
+            return True
+        recheck = now - fetched >= self.recheck * 86400
+        latest = company['latest'] or company.get('quarter')
+        signaled = company.get('signaled')
+        if signaled is not None and (latest is None or signaled[0] > latest):
+            return fetched < signaled[1] or recheck
+        expected = company['expected']
+        if expected is None and latest is not None:
+            expected = (to_datetime(quarter_after(latest)) +
+                        timedelta(days=self.report_lag)).date().isoformat()
+        if expected is None:
+            return False
+        expected = calendar.timegm(to_datetime(expected).timetuple())
+        return now >= expected and (fetched < expected or recheck)
+
+    def get(self, symbol, statement, now=None):
+        """ Return the cached response of a statement of a company (a
+        decoded json response) or None when it is not cached or a newer
+        report is expected
+
+        Keyword Arguments:
+            symbol: The symbol of the company
+            statement: overview, income_statement, balance_sheet or
+                cash_flow
+            now: The current time (epoch seconds), default now
+        """
+        now = self._clock() if now is None else now
+        with self._lock:
+            company = self._company(symbol.upper())
+            entry = company['statements'].get(statement)
+            if entry is None or self._stale(company, entry['fetched'], now):
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            return copy.deepcopy(entry['response'])
+
+    def put(self, symbol, statement, response, now=None):
+        """ Cache the response of a statement of a company and record the
+        fiscal date ending of its latest report
+
+        Keyword Arguments:
+            symbol: The symbol of the company
+            statement: overview, income_statement, balance_sheet or
+                cash_flow
+            response: The decoded json response of the api
+            now: The time of the response (epoch seconds), default now
+        """
+        now = self._clock() if now is None else now
+        symbol = symbol.upper()
+        latest = self._latest(statement, response)
+        with self._lock:
+            company = self._company(symbol)
+            company['statements'][statement] = {
+                'fetched': now, 'response': copy.deepcopy(response)}
+            if statement == 'overview':
+                # The latest quarter of the overview signals the reports
+                # not cached yet
+                company['quarter'] = latest
+                if latest is not None and company['latest'] is not None \
+                        and latest > company['latest']:
+                    company['signaled'] = [latest, now]
+            elif latest is not None and (company['latest'] is None or
+                                         latest > company['latest']):
+                company['latest'] = latest
+                company['expected'] = None
+            self._save(symbol, company)
+
+    def latest(self, symbol):
+        """ Return the fiscal date ending of the latest statement cached
+        for a company, None if there is none
+        """
+        with self._lock:
+            return self._company(symbol.upper())['latest']
+
+    def signal(self, symbol, fiscal_date, now=None):
+        """ Signal the fiscal date ending of the latest report of a company
+        (i.e. the LatestQuarter of its overview), its cached data being
+        fetched again when it is newer than the cached reports
+
+        Keyword Arguments:
+            symbol: The symbol of the company
+            fiscal_date: The fiscal date ending (YYYY-MM-DD)
+            now: The time of the signal (epoch seconds), default now
+        """
+        now = self._clock() if now is None else now
+        symbol = symbol.upper()
+        with self._lock:
+            company = self._company(symbol)
+            if company['latest'] is None or fiscal_date > company['latest']:
+                company['signaled'] = [fiscal_date, now]
+                self._save(symbol, company)
+
+    def expect(self, reports):
+        """ Record the dates the next reports of companies are expected,
+        from an earnings calendar. Their cached data is fetched again from
+        that date.
+
+        Keyword Arguments:
+            reports: Dictionary mapping symbols to report dates
+                (YYYY-MM-DD), or rows with symbol and reportDate (i.e. the
+                csv.DictReader rows of the EARNINGS_CALENDAR function)
+        """
+        if isinstance(reports, dict):
+            reports = [{'symbol': s, 'reportDate': d}
+                       for s, d in reports.items()]
+        with self._lock:
+            for row in reports:
+                symbol = row['symbol'].upper()
+                company = self._company(symbol)
+                company['expected'] = str(row['reportDate'])[:10]
+                self._save(symbol, company)
+
+    def clear(self):
+        """ Remove all the cached companies, with their files
+        """
+        with self._lock:
+            if self.path is not None:
+                for name in os.listdir(self.path):
+                    if name.endswith('.json'):
+                        os.remove(os.path.join(self.path, name))
+            self._companies.clear()
+
+
+def to_datetime(value):
+    """ Convert a date string as given by the api (YYYY-MM-DD with an optional
+    HH:MM or HH:MM:SS part), a date or a datetime into a datetime.
+
+    Keyword Arguments:
+        value: The value to convert
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    value = str(value).strip()
+    if len(value) > 16:
+        return datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S')
+    if len(value) > 10:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M')
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def compact_span(function_name, interval=None):
+    """ Return the shortest time span covered by a 'compact' call of the
+    given function. Markets do not trade around the clock, so the real span
+    is usually longer, which keeps the estimation on the safe side.
+
+    Keyword Arguments:
+        function_name: The alpha vantage function (i.e. TIME_SERIES_DAILY)
+        interval: The interval of intraday calls (i.e. '5min')
+    """
+    match = re.match(r'(\d+)min', interval or '')
+    if match:
+        step = timedelta(minutes=int(match.group(1)))
+    elif 'WEEKLY' in function_name:
+        step = timedelta(weeks=1)
+    elif 'MONTHLY' in function_name:
+        step = timedelta(days=28)
+    else:
+        step = timedelta(days=1)
+    return step * SeriesCache.COMPACT_SIZE
+
+
+def choose_outputsize(function_name, interval=None, coverage=None,
+                      start=None, now=None):
+    """ Choose the cheapest outputsize ('compact' or 'full') that satisfies a
+    call, given what is already cached for the series.
+
+    Keyword Arguments:
+        function_name: The alpha vantage function (i.e. TIME_SERIES_DAILY)
+        interval: The interval of intraday calls (i.e. '5min')
+        coverage: The (first, last, full) tuple of the cached series, or None
+        start: The oldest date the caller needs, None for the whole history
+        now: The current time, defaults to datetime.now()
+    """
+    now = now or datetime.now()
+    span = compact_span(function_name, interval)
+    start = to_datetime(start) if start is not None else None
+    if coverage is None:
+        # Nothing cached, compact is enough only for recent data
+        if start is not None and now - start <= span:
+            return 'compact'
+        return 'full'
+    first, last, full = coverage
+    if now - to_datetime(last) > span:
+        # A compact call would leave a gap after the cached data
+        return 'full'
+    if full:
+        # The api has nothing older than the cached history
+        return 'compact'
+    if start is None:
+        return 'full'
+    if to_datetime(first) <= start or now - start <= span:
+        return 'compact'
+    return 'full'
@@ -1,9 +1,284 @@
+import re
+import time
+try:
+    import numpy
+    import pandas
+    _PANDAS_FOUND = True
+except ImportError:
+    _PANDAS_FOUND = False
 from .alphavantage import AlphaVantage as av
 
+_FREQUENCIES = ('daily', 'weekly', 'monthly')
+_HALVES = ('market', 'USD')
+# '1a. open (CNY)' -> ('open', 'CNY'), '5. volume' -> ('volume', None)
+_CRYPTO_LABEL = re.compile(r'^\w+\.\s*(.*?)\s*(?:\((\w+)\))?$')
+
+
+def _crypto_columns(labels, market, currencies, market_label):
+    """ The positions of the labels kept and their (currency, field)
+    columns. The fields without currency (the volume, in units of the digital
+    currency) have an empty currency, the prices without currency (as given
+    by the api for the USD market) are in the market currency
+    """
+    positions, columns = [], []
+    for position, label in enumerate(labels):
+        match = _CRYPTO_LABEL.match(label)
+        field = match.group(1).replace(' ', '_') if match else label
+        currency = match.group(2) if match else None
+        if currency is None and field != 'volume':
+            currency = market
+        if currency == market and 'market' in currencies:
+            currency = market_label
+        elif currency == 'USD' and 'USD' in currencies:
+            pass
+        elif currency is not None:
+            continue
+        column = (currency or '', field)
+        # Both halves are the same for the USD market
+        if column not in columns:
+            positions.append(position)
+            columns.append(column)
+    return positions, columns
+
+
+def parse_digital_currency(data, market, currencies=_HALVES,
+                           dtype='float64', market_label=None):
+    """ Return a compact data frame of the data of a digital currency
+    call, indexed by date, with (currency, field) columns: i.e.
+    ('CNY', 'open'), ('USD', 'close'), ('USD', 'market_cap') and
+    ('', 'volume'). Only the halves of the prices kept are parsed.
+
+    Keyword Arguments:
+        data: The data of the call, the dictionary of the json output
+            format (or the whole response) or the data frame of the pandas
+            output format
+        market: The market of the call, i.e. 'CNY'
+        currencies: The halves kept, 'market' and or 'USD' (default both)
+        dtype: The dtype of the values, 'float32' halves the memory
+            (default 'float64')
+        market_label: The name of the market currency in the columns
+            (default the market code)
+    """
+    if not _PANDAS_FOUND:
+        raise ValueError("The pandas library was not found, therefore the "
+                         "crypto parser can not be used, please install "
+                         "manually")
+    unknown = set(currencies) - set(_HALVES)
+    if unknown:
+        raise ValueError('Currencies: {} not supported, only market and USD '
+                         'are'.format(sorted(unknown)))
+    market = market.upper()
+    if isinstance(data, pandas.DataFrame):
+        labels, index = list(data.columns), data.index
+        rows = data.to_numpy()
+    else:
+        for key, value in data.items():
+            if key.startswith('Time Series'):
+                data = value
+                break
+        index = list(data)
+        labels = list(data[index[0]]) if index else []
+        rows = [list(row.values()) for row in data.values()]
+    positions, columns = _crypto_columns(labels, market, currencies,
+                                         market_label or market)
+    values = numpy.array(rows, dtype=object).reshape(len(index), len(labels))
+    frame = pandas.DataFrame(
+        values[:, positions].astype(dtype),
+        index=pandas.DatetimeIndex(pandas.to_datetime(index), name='date'),
+        columns=pandas.MultiIndex.from_tuples(columns,
+                                              names=['currency', 'field']))
+    return frame.sort_index()
+
+
+def _crypto_frame(data, market):
+    """ Data frame of the data of a digital currency call (the dictionary
+    or the data frame of the client) with a datetime index, the market code
+    of the columns being replaced by 'market' so that the frames of several
+    markets line up
+    """
+    if isinstance(data, pandas.DataFrame):
+        frame = data.astype('float')
+    else:
+        frame = pandas.DataFrame.from_dict(data, orient='index',
+                                           dtype='float')
+    frame.index = pandas.to_datetime(frame.index)
+    frame.index.name = 'date'
+    frame.columns = [c.replace('({})'.format(market), '(market)')
+                     for c in frame.columns]
+    return frame.sort_index()
+
+
+def _aggregation(column):
+    """ How a column of daily bars is aggregated into longer bars
+    """
+    if isinstance(column, tuple):
+        name = column[1]
+    else:
+        name = re.sub(r'^\w+\.\s*', '', column)
+    for prefix, how in (('open', 'first'), ('high', 'max'), ('low', 'min'),
+                        ('volume', 'sum')):
+        if name.startswith(prefix):
+            return how
+    return 'last'
+
+
+def _month_end():
+    """ The month end alias of pandas, 'M' before pandas 2.2
+    """
+    try:
+        pandas.tseries.frequencies.to_offset('ME')
+        return 'ME'
+    except ValueError:
+        return 'M'
+
+
+def _resample(daily, frequency):
+    """ Derive the weekly (ending on sunday) or monthly bars from the daily
+    bars, dated by their last day as the api does
+    """
+    if frequency == 'daily':
+        return daily
+    rule = 'W-SUN' if frequency == 'weekly' else _month_end()
+    resampler = daily.resample(rule)
+    bars = resampler.agg({c: _aggregation(c) for c in daily.columns})
+    last_days = daily.index.to_series().resample(rule).max()
+    bars.index = pandas.DatetimeIndex(last_days.values, name='date')
+    return bars[last_days.notna().values]
+
+
+class _CryptoBatch(object):
+    """ Pairs of a batch of digital currency series
+    """
+
+    def __init__(self, client, symbols, markets, frequency, derive,
+                 currencies, dtype):
+        self.client = client
+        self.frequency = frequency
+        self.derive = derive
+        # The labelled columns of the api, or the compact layout
+        self.layout = None if currencies is None and dtype is None else (
+            tuple(currencies or _HALVES), dtype or 'float64')
+        self.pairs = [(s.upper(), m.upper()) for s in symbols
+                      for m in markets]
+        self.frames = {}
+        self.meta_data = {'pairs': {}, 'errors': {}}
+        self.fetched = []
+        now = time.time()
+        for pair in self.pairs:
+            cached = client._daily_frames.get(pair + (self.layout,)) \
+                if self.daily else None
+            if cached is not None and cached[0] > now:
+                self.frames[pair] = cached[1]
+                self.meta_data['pairs'][pair] = cached[2]
+                client._report_cached('DIGITAL_CURRENCY_DAILY',
+                                      '{}/{}'.format(*pair))
+            else:
+                self.fetched.append(pair)
+
+    @property
+    def daily(self):
+        """ Whether the bars come from the daily series
+        """
+        return self.frequency == 'daily' or self.derive
+
+    def calls(self):
+        function = 'daily' if self.daily else self.frequency
+        call = getattr(self.client, 'get_digital_currency_' + function)
+        return [lambda s=s, m=m: call(symbol=s, market=m)
+                for s, m in self.fetched]
+
+    def panel(self, results):
+        """ Build the data frame of the batch from the results of the calls
+        """
+        # The daily series are refreshed at midnight UTC
+        expiry = (time.time() // 86400 + 1) * 86400
+        for pair, result in zip(self.fetched, results):
+            if isinstance(result, ValueError):
+                self.meta_data['errors'][pair] = str(result)
+                continue
+            data, meta_data = result
+            if self.layout is None:
+                self.frames[pair] = _crypto_frame(data, pair[1])
+            else:
+                self.frames[pair] = parse_digital_currency(
+                    data, pair[1], currencies=self.layout[0],
+                    dtype=self.layout[1], market_label='market')
+            self.meta_data['pairs'][pair] = meta_data
+            if self.daily:
+                self.client._daily_frames[pair + (self.layout,)] = (
+                    expiry, self.frames[pair], meta_data)
+        pairs = [p for p in self.pairs if p in self.frames]
+        if not pairs:
+            return pandas.DataFrame(index=pandas.MultiIndex.from_arrays(
+                [[], [], []], names=['symbol', 'market', 'date'])), \
+                self.meta_data
+        frames = [self.frames[p] for p in pairs]
+        if self.daily:
+            frames = [_resample(f, self.frequency) for f in frames]
+        panel = pandas.concat(frames, keys=pairs,
+                              names=['symbol', 'market', 'date'])
+        return panel, self.meta_data
+
 
 class CryptoCurrencies(av):
     """This class implements all the crypto currencies api calls
     """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Inherit AlphaVantage base class with its default arguments
+        """
+        super(CryptoCurrencies, self).__init__(*args, **kwargs)
+        # Daily series of the batches: (symbol, market, layout) -> (expiry,
+        # data frame, meta data)
+        self._daily_frames = {}
+
+    def get_digital_currency_batch(self, symbols, markets, frequency='daily',
+                                   derive=True, workers=4, currencies=None,
+                                   dtype=None):
+        """ Returns the historical time series of several digital currencies
+        on several markets as one data frame, indexed by symbol, market and
+        date. The columns of the market currency are named '(market)' instead
+        of the code of the market. The (symbol, market) pairs are fetched
+        concurrently, within the rate of the scheduler or key pool of the
+        client when it has one. It needs pandas and the json or pandas
+        output format.
+
+        Keyword Arguments:
+            symbols: The digital currencies, i.e. ['BTC', 'ETH']
+            markets: The markets, i.e. ['CNY', 'EUR']
+            frequency: 'daily', 'weekly' or 'monthly' (default 'daily')
+            derive: Derive the weekly and monthly bars from the daily series,
+                kept until they are refreshed at midnight UTC, so that the
+                three frequencies cost one call per pair. False to call the
+                weekly and monthly functions instead (default True)
+            workers: The number of calls made at the same time (default 4)
+            currencies: The halves of the prices kept, 'market' and or
+                'USD'. When given or when dtype is given, the columns are
+                compact (currency, field) pairs as given by
+                parse_digital_currency, the market currency being named
+                'market' (default None, the columns of the api)
+            dtype: The dtype of the compact columns, i.e. 'float32'
+                (default None)
+        Returns:
+            The data frame and a dictionary with the meta data of every pair
+            fetched ('pairs') and the error of every pair which failed
+            ('errors')
+        """
+        if not _PANDAS_FOUND:
+            raise ValueError("The pandas library was not found, therefore "
+                             "the crypto batch can not be used, please "
+                             "install manually")
+        if frequency not in _FREQUENCIES:
+            raise ValueError('Frequency: {} is not supported, only {} '
+                             'are'.format(frequency, ', '.join(_FREQUENCIES)))
+        if 'csv' in self.output_format.lower():
+            raise ValueError('The crypto batch needs the json or pandas '
+                             'output format')
+        batch = _CryptoBatch(self, symbols, markets, frequency, derive,
+                             currencies, dtype)
+        return self._gather(batch.calls(), workers, batch.panel)
+
     @av._output_format
     @av._call_api_on_func
     def get_digital_currency_daily(self, symbol, market):
@@ -50,7 +50,9 @@ class ForeignExchange(av):
             outputsize:  The size of the call, supported values are
                 'compact' and 'full; the first returns the last 100 points in the
                 data series, and 'full' returns the full-length intraday times
-                series, commonly above 1MB (default 'compact')
+                series, commonly above 1MB. 'auto' picks the cheapest of
+                both given the cached data and the start date of the call
+                (default 'compact')
         """
         _FUNCTION_KEY = 'FX_INTRADAY'
         return _FUNCTION_KEY, "Time Series FX ({})".format(interval), 'Meta Data'
@@ -70,7 +72,9 @@ class ForeignExchange(av):
             outputsize:  The size of the call, supported values are
                 'compact' and 'full; the first returns the last 100 points in the
                 data series, and 'full' returns the full-length daily times
-                series, commonly above 1MB (default 'compact')
+                series, commonly above 1MB. 'auto' picks the cheapest of
+                both given the cached data and the start date of the call
+                (default 'compact')
         """
         _FUNCTION_KEY = 'FX_DAILY'
         return _FUNCTION_KEY, "Time Series FX (Daily)", 'Meta Data'
@@ -90,7 +94,9 @@ class ForeignExchange(av):
             outputsize:  The size of the call, supported values are
                 'compact' and 'full; the first returns the last 100 points in the
                 data series, and 'full' returns the full-length weekly times
-                series, commonly above 1MB (default 'compact')
+                series, commonly above 1MB. 'auto' picks the cheapest of
+                both given the cached data and the start date of the call
+                (default 'compact')
         """
         _FUNCTION_KEY = 'FX_WEEKLY'
         return _FUNCTION_KEY, "Time Series FX (Weekly)", 'Meta Data'
@@ -113,7 +119,9 @@ class ForeignExchange(av):
             outputsize:  The size of the call, supported values are
                 'compact' and 'full; the first returns the last 100 points in the
                 data series, and 'full' returns the full-length monthly times
-                series, commonly above 1MB (default 'compact')
+                series, commonly above 1MB. 'auto' picks the cheapest of
+                both given the cached data and the start date of the call
+                (default 'compact')
         """
         _FUNCTION_KEY = 'FX_MONTHLY'
         return _FUNCTION_KEY, "Time Series FX (Monthly)", 'Meta Data'
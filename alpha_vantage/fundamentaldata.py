@@ -1,22 +1,273 @@
 from .alphavantage import AlphaVantage as av
+from .cache import FundamentalsCache
 
 from datetime import datetime
+try:
+    import pandas
+    _PANDAS_FOUND = True
+except ImportError:
+    _PANDAS_FOUND = False
 search_date = datetime.now().date().strftime('%Y-%m-%d')
 
+# The statements of a bundle, each one given by one api function
+STATEMENTS = ('overview', 'income_statement', 'balance_sheet', 'cash_flow')
+
+
+# The values the api gives for a missing value
+_MISSING = ('None', '-', '')
+
+
+def _is_date(name):
+    """ Whether a field of the reports or of the overview is a date
+    """
+    return name.lower().endswith(('date', 'dateending')) or \
+        name == 'LatestQuarter'
+
+
+def _typed_column(name, values):
+    """ Convert a column of strings at once: the dates to datetime64, the
+    numbers to nullable Int64 (when they are all integers) or Float64 and
+    the rest to strings, the missing values becoming NA
+    """
+    values = values.where(~values.isin(_MISSING))
+    if _is_date(name):
+        return pandas.to_datetime(values, format='%Y-%m-%d', errors='coerce')
+    try:
+        numbers = values.astype('Float64')
+    except (TypeError, ValueError):
+        # Strings of an object column with older versions of pandas
+        try:
+            numbers = pandas.to_numeric(values).astype('Float64')
+        except (TypeError, ValueError):
+            return values.astype('string')
+    present = numbers.dropna()
+    if len(present) and (present % 1 == 0).all() and \
+            present.abs().max() < 2 ** 53:
+        return numbers.astype('Int64')
+    return numbers.astype('Float64')
+
+
+def parse_reports(reports):
+    """ Return the data frame of a list of reports (or of the overviews of
+    several companies) with typed columns: nullable Int64 or Float64 for
+    the numbers, datetime64 for the dates and strings for the rest, the
+    'None' values of the api being missing values. The conversion is done
+    column by column over all the reports at once.
+
+    Keyword Arguments:
+        reports: The list of reports (dictionaries), i.e. the annualReports
+            of a statement, or a data frame of them
+    """
+    if not _PANDAS_FOUND:
+        raise ValueError("The pandas library was not found, therefore the "
+                         "fundamentals parser can not be used, please "
+                         "install manually")
+    frame = reports if isinstance(reports, pandas.DataFrame) else \
+        pandas.DataFrame.from_records(reports or [])
+    # The arrays, to not align the columns on the index of the reports
+    return pandas.DataFrame({name: _typed_column(name, frame[name]).array
+                             for name in frame.columns}, index=frame.index)
+
+
+def reports_panel(reports):
+    """ Return the data frame of the reports of several companies, indexed
+    by symbol and fiscal date ending, with the typed columns of
+    parse_reports. The reports of all the companies are converted together,
+    i.e. for a screener over the bundles of get_fundamentals_bundle:
+
+        reports_panel({symbol: bundle['income_statement_annual']
+                       for symbol, bundle in bundles.items()})
+
+    Keyword Arguments:
+        reports: Dictionary mapping each symbol to its list of reports or
+            to their data frame
+    """
+    if not _PANDAS_FOUND:
+        raise ValueError("The pandas library was not found, therefore the "
+                         "fundamentals parser can not be used, please "
+                         "install manually")
+    if any(isinstance(r, pandas.DataFrame) for r in reports.values()):
+        frames = {symbol: r if isinstance(r, pandas.DataFrame) else
+                  pandas.DataFrame.from_records(r or [])
+                  for symbol, r in reports.items()}
+        frame = pandas.concat(list(frames.values()), keys=list(frames),
+                              names=['symbol', None]) if frames else \
+            pandas.DataFrame()
+        frame = frame.reset_index(level=1, drop=True)
+    else:
+        # One frame of all the reports, far faster than one per company
+        records = [report for r in reports.values() for report in r or []]
+        symbols = pandas.Index(list(reports), name='symbol').repeat(
+            [len(r or []) for r in reports.values()])
+        frame = pandas.DataFrame.from_records(records, index=symbols) \
+            if records else pandas.DataFrame(index=symbols)
+    panel = parse_reports(frame)
+    if 'fiscalDateEnding' in panel.columns:
+        panel = panel.set_index('fiscalDateEnding', append=True)
+    return panel
+
+
+class _FundamentalsBundle(object):
+    """ Calls of a bundle of fundamentals, one per symbol and function
+    """
+
+    def __init__(self, client, symbols, statements, refresh):
+        unknown = set(statements) - set(STATEMENTS)
+        if unknown:
+            raise ValueError('Statements: {} not supported, only {} are'.format(
+                sorted(unknown), ', '.join(STATEMENTS)))
+        self.client = client
+        self.cache = client.fundamentals_cache
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        self.symbols = [symbol.upper() for symbol in symbols]
+        self.statements = list(statements)
+        self.cached = {}
+        self.calls = []
+        for symbol in self.symbols:
+            for statement in self.statements:
+                response = None
+                if self.cache is not None and not refresh:
+                    response = self.cache.get(symbol, statement)
+                if response is None:
+                    self.calls.append((symbol, statement))
+                else:
+                    self.cached[(symbol, statement)] = response
+                    client._report_cached(statement.upper(), symbol)
+
+    def requests(self):
+        return [lambda s=s, n=n: getattr(
+            self.client, '_get_{}_response'.format(n))(symbol=s)
+            for s, n in self.calls]
+
+    def bundles(self, results):
+        """ Split the responses in the statements of each symbol
+        """
+        bundles = {symbol: {} for symbol in self.symbols}
+        responses = dict(self.cached)
+        errors = {}
+        for (symbol, statement), result in zip(self.calls, results):
+            if isinstance(result, ValueError):
+                errors[(symbol, statement)] = str(result)
+                continue
+            responses[(symbol, statement)] = result[0]
+            if self.cache is not None:
+                self.cache.put(symbol, statement, result[0])
+        for (symbol, statement), response in responses.items():
+            bundle = bundles[symbol]
+            if statement == 'overview':
+                bundle[statement] = response
+                continue
+            for period in ('annual', 'quarterly'):
+                bundle['{}_{}'.format(statement, period)] = parse_reports(
+                    response.get('{}Reports'.format(period)))
+        return bundles, {'errors': errors, 'cached': sorted(self.cached)}
+
+
 class FundamentalData(av):
 
     """This class implements all the api calls to fundamental data
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, fundamentals_cache=None, **kwargs):
         """
         Inherit AlphaVantage base class with its default arguments.
+
+        Keyword Arguments:
+            fundamentals_cache: A FundamentalsCache serving the statements of
+                the bundles until a new report is expected, True to create
+                a new one in memory (default None)
         """
         super(FundamentalData, self).__init__(*args, **kwargs)
+        self.fundamentals_cache = FundamentalsCache() \
+            if fundamentals_cache is True else fundamentals_cache
         self._append_type = False
         if self.output_format.lower() == 'csv':
             raise ValueError("Output format {} is not compatible with the FundamentalData class".format(
                 self.output_format.lower()))
 
+    @av._observed
+    @av._call_api_on_func
+    def _get_overview_response(self, symbol):
+        """
+        Returns the whole OVERVIEW response, in a tuple with its (unused) data
+        keys
+
+        Keyword Arguments:
+            symbol:  the symbol for the equity we want to get its data
+        """
+        return 'OVERVIEW', None, None
+
+    @av._observed
+    @av._call_api_on_func
+    def _get_income_statement_response(self, symbol):
+        """
+        Returns the whole INCOME_STATEMENT response, in a tuple with its (unused) data
+        keys
+
+        Keyword Arguments:
+            symbol:  the symbol for the equity we want to get its data
+        """
+        return 'INCOME_STATEMENT', None, None
+
+    @av._observed
+    @av._call_api_on_func
+    def _get_balance_sheet_response(self, symbol):
+        """
+        Returns the whole BALANCE_SHEET response, in a tuple with its (unused) data
+        keys
+
+        Keyword Arguments:
+            symbol:  the symbol for the equity we want to get its data
+        """
+        return 'BALANCE_SHEET', None, None
+
+    @av._observed
+    @av._call_api_on_func
+    def _get_cash_flow_response(self, symbol):
+        """
+        Returns the whole CASH_FLOW response, in a tuple with its (unused) data
+        keys
+
+        Keyword Arguments:
+            symbol:  the symbol for the equity we want to get its data
+        """
+        return 'CASH_FLOW', None, None
+
+    def get_fundamentals_bundle(self, symbols, statements=STATEMENTS,
+                                workers=4, refresh=False):
+        """
+        Returns the overview and the annual and quarterly statements of one
+        or several companies. Each statement costs one call per symbol, its
+        annual and quarterly reports being split locally, so that the full
+        bundle costs four calls instead of seven. The calls of all the
+        symbols are made concurrently, within the rate of the scheduler or
+        key pool of the client when it has one. With the fundamentals cache
+        of the client, only the companies that reported since they were
+        cached are fetched.
+
+        Keyword Arguments:
+            symbols: The symbol or the list of symbols of the companies
+            statements: The statements fetched among overview,
+                income_statement, balance_sheet and cash_flow (default all)
+            workers: The number of calls made at the same time (default 4)
+            refresh: Fetch every statement, even the ones cached (default
+                False)
+        Returns:
+            A dictionary mapping each symbol to its bundle, a dictionary with
+            the overview (a dictionary) and the data frames of the
+            statements (i.e. income_statement_annual and
+            income_statement_quarterly) typed by parse_reports, and a
+            dictionary with the error of each (symbol, statement) which
+            failed ('errors') and the (symbol, statement) served by the
+            fundamentals cache ('cached')
+        """
+        if not _PANDAS_FOUND:
+            raise ValueError("The pandas library was not found, therefore the "
+                             "fundamentals bundle can not be used, please "
+                             "install manually")
+        bundle = _FundamentalsBundle(self, symbols, statements, refresh)
+        return self._gather(bundle.requests(), workers, bundle.bundles)
+
     @av._output_format
     @av._call_api_on_func
     def get_company_overview(self, symbol):
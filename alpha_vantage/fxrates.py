@@ -0,0 +1,158 @@
+import time
+# numpy comes with pandas, it is needed to derive the cross rates
+try:
+    import numpy
+    _NUMPY_FOUND = True
+except ImportError:
+    _NUMPY_FOUND = False
+try:
+    import pandas
+    _PANDAS_FOUND = True
+except ImportError:
+    _PANDAS_FOUND = False
+
+
+def spanning_pairs(currencies, base='USD'):
+    """ Return the minimal set of pairs from which every cross rate of the
+    currencies can be derived: the pairs of the base against each other
+    currency, n - 1 calls instead of n * (n - 1)
+
+    Keyword Arguments:
+        currencies: The currency codes
+        base: The currency every pair is quoted against (default 'USD')
+    """
+    return [(base, c) for c in _currencies(currencies, base) if c != base]
+
+
+def _currencies(currencies, base):
+    """ The currency codes in upper case without duplicates, base first
+    """
+    codes = [base.upper()]
+    for currency in currencies:
+        if currency.upper() not in codes:
+            codes.append(currency.upper())
+    return codes
+
+
+def parse_rate(data):
+    """ Return (rate, last refreshed) of the data of a
+    get_currency_exchange_rate call (a dictionary or a one row data frame)
+    """
+    if hasattr(data, 'iloc'):
+        data = data.iloc[0].to_dict()
+    return float(data['5. Exchange Rate']), data.get('6. Last Refreshed')
+
+
+class RateMatrix(object):
+    """ Consistent matrix of the exchange rates between a set of currencies,
+    derived from the rates of the base against each of them.
+
+    Attributes:
+        currencies: The currency codes, the base first
+        base: The base currency
+        rates: Array where rates[i, j] is the price of one unit of
+            currencies[i] in currencies[j] (NaN when a leg is missing)
+        refreshed: Array with the last refresh time of each rate (the
+            oldest of its legs, numpy datetime64)
+        time: The time the matrix was built (epoch seconds)
+    """
+
+    def __init__(self, currencies, base, rates, refreshed, time):
+        self.currencies = currencies
+        self.base = base
+        self.rates = rates
+        self.refreshed = refreshed
+        self.time = time
+        self._index = {c: i for i, c in enumerate(currencies)}
+
+    def rate(self, from_currency, to_currency):
+        """ Return the price of one unit of from_currency in to_currency
+        """
+        return float(self.rates[self._index[from_currency.upper()],
+                                self._index[to_currency.upper()]])
+
+    def path(self, from_currency, to_currency):
+        """ Return the derivation path of a rate, i.e. ('EUR', 'USD', 'JPY')
+        for the cross rate of EUR in JPY derived from USD/EUR and USD/JPY
+        """
+        from_currency = from_currency.upper()
+        to_currency = to_currency.upper()
+        if from_currency == to_currency:
+            return (from_currency,)
+        if self.base in (from_currency, to_currency):
+            return (from_currency, to_currency)
+        return (from_currency, self.base, to_currency)
+
+    @property
+    def paths(self):
+        """ Array of the derivation paths of the rates, as strings
+        """
+        paths = numpy.empty(self.rates.shape, dtype=object)
+        for i, a in enumerate(self.currencies):
+            for j, b in enumerate(self.currencies):
+                paths[i, j] = '>'.join(self.path(a, b))
+        return paths
+
+    def to_frame(self):
+        """ Return the rates as a pandas data frame, from currencies in the
+        index and to currencies in the columns
+        """
+        if not _PANDAS_FOUND:
+            raise ValueError("The pandas library was not found, therefore can "
+                             "not be used as an output format, please install "
+                             "manually")
+        return pandas.DataFrame(self.rates, index=self.currencies,
+                                columns=self.currencies)
+
+
+def cross_rates(base, legs, currencies=None, now=None):
+    """ Derive the matrix of every cross rate from the legs of the base
+
+    Keyword Arguments:
+        base: The base currency
+        legs: Dictionary mapping each currency to (rate, last refreshed),
+            the rate being the price of one unit of base in the currency
+        currencies: The currencies of the matrix, default the base and the
+            currencies of the legs
+        now: The time the matrix is built at (epoch seconds), default now
+    """
+    if not _NUMPY_FOUND:
+        raise ValueError("The numpy library was not found, therefore the "
+                         "cross rates can not be derived, please install "
+                         "manually")
+    base = base.upper()
+    currencies = _currencies(currencies if currencies is not None
+                             else list(legs), base)
+    # Price of one unit of base in each currency, the base itself being 1
+    units = numpy.array([1.] + [float(legs[c][0]) if c in legs else numpy.nan
+                                for c in currencies[1:]])
+    refreshed = numpy.array(
+        ['NaT'] + [legs[c][1] if c in legs and legs[c][1] else 'NaT'
+                   for c in currencies[1:]], dtype='datetime64[s]')
+    # The base leg is always fresh, it is as old as the other leg
+    refreshed[0] = refreshed[1:].max() if len(currencies) > 1 and \
+        not numpy.isnat(refreshed[1:]).all() else numpy.datetime64('NaT')
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        # rates[i, j] = (base in j) / (base in i)
+        rates = units[numpy.newaxis, :] / units[:, numpy.newaxis]
+    oldest = numpy.minimum(refreshed[:, numpy.newaxis],
+                           refreshed[numpy.newaxis, :])
+    return RateMatrix(currencies, base, rates, oldest,
+                      time.time() if now is None else now)
+
+
+def fetch_rate_matrix(client, currencies, base='USD'):
+    """ Fetch the legs of the base against the currencies (one call per
+    currency) and return the RateMatrix of every cross rate
+
+    Keyword Arguments:
+        client: The ForeignExchange used for the calls
+        currencies: The currency codes
+        base: The base currency (default 'USD')
+    """
+    legs = {}
+    for base_code, currency in spanning_pairs(currencies, base):
+        data, _ = client.get_currency_exchange_rate(
+            from_currency=base_code, to_currency=currency)
+        legs[currency] = parse_rate(data)
+    return cross_rates(base, legs, currencies)
@@ -0,0 +1,296 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import threading
+import time
+
+_log = logging.getLogger(__name__)
+
+# The event of the api call running in the current thread or task
+_current_event = ContextVar('alpha_vantage_call_event', default=None)
+
+
+class CallEvent(object):
+    """ What happened during an api call, given to the hooks of the client
+    once the call is over. The durations are in seconds, None when they were
+    not measured (i.e. the dns time with the requests transport).
+
+    Attributes:
+        function: The alpha vantage function (i.e. TIME_SERIES_DAILY)
+        symbol: The symbol of the call, None when the call has none
+        queue_wait: Time spent waiting for a key of the pool or for the
+            scheduler of the client
+        dns: Time spent resolving the host
+        connect: Time spent opening the connection
+        ttfb: Time until the headers of the response arrived, dns and
+            connect included (measured by the requests transport instead of
+            the dns and connect times)
+        transfer: Time spent receiving the response
+        bytes: Size of the body of the response
+        decode: Time spent decoding the response
+        format: Time spent converting the response to the output format
+        cache: When a cache took part in the call, 'hit' (answered by a
+            caching proxy or by a local cache of the client without calling
+            the api), 'coalesced' (answered by a call in flight at the
+            proxy), 'partial' (merged into the series held by the cache of
+            the client), 'reused' (the api answered a response already
+            converted, whose conversion was reused) or 'miss'. None
+            otherwise
+        retries: Number of times the call was sent again (i.e. on another
+            key of the pool after being throttled)
+        requests: Number of requests answered by the transport
+        throttled: Number of answers telling that the key was throttled
+        key: The key used for the call, masked (see keypool.mask_key)
+        tag: The tag given to the call (tag= option of the api calls)
+        outputsize: The outputsize chosen for a call made with
+            outputsize='auto', None otherwise
+        error: The exception raised by the call, None on success
+        total: Duration of the whole call
+        cpu: Dictionary with the CPU time of the thread spent in each stage
+            of the call (url_build, queue_wait, http, decode, cache, format)
+            and in the whole call (total)
+    """
+    __slots__ = ('function', 'symbol', 'started', 'queue_wait', 'dns',
+                 'connect', 'ttfb', 'transfer', 'bytes', 'decode', 'format',
+                 'cache', 'retries', 'requests', 'throttled', 'key', 'tag',
+                 'outputsize', 'error', 'total', 'cpu', '_clock',
+                 '_formatting', '_cpu_start', '_cpu_lap')
+
+    def __init__(self):
+        self.function = None
+        self.symbol = None
+        self.started = time.time()
+        self.queue_wait = 0.
+        self.dns = None
+        self.connect = None
+        self.ttfb = None
+        self.transfer = None
+        self.bytes = 0
+        self.decode = 0.
+        self.format = 0.
+        self.cache = None
+        self.retries = 0
+        self.requests = 0
+        self.throttled = 0
+        self.key = None
+        self.tag = None
+        self.outputsize = None
+        self.error = None
+        self.total = 0.
+        self.cpu = {}
+        self._clock = time.perf_counter()
+        self._formatting = None
+        self._cpu_start = self._cpu_lap = time.thread_time()
+
+    def lap(self, stage):
+        """ Add the CPU time spent since the previous lap to a stage
+        """
+        now = time.thread_time()
+        self.cpu[stage] = self.cpu.get(stage, 0.) + now - self._cpu_lap
+        self._cpu_lap = now
+
+    def as_dict(self):
+        """ Return the event as a dictionary
+        """
+        return {k: getattr(self, k) for k in self.__slots__
+                if not k.startswith('_')}
+
+
+def current_event():
+    """ Return the CallEvent of the api call running in the current thread or
+    task, None when no call is running or the client has no hooks
+    """
+    return _current_event.get()
+
+
+@contextmanager
+def observe_call(hooks):
+    """ Context of an api call: opens its CallEvent (unless the call is
+    already observed by an outer decorator) and gives it to the hooks when
+    the call is over
+
+    Keyword Arguments:
+        hooks: The hooks of the client
+    """
+    event = _current_event.get()
+    if not hooks or event is not None:
+        yield event
+        return
+    event = CallEvent()
+    token = _current_event.set(event)
+    try:
+        yield event
+    except Exception as error:
+        event.error = error
+        raise
+    finally:
+        _current_event.reset(token)
+        event.lap('format')
+        event.cpu['total'] = event._cpu_lap - event._cpu_start
+        end = time.perf_counter()
+        if event._formatting is not None:
+            event.format = end - event._formatting
+        event.total = end - event._clock
+        _notify(hooks, event)
+
+
+def _notify(hooks, event):
+    """ Give an event to the hooks, a failing hook being logged
+    """
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception:
+            _log.exception('Hook %r failed', hook)
+
+
+def report_cached(hooks, function, symbol=None):
+    """ Give the hooks the event of a call answered by a local cache of the
+    client (i.e. the fundamentals cache or the symbol index), the api not
+    being called
+
+    Keyword Arguments:
+        hooks: The hooks of the client
+        function: The alpha vantage function of the call
+        symbol: The symbol of the call, None when the call has none
+    """
+    if not hooks:
+        return
+    event = CallEvent()
+    event.function = function
+    event.symbol = symbol
+    event.cache = 'hit'
+    event.lap('cache')
+    event.cpu['total'] = event._cpu_lap - event._cpu_start
+    event.total = time.perf_counter() - event._clock
+    _notify(hooks, event)
+
+
+def response_received(event):
+    """ Mark the moment the response of a call is handed to the output
+    formatting
+    """
+    if event is not None:
+        event.lap('cache')
+        event._formatting = time.perf_counter()
+
+
+class LoggingHook(object):
+    """ Hook logging one line per api call
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        """ Initialize the hook
+
+        Keyword Arguments:
+            logger: The logger used, default the logger of this module
+            level: The level of the messages (default logging.INFO)
+        """
+        self.logger = logger if logger is not None else _log
+        self.level = level
+
+    def __call__(self, event):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        self.logger.log(
+            self.level,
+            '%s %s %s total=%.1fms wait=%.1fms transfer=%s bytes=%d '
+            'decode=%.1fms format=%.1fms cache=%s retries=%d',
+            event.function, event.symbol or '-',
+            'error' if event.error is not None else 'ok',
+            event.total * 1000, event.queue_wait * 1000,
+            '-' if event.transfer is None else
+            '{:.1f}ms'.format(event.transfer * 1000), event.bytes,
+            event.decode * 1000, event.format * 1000, event.cache or '-',
+            event.retries, extra={'alpha_vantage': event.as_dict()})
+
+
+class PrometheusHook(object):
+    """ Hook keeping Prometheus style counters and histograms of the api
+    calls, labelled by function. render() returns them in the text
+    exposition format, to be served on a /metrics endpoint.
+    """
+    STAGES = ('queue_wait', 'dns', 'connect', 'ttfb', 'transfer', 'decode',
+              'format', 'total')
+    BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60.)
+
+    def __init__(self, namespace='alpha_vantage', buckets=None):
+        """ Initialize the hook
+
+        Keyword Arguments:
+            namespace: The prefix of the metric names
+            buckets: The upper bounds of the buckets of the histograms, in
+                seconds
+        """
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets or self.BUCKETS))
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [
+                [0] * (len(self.buckets) + 1), 0., 0]
+        histogram[0][bisect_left(self.buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def __call__(self, event):
+        function = {'function': event.function or 'unknown'}
+        with self._lock:
+            self._count('calls_total', dict(
+                function, status='error' if event.error is not None
+                else 'ok'))
+            self._count('retries_total', function, event.retries)
+            self._count('response_bytes_total', function, event.bytes)
+            if event.cache is not None:
+                self._count('cache_total', dict(function, result=event.cache))
+            for stage in self.STAGES:
+                value = getattr(event, stage)
+                if value is not None:
+                    self._observe('call_duration_seconds',
+                                  dict(function, stage=stage), value)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        return '{' + ','.join('{}="{}"'.format(k, v) for k, v in labels) + '}'
+
+    def render(self):
+        """ Return the metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((k, ([c for c in v[0]], v[1], v[2]))
+                                for k, v in self.histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            name = '{}_{}'.format(self.namespace, name)
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} counter'.format(name))
+            lines.append('{}{} {}'.format(name, self._labels(labels), value))
+        for (name, labels), (counts, total, count) in histograms:
+            name = '{}_{}'.format(self.namespace, name)
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} histogram'.format(name))
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append('{}_bucket{} {}'.format(
+                    name, self._labels(labels, [('le', bound)]), cumulative))
+            lines.append('{}_sum{} {}'.format(name, self._labels(labels),
+                                              total))
+            lines.append('{}_count{} {}'.format(name, self._labels(labels),
+                                                count))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,176 @@
+from collections import deque
+import threading
+import time
+
+
+def is_throttled(message):
+    """ Return whether an error message of the api tells that the call
+    frequency of the key was exceeded
+
+    Keyword Arguments:
+        message: The message given by the api
+    """
+    message = str(message).lower()
+    return 'call frequency' in message or 'rate limit' in message
+
+
+def mask_key(key):
+    """ Return a key with all but its last 4 characters hidden, to show it
+    in reports and logs
+    """
+    if key is None:
+        return None
+    key = str(key)
+    return '*' * max(0, len(key) - 4) + key[-4:]
+
+
+class _KeyState(object):
+    """ Usage and health of a key of the pool
+    """
+
+    def __init__(self, key, calls_per_minute, calls_per_day):
+        self.key = key
+        self.calls_per_minute = calls_per_minute
+        self.calls_per_day = calls_per_day
+        self.minute = deque()
+        self.day = deque()
+        self.calls = 0
+        self.throttled = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.
+
+    def wait(self, now):
+        """ Seconds to wait before the key may be used again
+        """
+        while self.minute and now - self.minute[0] >= 60:
+            self.minute.popleft()
+        while self.day and now - self.day[0] >= 86400:
+            self.day.popleft()
+        wait = max(0., self.cooldown_until - now)
+        if len(self.minute) >= self.calls_per_minute:
+            wait = max(wait, self.minute[0] + 60 - now)
+        if self.calls_per_day is not None and \
+                len(self.day) >= self.calls_per_day:
+            wait = max(wait, self.day[0] + 86400 - now)
+        return wait
+
+
+class KeyPool(object):
+    """ Pool of api keys that spreads the calls of a client across the keys,
+    so that the throughput of the client grows with the number of keys.
+    Each call goes to the healthy key with the most room left in its quota.
+    Keys answering with a throttle message or failing repeatedly are set
+    aside for a cooldown period.
+
+    A pool is given as the key of a client, both for keys of the alpha
+    vantage api and for RapidAPI keys (rapidapi=True).
+    """
+
+    def __init__(self, keys, calls_per_minute=5, calls_per_day=None,
+                 cooldown=60., max_errors=3):
+        """ Initialize the pool
+
+        Keyword Arguments:
+            keys: A list of keys, or a dictionary mapping each key to its
+                calls per minute when the keys have different quotas
+            calls_per_minute: The calls per minute allowed to each key
+                (default 5, the limit of the free keys)
+            calls_per_day: The calls per day allowed to each key, None when
+                the keys have no daily quota (default None)
+            cooldown: Seconds a key is set aside after being throttled or
+                failing max_errors times in a row (default 60)
+            max_errors: Consecutive failures after which a key is set aside
+                (default 3)
+        """
+        if not isinstance(keys, dict):
+            keys = {key: calls_per_minute for key in keys}
+        if not keys or not all(isinstance(k, str) and k for k in keys):
+            raise ValueError('A key pool needs at least one key and all the '
+                             'keys must be strings')
+        self._states = {key: _KeyState(key, limit, calls_per_day)
+                        for key, limit in keys.items()}
+        self.cooldown = cooldown
+        self.max_errors = max_errors
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    def __iter__(self):
+        return iter(self._states)
+
+    @staticmethod
+    def _clock():
+        return time.monotonic()
+
+    def try_checkout(self):
+        """ Reserve the best key if one is available and return (key, 0),
+        otherwise return (None, seconds to wait for the first key) without
+        blocking
+        """
+        with self._lock:
+            now = self._clock()
+            waits = {state.key: state.wait(now)
+                     for state in self._states.values()}
+            ready = [state for state in self._states.values()
+                     if waits[state.key] == 0]
+            if not ready:
+                return None, min(waits.values())
+            # The key with the most room left in its minute window
+            state = max(ready, key=lambda s: (
+                s.calls_per_minute - len(s.minute), -s.calls))
+            state.minute.append(now)
+            state.day.append(now)
+            state.calls += 1
+            return state.key, 0
+
+    def checkout(self):
+        """ Return the key to use for the next call, waiting until one of
+        them has room in its quota
+        """
+        while True:
+            key, wait = self.try_checkout()
+            if key is not None:
+                return key
+            time.sleep(wait)
+
+    def report(self, key, error=None):
+        """ Report the outcome of a call made with a key of the pool
+
+        Keyword Arguments:
+            key: The key used for the call
+            error: The exception raised by the call when the key is to blame
+                (throttled or failing to connect), None otherwise
+        """
+        with self._lock:
+            state = self._states[key]
+            if error is None:
+                state.consecutive_errors = 0
+            elif is_throttled(error):
+                state.throttled += 1
+                state.cooldown_until = self._clock() + self.cooldown
+            else:
+                state.errors += 1
+                state.consecutive_errors += 1
+                if state.consecutive_errors >= self.max_errors:
+                    state.cooldown_until = self._clock() + self.cooldown
+                    state.consecutive_errors = 0
+
+    def status(self):
+        """ Return a dictionary with, for every key, the calls made in the
+        last minute and day, the totals of calls, throttles and errors and
+        whether the key is healthy (not cooling down)
+        """
+        with self._lock:
+            now = self._clock()
+            status = {}
+            for key, state in self._states.items():
+                state.wait(now)
+                status[key] = {'calls_last_minute': len(state.minute),
+                               'calls_last_day': len(state.day),
+                               'calls': state.calls,
+                               'throttled': state.throttled,
+                               'errors': state.errors,
+                               'healthy': state.cooldown_until <= now}
+            return status
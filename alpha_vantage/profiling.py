@@ -0,0 +1,144 @@
+from collections import deque
+import json
+import threading
+
+STAGES = ('url_build', 'queue_wait', 'http', 'decode', 'cache', 'format')
+
+
+def _percentiles(values):
+    """ Summarize a list of durations (seconds)
+    """
+    if not values:
+        return {'count': 0, 'sum': 0., 'mean': 0., 'p50': 0., 'p90': 0.,
+                'p99': 0., 'max': 0.}
+    values = sorted(values)
+
+    def _percentile(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+    total = sum(values)
+    return {'count': len(values), 'sum': total, 'mean': total / len(values),
+            'p50': _percentile(.5), 'p90': _percentile(.9),
+            'p99': _percentile(.99), 'max': values[-1]}
+
+
+class Profiler(object):
+    """ Hook aggregating the CPU time of the api calls per endpoint (the
+    alpha vantage function) and per stage of the decorator stack: url_build,
+    queue_wait, http, decode, cache (the merge into the cache and store of
+    the client) and format. Where the usual profilers only show the
+    decorator frames, it tells which endpoints and stages are the hottest.
+
+    It is switched on per client with client.enable_profiling(). With the
+    async clients, the CPU time of a stage awaiting the network includes
+    the work of the other tasks of the event loop in the meantime.
+    """
+
+    def __init__(self, history=10000):
+        """ Initialize the profiler
+
+        Keyword Arguments:
+            history: Number of recent calls kept per endpoint for the
+                percentiles (default 10000), the totals count every call
+        """
+        self.history = history
+        self._samples = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        endpoint = event.function or 'unknown'
+        sample = dict(event.cpu, wall=event.total)
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(
+                    maxlen=self.history)
+                self._totals[endpoint] = {'calls': 0, 'errors': 0,
+                                          'cpu': dict.fromkeys(STAGES, 0.)}
+            samples.append(sample)
+            totals = self._totals[endpoint]
+            totals['calls'] += 1
+            totals['errors'] += event.error is not None
+            for stage in STAGES:
+                totals['cpu'][stage] += event.cpu.get(stage, 0.)
+
+    def reset(self):
+        """ Forget the calls profiled so far
+        """
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+    def report(self):
+        """ Return a dictionary with, for every endpoint, the number of calls
+        and errors, the total CPU time per stage and the percentiles of the
+        CPU time per stage, of the CPU time of the calls (cpu) and of their
+        duration (wall), over the recent calls
+        """
+        with self._lock:
+            samples = {k: list(v) for k, v in self._samples.items()}
+            totals = {k: {'calls': v['calls'], 'errors': v['errors'],
+                          'cpu': dict(v['cpu'])}
+                      for k, v in self._totals.items()}
+        report = {}
+        for endpoint, calls in samples.items():
+            stats = {stage: _percentiles([c.get(stage, 0.) for c in calls])
+                     for stage in STAGES}
+            stats['cpu'] = _percentiles([c.get('total', 0.) for c in calls])
+            stats['wall'] = _percentiles([c['wall'] for c in calls])
+            report[endpoint] = dict(totals[endpoint], stats=stats)
+        return report
+
+    def summary(self):
+        """ Return a text table of the endpoints, the hottest first, with
+        the CPU time of their stages in milliseconds
+        """
+        report = self.report()
+        lines = ['{:<32} {:>7} {:>10} {:>9} {:>9}  {}'.format(
+            'endpoint', 'calls', 'cpu ms', 'p50 ms', 'p99 ms',
+            ' '.join('{:>10}'.format(s) for s in STAGES))]
+        for endpoint, data in sorted(report.items(), key=lambda item: -sum(
+                item[1]['cpu'].values())):
+            cpu = data['stats']['cpu']
+            lines.append('{:<32} {:>7} {:>10.2f} {:>9.3f} {:>9.3f}  {}'.format(
+                endpoint, data['calls'], sum(data['cpu'].values()) * 1000,
+                cpu['p50'] * 1000, cpu['p99'] * 1000,
+                ' '.join('{:>10.2f}'.format(data['cpu'][s] * 1000)
+                         for s in STAGES)))
+        return '\n'.join(lines)
+
+    def folded(self, root='alpha_vantage'):
+        """ Return the CPU time per endpoint and stage in the folded stacks
+        format (root;endpoint;stage microseconds) read by flamegraph.pl,
+        speedscope and similar tools
+        """
+        with self._lock:
+            totals = {k: dict(v['cpu']) for k, v in self._totals.items()}
+        lines = []
+        for endpoint in sorted(totals):
+            for stage in STAGES:
+                value = int(round(totals[endpoint][stage] * 1e6))
+                if value > 0:
+                    lines.append('{};{};{} {}'.format(root, endpoint, stage,
+                                                      value))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path, output_format='text'):
+        """ Write the profile to a file
+
+        Keyword Arguments:
+            path: The file written
+            output_format: 'text' for the summary, 'json' for the report or
+                'folded' for the folded stacks (default 'text')
+        """
+        if output_format == 'text':
+            content = self.summary() + '\n'
+        elif output_format == 'json':
+            content = json.dumps(self.report(), indent=2)
+        elif output_format == 'folded':
+            content = self.folded()
+        else:
+            raise ValueError('Profile format: {} is not supported, only text,'
+                             ' json and folded are'.format(output_format))
+        with open(path, 'w') as f:
+            f.write(content)
@@ -0,0 +1,156 @@
+from collections import deque
+import heapq
+import itertools
+import threading
+import time
+
+
+class DeadlineExceeded(ValueError):
+    """ Raised when an api call could not be dispatched before its deadline
+    """
+
+
+class _Ticket(object):
+    """ A call waiting in the queue of a scheduler
+    """
+    __slots__ = ('priority', 'enqueued', 'expires', 'cancelled')
+
+    def __init__(self, priority, enqueued, expires):
+        self.priority = priority
+        self.enqueued = enqueued
+        self.expires = expires
+        self.cancelled = False
+
+
+class RequestScheduler(object):
+    """ Dispatch the api calls sharing a key in priority order, within the
+    rate limit of the key. Calls carry a priority (higher goes first) and an
+    optional deadline, calls still queued when their deadline passes are
+    dropped from the queue and fail with DeadlineExceeded.
+
+    A scheduler may be shared by several clients (i.e. a TimeSeries and a
+    FundamentalData using the same key) and by several threads.
+    """
+
+    def __init__(self, calls_per_minute=5, period=60., history=1000):
+        """ Initialize the scheduler
+
+        Keyword Arguments:
+            calls_per_minute: Calls allowed by the key in each period
+                (default 5, the limit of the free keys)
+            period: The length of the rate limit window in seconds
+                (default 60)
+            history: Number of recent wait times kept for the metrics
+                (default 1000)
+        """
+        self.calls_per_minute = calls_per_minute
+        self.period = period
+        self._queue = []
+        self._sequence = itertools.count()
+        self._dispatched = deque()
+        self._waits = deque(maxlen=history)
+        self._counters = {'dispatched': 0, 'expired': 0}
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def _clock():
+        return time.monotonic()
+
+    def _enqueue(self, priority, deadline):
+        now = self._clock()
+        expires = now + deadline if deadline is not None else None
+        ticket = _Ticket(priority, now, expires)
+        heapq.heappush(self._queue, (-priority, next(self._sequence), ticket))
+        return ticket
+
+    def _head(self):
+        """ Return the ticket first in line, discarding the cancelled ones
+        """
+        while self._queue and self._queue[0][2].cancelled:
+            heapq.heappop(self._queue)
+        return self._queue[0][2] if self._queue else None
+
+    def _try_dispatch(self, ticket):
+        """ Dispatch the ticket if it can be, otherwise return the seconds to
+        wait before trying again (None to wait for a notification). Raises
+        DeadlineExceeded when the deadline of the ticket passed.
+        """
+        now = self._clock()
+        while self._dispatched and now - self._dispatched[0] >= self.period:
+            self._dispatched.popleft()
+        until_deadline = None
+        if ticket.expires is not None:
+            until_deadline = ticket.expires - now
+            if until_deadline <= 0:
+                ticket.cancelled = True
+                self._counters['expired'] += 1
+                raise DeadlineExceeded(
+                    'The api call was not dispatched before its deadline')
+        if self._head() is not ticket:
+            return until_deadline
+        if len(self._dispatched) < self.calls_per_minute:
+            heapq.heappop(self._queue)
+            self._dispatched.append(now)
+            self._counters['dispatched'] += 1
+            self._waits.append((ticket.priority, now - ticket.enqueued))
+            return 0
+        until_slot = self._dispatched[0] + self.period - now
+        if until_deadline is None:
+            return until_slot
+        return min(until_slot, until_deadline)
+
+    def acquire(self, priority=0, deadline=None):
+        """ Wait until the call can be dispatched and return the time spent
+        waiting in seconds.
+
+        Keyword Arguments:
+            priority: The priority of the call, higher goes first (default 0)
+            deadline: Seconds the call may wait in the queue, None to wait
+                forever (default None)
+        """
+        with self._condition:
+            ticket = self._enqueue(priority, deadline)
+            try:
+                while True:
+                    wait = self._try_dispatch(ticket)
+                    if wait == 0:
+                        return self._clock() - ticket.enqueued
+                    self._condition.wait(wait)
+            except BaseException:
+                ticket.cancelled = True
+                raise
+            finally:
+                # Let the next call in line check whether it can go
+                self._condition.notify_all()
+
+    def metrics(self):
+        """ Return a dictionary with the queue depth, the dispatched and
+        expired counters and the statistics of the recent wait times (in
+        seconds), overall and per priority.
+        """
+        with self._condition:
+            depth = sum(1 for _, _, t in self._queue if not t.cancelled)
+            waits = list(self._waits)
+            counters = dict(self._counters)
+        per_priority = {}
+        for priority, wait in waits:
+            per_priority.setdefault(priority, []).append(wait)
+        metrics = dict(counters, queue_depth=depth,
+                       wait=_wait_stats([w for _, w in waits]))
+        metrics['wait_by_priority'] = {p: _wait_stats(w)
+                                       for p, w in sorted(per_priority.items())}
+        return metrics
+
+
+def _wait_stats(waits):
+    """ Summarize a list of wait times
+    """
+    if not waits:
+        return {'count': 0, 'mean': 0., 'p50': 0., 'p95': 0., 'max': 0.}
+    waits = sorted(waits)
+
+    def _percentile(q):
+        return waits[min(len(waits) - 1, int(q * len(waits)))]
+    return {'count': len(waits), 'mean': sum(waits) / len(waits),
+            'p50': _percentile(.5), 'p95': _percentile(.95),
+            'max': waits[-1]}
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 from .alphavantage import AlphaVantage as av
+from .sectors import RANKS, SectorParser
 
 
 class SectorPerformances(av):
@@ -12,6 +13,8 @@ class SectorPerformances(av):
         """
         super(SectorPerformances, self).__init__(*args, **kwargs)
         self._append_type = False
+        # Converts the ranks, keeping the result of the last snapshot
+        self.sector_parser = SectorParser()
         if self.output_format.lower() == 'csv':
             raise ValueError("Output format {} is not comatible with the SectorPerformances class".format(
                 self.output_format.lower()))
@@ -35,14 +38,5 @@ class SectorPerformances(av):
         """
         _FUNCTION_KEY = "SECTOR"
         # The keys for the json output
-        _DATA_KEYS = ["Rank A: Real-Time Performance",
-                      "Rank B: 1 Day Performance",
-                      "Rank C: 5 Day Performance",
-                      "Rank D: 1 Month Performance",
-                      "Rank E: 3 Month Performance",
-                      "Rank F: Year-to-Date (YTD) Performance",
-                      "Rank G: 1 Year Performance",
-                      "Rank H: 3 Year Performance",
-                      "Rank I: 5 Year Performance",
-                      "Rank J: 10 Year Performance"]
+        _DATA_KEYS = list(RANKS)
         return _FUNCTION_KEY, _DATA_KEYS, 'Meta Data'
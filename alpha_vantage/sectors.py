@@ -0,0 +1,440 @@
+from datetime import datetime
+import json
+import logging
+import os
+import re
+import threading
+import time
+from .hooks import current_event
+# numpy comes with pandas, it is needed for the vectorized conversion
+try:
+    import numpy
+    import pandas
+    _PANDAS_FOUND = True
+except ImportError:
+    _PANDAS_FOUND = False
+
+_log = logging.getLogger(__name__)
+
+# The ranks of the SECTOR function, in the order of the api
+RANKS = ["Rank A: Real-Time Performance",
+         "Rank B: 1 Day Performance",
+         "Rank C: 5 Day Performance",
+         "Rank D: 1 Month Performance",
+         "Rank E: 3 Month Performance",
+         "Rank F: Year-to-Date (YTD) Performance",
+         "Rank G: 1 Year Performance",
+         "Rank H: 3 Year Performance",
+         "Rank I: 5 Year Performance",
+         "Rank J: 10 Year Performance"]
+
+
+def column_name(rank):
+    """ The name of the column of a rank in the data frames
+    """
+    return re.sub(r'\d+.', '', rank).strip(' ')
+
+
+_COLUMNS = {rank: column_name(rank) for rank in RANKS}
+
+
+def _percentages(strings):
+    """ Convert an array of strings of the form f.f% into f.f/100 at once,
+    the missing values (None) becoming NaN
+    """
+    strings = numpy.asarray(strings, dtype=object)
+    strings[strings == None] = 'nan'  # noqa: E711
+    return numpy.char.rstrip(strings.astype(str), '%').astype(float) / 100
+
+
+class SectorParser(object):
+    """ Parser of the responses of the SECTOR function. All the ranks are
+    converted in one vectorized step, into a data frame whose index is an
+    ordered categorical of the sectors (in alphabetical order, the rows
+    staying in the order of the api). The result is kept until the
+    Last Refreshed of the meta data changes, so that a repeated poll of the
+    same snapshot costs only a copy.
+    """
+
+    def __init__(self):
+        self._cached = None
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def _copy(data):
+        if isinstance(data, dict):
+            return {key: dict(value) for key, value in data.items()}
+        return data.copy()
+
+    def parse(self, response, data_key, meta_data_key, output_format):
+        """ Return the data and the meta data of a response in the output
+        format
+
+        Keyword Arguments:
+            response: The decoded json response of the api
+            data_key: The list of the ranks of the response (or a single
+                key, whose data is not converted)
+            meta_data_key: The key of the meta data
+            output_format: 'json' or 'pandas'
+        """
+        meta_data = response[meta_data_key]
+        if not isinstance(data_key, list):
+            return self._build(response[data_key], output_format), meta_data
+        key = (meta_data.get('Last Refreshed'), output_format,
+               tuple(data_key))
+        with self._lock:
+            cached = self._cached
+        if key[0] is not None and cached is not None and cached[0] == key:
+            self.stats['hits'] += 1
+            event = current_event()
+            if event is not None:
+                event.cache = 'reused'
+            return self._copy(cached[1]), meta_data
+        self.stats['misses'] += 1
+        if _PANDAS_FOUND:
+            data = self._convert(response, data_key, output_format)
+        else:
+            data = {rank: {k: float(v.strip('%')) / 100
+                           for k, v in response[rank].items()}
+                    for rank in data_key}
+            data = self._build(data, output_format)
+        with self._lock:
+            self._cached = (key, data)
+        return self._copy(data), meta_data
+
+    @staticmethod
+    def _convert(response, ranks, output_format):
+        sectors = []
+        for rank in ranks:
+            sectors.extend(s for s in response[rank] if s not in sectors)
+        values = _percentages([[response[rank].get(sector)
+                                for rank in ranks] for sector in sectors])
+        if output_format == 'json':
+            present = ~numpy.isnan(values)
+            return {rank: {sector: float(values[i, j])
+                           for i, sector in enumerate(sectors)
+                           if present[i, j]}
+                    for j, rank in enumerate(ranks)}
+        index = pandas.CategoricalIndex(sectors, categories=sorted(sectors),
+                                        ordered=True)
+        return pandas.DataFrame(values, index=index, columns=[
+            _COLUMNS.get(rank) or column_name(rank) for rank in ranks])
+
+    @staticmethod
+    def _build(data, output_format):
+        if output_format == 'json':
+            return data
+        data_pandas = pandas.DataFrame.from_dict(data, orient='columns')
+        data_pandas.columns = [column_name(name) for name in data_pandas]
+        return data_pandas
+
+
+def parse_refreshed(value):
+    """ Return the Last Refreshed of the meta data of a SECTOR response
+    (i.e. '02:08 PM ET 12/20/2017' or '2020-08-07 14:27:18 US/Eastern') as
+    a datetime, in the time zone of the api (US Eastern)
+    """
+    if isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    for fmt in ('%I:%M %p ET %m/%d/%Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(' '.join(value.split()[:len(
+                fmt.split())]), fmt)
+        except ValueError:
+            pass
+    raise ValueError('Last Refreshed: {} not recognized'.format(value))
+
+
+class SectorHistory(object):
+    """ Time indexed store of the snapshots of the sector performances. It
+    holds one row per snapshot and sector, in columns: the time of the
+    snapshot (Last Refreshed, seconds), the code of the sector and the ten
+    ranks as float32. The columns are numpy arrays, appended to one binary
+    file each when the history has a path, so that an append only writes
+    the new rows. The snapshots already held are ignored, which makes
+    polling more often than the api refreshes harmless. Range queries
+    bisect the time column.
+
+    A history kept in a directory has a single writer (i.e. a recorder) but
+    may be opened by any number of readers, in other processes too. The
+    readers never modify the files and ignore the rows the writer has not
+    completed yet.
+    """
+    _COLUMNS = {'time': 'int64', 'sector': 'int16', 'ranks': 'float32'}
+
+    def __init__(self, path=None):
+        """ Initialize the history
+
+        Keyword Arguments:
+            path: The directory holding the history, created when missing,
+                None to keep it in memory only (default None)
+        """
+        if not _PANDAS_FOUND:
+            raise ValueError("The pandas library was not found, therefore "
+                             "the sector history can not be used, please "
+                             "install manually")
+        self.path = path
+        self.sectors = []
+        self._codes = {}
+        self._chunks = {name: [] for name in self._COLUMNS}
+        self._columns = None
+        self._times = set()
+        self._rows = 0
+        self._trimmed = False
+        self._lock = threading.Lock()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, '{}.bin'.format(name))
+
+    def _load(self):
+        sectors_file = os.path.join(self.path, 'sectors.json')
+        if not os.path.exists(sectors_file):
+            return
+        with open(sectors_file) as f:
+            self.sectors = json.load(f)
+        self._codes = {sector: i for i, sector in enumerate(self.sectors)}
+        columns = {name: numpy.fromfile(self._file(name), dtype=dtype)
+                   for name, dtype in self._COLUMNS.items()}
+        # A row is only complete once its three columns are written
+        rows = min(len(columns['time']), len(columns['sector']),
+                   len(columns['ranks']) // len(RANKS))
+        columns['time'] = columns['time'][:rows]
+        columns['sector'] = columns['sector'][:rows]
+        columns['ranks'] = columns['ranks'][:rows * len(RANKS)].reshape(
+            rows, len(RANKS))
+        # The incomplete rows are ignored, they are either being written or
+        # dropped by the first append of this history
+        self._rows = rows
+        for name, column in columns.items():
+            self._chunks[name].append(column)
+        self._times.update(numpy.unique(columns['time']).tolist())
+
+    def _code(self, sector):
+        code = self._codes.get(sector)
+        if code is None:
+            code = self._codes[sector] = len(self.sectors)
+            self.sectors.append(sector)
+            if self.path is not None:
+                sectors_file = os.path.join(self.path, 'sectors.json')
+                with open(sectors_file + '.tmp', 'w') as f:
+                    json.dump(self.sectors, f)
+                os.replace(sectors_file + '.tmp', sectors_file)
+        return code
+
+    def _trim(self):
+        """ Drop the rows left incomplete by an interrupted append, before
+        the first append of the writer
+        """
+        if self.path is not None and not self._trimmed:
+            for name, dtype in self._COLUMNS.items():
+                if os.path.exists(self._file(name)):
+                    width = numpy.dtype(dtype).itemsize * (
+                        len(RANKS) if name == 'ranks' else 1)
+                    os.truncate(self._file(name), self._rows * width)
+        self._trimmed = True
+
+    @staticmethod
+    def _ranks(data):
+        """ Return the sectors and the array of their ranks of the data of a
+        get_sector call (json or pandas output format)
+        """
+        if isinstance(data, dict):
+            sectors = []
+            for rank in RANKS:
+                sectors.extend(s for s in data.get(rank, {})
+                               if s not in sectors)
+            values = numpy.array([[data.get(rank, {}).get(sector, numpy.nan)
+                                   for rank in RANKS] for sector in sectors],
+                                 dtype='float32')
+            return sectors, values
+        frame = data.reindex(columns=[_COLUMNS[rank] for rank in RANKS])
+        return [str(s) for s in frame.index], \
+            frame.to_numpy(dtype='float32', na_value=numpy.nan)
+
+    def append(self, refreshed, data):
+        """ Append a snapshot and return whether it was new
+
+        Keyword Arguments:
+            refreshed: The Last Refreshed of the snapshot (as given by the
+                meta data) or its datetime
+            data: The data of the get_sector call, json or pandas
+        """
+        moment = numpy.datetime64(parse_refreshed(refreshed), 's').astype(
+            'int64')
+        with self._lock:
+            if int(moment) in self._times:
+                return False
+            self._trim()
+            sectors, values = self._ranks(data)
+            columns = {
+                'time': numpy.full(len(sectors), moment, dtype='int64'),
+                'sector': numpy.array([self._code(s) for s in sectors],
+                                      dtype='int16'),
+                'ranks': values}
+            for name, column in columns.items():
+                self._chunks[name].append(column)
+                if self.path is not None:
+                    with open(self._file(name), 'ab') as f:
+                        column.tofile(f)
+            self._times.add(int(moment))
+            self._rows += len(sectors)
+            self._columns = None
+        return True
+
+    def _arrays(self):
+        """ The columns, concatenated once after each append and sorted by
+        time
+        """
+        with self._lock:
+            if self._columns is None:
+                if not self._chunks['time']:
+                    return (numpy.empty(0, 'int64'), numpy.empty(0, 'int16'),
+                            numpy.empty((0, len(RANKS)), 'float32'))
+                times = numpy.concatenate(self._chunks['time'])
+                order = numpy.argsort(times, kind='stable')
+                self._columns = (
+                    times[order],
+                    numpy.concatenate(self._chunks['sector'])[order],
+                    numpy.concatenate(self._chunks['ranks'])[order])
+                self._chunks = {'time': [self._columns[0]],
+                                'sector': [self._columns[1]],
+                                'ranks': [self._columns[2]]}
+            return self._columns
+
+    def __len__(self):
+        return len(self._times)
+
+    @property
+    def times(self):
+        """ The times of the snapshots, as a DatetimeIndex
+        """
+        return pandas.DatetimeIndex(numpy.array(
+            sorted(self._times), dtype='datetime64[s]'), name='time')
+
+    def read(self, start=None, end=None, sectors=None):
+        """ Return the snapshots between start and end (included) as a
+        data frame indexed by time and sector, with a column per rank
+
+        Keyword Arguments:
+            start: The first time (a datetime or a string), default the
+                first snapshot
+            end: The last time, default the last snapshot
+            sectors: The sectors kept, default all of them
+        """
+        times, codes, ranks = self._arrays()
+        first = 0 if start is None else numpy.searchsorted(
+            times, numpy.datetime64(pandas.Timestamp(start), 's').astype(
+                'int64'), side='left')
+        last = len(times) if end is None else numpy.searchsorted(
+            times, numpy.datetime64(pandas.Timestamp(end), 's').astype(
+                'int64'), side='right')
+        times, codes, ranks = times[first:last], codes[first:last], \
+            ranks[first:last]
+        if sectors is not None:
+            wanted = numpy.isin(codes, [self._codes[s] for s in sectors
+                                        if s in self._codes])
+            times, codes, ranks = times[wanted], codes[wanted], ranks[wanted]
+        index = pandas.MultiIndex.from_arrays([
+            pandas.DatetimeIndex(times.astype('datetime64[s]')),
+            pandas.Categorical.from_codes(codes, categories=self.sectors)],
+            names=['time', 'sector'])
+        return pandas.DataFrame(ranks, index=index,
+                                columns=[_COLUMNS[rank] for rank in RANKS])
+
+    def rank(self, rank=RANKS[1], start=None, end=None):
+        """ Return one rank of the snapshots between start and end as a data
+        frame indexed by time with a column per sector, i.e. to backtest a
+        sector rotation
+
+        Keyword Arguments:
+            rank: The rank, as given by the api or as named in the columns
+                (default the 1 day performance)
+            start: The first time, default the first snapshot
+            end: The last time, default the last snapshot
+        """
+        column = _COLUMNS.get(rank, rank)
+        return self.read(start, end)[column].unstack('sector')
+
+
+class SectorRecorder(object):
+    """ Recorder polling the sector performances of a SectorPerformances
+    client on a schedule and appending the new snapshots to a SectorHistory.
+    It makes one call per interval, the snapshots the api did not refresh
+    yet being ignored.
+
+        recorder = SectorRecorder(sp, SectorHistory('sectors'), interval=300)
+        recorder.start()
+    """
+
+    def __init__(self, client, history=None, interval=300.):
+        """ Initialize the recorder
+
+        Keyword Arguments:
+            client: The SectorPerformances polled (json or pandas output)
+            history: The SectorHistory the snapshots are appended to,
+                default a new one in memory
+            interval: The seconds between two polls (default 300)
+        """
+        self.client = client
+        self.history = history if history is not None else SectorHistory()
+        self.interval = interval
+        self.stats = {'polls': 0, 'snapshots': 0, 'errors': 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _record(self, data, meta_data):
+        self.stats['polls'] += 1
+        added = self.history.append(meta_data['Last Refreshed'], data)
+        self.stats['snapshots'] += added
+        return added
+
+    def poll(self):
+        """ Poll the sector performances once and return whether the
+        snapshot was new
+        """
+        data, meta_data = self.client.get_sector()
+        return self._record(data, meta_data)
+
+    def run(self, cycles=None):
+        """ Poll every interval, cycles times or until stop() is called
+
+        Keyword Arguments:
+            cycles: The number of polls, default until stopped
+        """
+        while cycles is None or cycles > 0:
+            start = time.monotonic()
+            try:
+                self.poll()
+            except Exception as error:
+                # The api and network errors must not stop the recording
+                self.stats['errors'] += 1
+                _log.warning('Sector poll failed: %r', error)
+            if cycles is not None:
+                cycles -= 1
+                if cycles == 0:
+                    break
+            if self._stop.wait(max(0., start + self.interval -
+                                   time.monotonic())):
+                break
+
+    def start(self):
+        """ Start polling in a background thread
+        """
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop polling
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
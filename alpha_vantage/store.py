@@ -0,0 +1,450 @@
+import json
+import os
+import threading
+import time
+# Pandas and pyarrow are optional dependencies, the store can only be used
+# when both of them are installed
+try:
+    import pandas
+    import numpy
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+    _PYARROW_FOUND = True
+except ImportError:
+    _PYARROW_FOUND = False
+
+
+def series_key(function_name, params):
+    """ Return the (symbol, interval) pair under which the result of an api
+    call is stored, or None if the function does not return a time series
+    that can be stored.
+
+    Keyword Arguments:
+        function_name: The alpha vantage function (i.e. TIME_SERIES_DAILY)
+        params: Dictionary with the parameters of the call
+    """
+    if function_name.startswith('TIME_SERIES_'):
+        if function_name == 'TIME_SERIES_INTRADAY_EXTENDED':
+            return None
+        symbol = params['symbol']
+        interval = function_name[len('TIME_SERIES_'):].lower()
+    elif function_name.startswith('FX_'):
+        symbol = '{}{}'.format(params['from_symbol'], params['to_symbol'])
+        interval = function_name[len('FX_'):].lower()
+    elif function_name.startswith('DIGITAL_CURRENCY_'):
+        symbol = '{}{}'.format(params['symbol'], params['market'])
+        interval = function_name[len('DIGITAL_CURRENCY_'):].lower()
+    else:
+        return None
+    if interval == 'intraday':
+        interval = params['interval']
+    return symbol.upper(), interval
+
+
+class SeriesStore(object):
+    """ Append only local store of time series. The bars are partitioned by
+    symbol, interval and month, every append writes a new columnar file in
+    the partitions it touches and reads only open the partitions overlapping
+    the requested range. Small appended files are merged together by
+    compact().
+
+    Files are written either as parquet (compressed, the default) or as
+    uncompressed Arrow IPC files. The latter are memory mapped on read, so
+    read_table() returns zero-copy views that the OS pages in on demand and
+    shares between all the processes reading the same store.
+
+    Every series keeps an index of the blocks (parquet row groups or arrow
+    record batches) of its files with their first and last timestamps. Range
+    reads only load the blocks overlapping the range and coverage() is
+    answered from the index alone.
+
+    A store may be shared between the threads of a process, the files
+    replaced by compact() are only removed once no read holds them. It is
+    not safe across processes: a process compacting the store removes
+    files another process may be reading.
+    """
+    _PART_EXT = {'parquet': '.parquet', 'arrow': '.arrow'}
+    _INDEX_FILE = '_index.json'
+
+    def __init__(self, path, compact_threshold=8, file_format='parquet',
+                 block_size=4096):
+        """ Initialize the store
+
+        Keyword Arguments:
+            path: The directory holding the store, created when missing
+            compact_threshold: Number of files a month partition may hold
+                before compact() merges them (default 8)
+            file_format: Either 'parquet' or 'arrow' (memory mapped), the
+                format of the files written by the store. Files of both
+                formats can be read (default 'parquet')
+            block_size: Number of bars of the blocks of a file, the unit
+                loaded by range reads (default 4096)
+        """
+        if not _PYARROW_FOUND:
+            raise ValueError("The pandas and pyarrow libraries were not "
+                             "found, therefore the store can not be used, "
+                             "please install them manually")
+        if file_format not in self._PART_EXT:
+            raise ValueError("File format: {} not recognized, only parquet "
+                             "and arrow are supported".format(file_format))
+        self.path = path
+        self.file_format = file_format
+        self.compact_threshold = compact_threshold
+        self.block_size = block_size
+        self._lock = threading.RLock()
+        self._indexes = {}
+        self._readers = 0
+        self._replaced = []
+        self._compaction = None
+        os.makedirs(path, exist_ok=True)
+
+    def _series_path(self, symbol, interval):
+        return os.path.join(self.path, symbol.upper(), interval)
+
+    def _months(self, symbol, interval):
+        """ Return the sorted month partitions of a series
+        """
+        series_path = self._series_path(symbol, interval)
+        if not os.path.isdir(series_path):
+            return []
+        return sorted(m for m in os.listdir(series_path)
+                      if os.path.isdir(os.path.join(series_path, m)))
+
+    def _parts(self, symbol, interval, month):
+        month_path = os.path.join(self._series_path(symbol, interval), month)
+        return [os.path.join(month_path, name)
+                for name in sorted(os.listdir(month_path))
+                if name.endswith(tuple(self._PART_EXT.values()))]
+
+    @staticmethod
+    def _to_frame(data):
+        """ Turn the data of an api call (a dictionary indexed by date) or a
+        data frame into a float data frame with a datetime index
+        """
+        if isinstance(data, pandas.DataFrame):
+            frame = data.copy()
+        else:
+            frame = pandas.DataFrame.from_dict(data, orient='index',
+                                               dtype='float')
+        frame.index = pandas.to_datetime(frame.index)
+        frame.index.name = 'date'
+        return frame.sort_index()
+
+    def _write_part(self, symbol, interval, month, frame):
+        """ Write a sorted frame into a new file of a month partition and
+        return the index entries of its blocks
+        """
+        month_path = os.path.join(self._series_path(symbol, interval), month)
+        os.makedirs(month_path, exist_ok=True)
+        name = 'part-{:020d}{}'.format(time.time_ns(),
+                                       self._PART_EXT[self.file_format])
+        tmp_path = os.path.join(month_path, '.' + name)
+        table = pyarrow.Table.from_pandas(frame)
+        if self.file_format == 'arrow':
+            with pyarrow.OSFile(tmp_path, 'wb') as sink, \
+                    pyarrow.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=self.block_size)
+        else:
+            pyarrow.parquet.write_table(table, tmp_path,
+                                        row_group_size=self.block_size)
+        # Rename so readers never see a half written file
+        os.replace(tmp_path, os.path.join(month_path, name))
+        return [{'file': '{}/{}'.format(month, name), 'block': block,
+                 'rows': len(chunk),
+                 'first': chunk.index[0].isoformat(sep=' '),
+                 'last': chunk.index[-1].isoformat(sep=' ')}
+                for block, chunk in enumerate(
+                    frame.iloc[i:i + self.block_size]
+                    for i in range(0, len(frame), self.block_size))]
+
+    def _index(self, symbol, interval):
+        """ Return the index of a series, loading it from disk when it was
+        changed by another store, or rebuilding it when it is missing
+        """
+        series_path = self._series_path(symbol, interval)
+        index_path = os.path.join(series_path, self._INDEX_FILE)
+        try:
+            mtime = os.stat(index_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        cached = self._indexes.get(series_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        if mtime is not None:
+            with open(index_path) as f:
+                index = json.load(f)
+        else:
+            index = {'full': False, 'blocks': []}
+            for month in self._months(symbol, interval):
+                for part in self._parts(symbol, interval, month):
+                    index['blocks'].extend(self._scan_part(series_path, part))
+        self._indexes[series_path] = (mtime, index)
+        return index
+
+    def _save_index(self, symbol, interval, index):
+        series_path = self._series_path(symbol, interval)
+        index_path = os.path.join(series_path, self._INDEX_FILE)
+        os.makedirs(series_path, exist_ok=True)
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(index, f)
+        os.replace(index_path + '.tmp', index_path)
+        self._indexes[series_path] = (os.stat(index_path).st_mtime_ns, index)
+
+    def _scan_part(self, series_path, part):
+        """ Build the index entries of a file written without index
+        """
+        name = os.path.relpath(part, series_path).replace(os.sep, '/')
+        entries = []
+        for block, table in enumerate(self._read_blocks(part)):
+            dates = table.column('date').to_pandas()
+            entries.append({'file': name, 'block': block, 'rows': len(dates),
+                            'first': dates.min().isoformat(sep=' '),
+                            'last': dates.max().isoformat(sep=' ')})
+        return entries
+
+    def coverage(self, symbol, interval):
+        """ Return a tuple (first, last, full) with the first and last
+        timestamps stored for a series and whether a 'full' api call was
+        ever stored for it, or None if nothing is stored. Only the index of
+        the series is read.
+
+        Keyword Arguments:
+            symbol: The symbol of the series
+            interval: The interval of the series (i.e. '5min' or 'daily')
+        """
+        with self._lock:
+            index = self._index(symbol, interval)
+            if not index['blocks']:
+                return None
+            return (pandas.Timestamp(min(b['first'] for b in index['blocks'])),
+                    pandas.Timestamp(max(b['last'] for b in index['blocks'])),
+                    index['full'])
+
+    @staticmethod
+    def _read_part(part):
+        """ Read a file of the store as an arrow table, arrow files are
+        memory mapped instead of loaded
+        """
+        if part.endswith('.arrow'):
+            return pyarrow.ipc.open_file(pyarrow.memory_map(part)).read_all()
+        return pyarrow.parquet.read_table(part)
+
+    @staticmethod
+    def _read_blocks(part, blocks=None):
+        """ Read the given blocks (all of them by default) of a file of the
+        store as arrow tables
+        """
+        if part.endswith('.arrow'):
+            reader = pyarrow.ipc.open_file(pyarrow.memory_map(part))
+            blocks = range(reader.num_record_batches) if blocks is None \
+                else blocks
+            return [pyarrow.Table.from_batches([reader.get_batch(b)])
+                    for b in blocks]
+        reader = pyarrow.parquet.ParquetFile(part)
+        blocks = range(reader.num_row_groups) if blocks is None else blocks
+        return [reader.read_row_group(b) for b in blocks]
+
+    def append(self, symbol, interval, data, full=False):
+        """ Append new bars to a series. Bars already stored are skipped,
+        except the last stored one which may have been updated since, so
+        that the gaps inside the stored range are filled.
+
+        Keyword Arguments:
+            symbol: The symbol of the series
+            interval: The interval of the series (i.e. '5min' or 'daily')
+            data: A data frame indexed by date or the data of an api call
+            full: Whether the data is the whole history of the series, as
+                returned by 'full' api calls (default False)
+        """
+        frame = self._to_frame(data)
+        with self._lock:
+            coverage = self.coverage(symbol, interval)
+            if coverage is not None:
+                first, last, _ = coverage
+                inside = frame.index[(frame.index >= first) &
+                                     (frame.index < last)]
+                stored = self.read_table(symbol, interval, inside[0],
+                                         inside[-1]) if len(inside) else None
+                if stored is not None:
+                    frame = frame[~frame.index.isin(
+                        stored.column('date').to_numpy()) |
+                        (frame.index >= last)]
+            index = self._index(symbol, interval)
+            index = {'full': index['full'] or full,
+                     'blocks': list(index['blocks'])}
+            for month, part in frame.groupby(frame.index.strftime('%Y-%m')):
+                index['blocks'].extend(
+                    self._write_part(symbol, interval, month, part))
+            self._save_index(symbol, interval, index)
+        return len(frame)
+
+    def save(self, function_name, params, response, data_key):
+        """ Append the result of an api call to the store, calls which do
+        not return a time series are ignored.
+
+        Keyword Arguments:
+            function_name: The alpha vantage function (i.e. TIME_SERIES_DAILY)
+            params: Dictionary with the parameters of the call
+            response: The decoded json response of the api
+            data_key: The key for getting the data from the json object
+        """
+        key = series_key(function_name, params)
+        if key is not None and isinstance(response.get(data_key), dict):
+            self.append(key[0], key[1], response[data_key],
+                        full=params.get('outputsize') == 'full')
+
+    def read_table(self, symbol, interval, start=None, end=None):
+        """ Return the bars of a series between start and end (both included)
+        as an arrow table, loading only the blocks overlapping the range.
+        With arrow files the table is a zero-copy view of the memory mapped
+        files as long as the partitions hold no duplicated bars (compact()
+        removes them).
+
+        Keyword Arguments:
+            symbol: The symbol of the series
+            interval: The interval of the series (i.e. '5min' or 'daily')
+            start: The first date of the range, None for no lower bound
+            end: The last date of the range, None for no upper bound
+        """
+        start = pandas.Timestamp(start) if start is not None else None
+        end = pandas.Timestamp(end) if end is not None else None
+        with self._lock:
+            blocks = [b for b in self._index(symbol, interval)['blocks']
+                      if (start is None or pandas.Timestamp(b['last']) >= start)
+                      and (end is None or pandas.Timestamp(b['first']) <= end)]
+            # The files compacted meanwhile are kept until the read is done
+            self._readers += 1
+        try:
+            return self._read_blocks_range(symbol, interval, blocks, start,
+                                           end)
+        finally:
+            with self._lock:
+                self._readers -= 1
+                if not self._readers:
+                    self._remove_replaced()
+
+    def _remove_replaced(self):
+        """ Remove the files replaced by compact(), once no read holds them
+        """
+        for part in self._replaced:
+            os.remove(part)
+        self._replaced = []
+
+    def _read_blocks_range(self, symbol, interval, blocks, start, end):
+        """ Read the rows between start and end of the given index blocks
+        """
+        # Group the blocks by file, keeping the order in which they were
+        # written so that later versions of a bar win
+        files = {}
+        for block in blocks:
+            files.setdefault(block['file'], []).append(block['block'])
+        series_path = self._series_path(symbol, interval)
+        tables = []
+        for name, file_blocks in files.items():
+            part = os.path.join(series_path, *name.split('/'))
+            for table in self._read_blocks(part, file_blocks):
+                # Blocks are written sorted, so the range is a slice of them
+                dates = table.column('date').to_numpy()
+                lower = 0 if start is None else numpy.searchsorted(
+                    dates, numpy.datetime64(start), 'left')
+                upper = len(dates) if end is None else numpy.searchsorted(
+                    dates, numpy.datetime64(end), 'right')
+                if upper > lower:
+                    tables.append(table.slice(lower, upper - lower))
+        if not tables:
+            return None
+        table = pyarrow.concat_tables(tables)
+        dates = table.column('date').to_numpy()
+        if len(numpy.unique(dates)) != len(dates):
+            # Later files hold the most recent version of a bar
+            keep = ~pandas.Index(dates).duplicated(keep='last')
+            table = table.filter(pyarrow.array(keep))
+            dates = dates[keep]
+        if (numpy.diff(dates) < numpy.timedelta64(0)).any():
+            table = table.sort_by('date')
+        return table
+
+    def read(self, symbol, interval, start=None, end=None):
+        """ Return the bars of a series between start and end (both included)
+        as a data frame, opening only the partitions of the range.
+
+        Keyword Arguments:
+            symbol: The symbol of the series
+            interval: The interval of the series (i.e. '5min' or 'daily')
+            start: The first date of the range, None for no lower bound
+            end: The last date of the range, None for no upper bound
+        """
+        table = self.read_table(symbol, interval, start, end)
+        if table is None:
+            return pandas.DataFrame()
+        return table.to_pandas(split_blocks=True)
+
+    def compact(self, symbol=None, interval=None, force=False):
+        """ Merge the files of the month partitions holding more than
+        compact_threshold files into a single one. Returns the number of
+        partitions compacted.
+
+        Keyword Arguments:
+            symbol: Only compact this symbol, default all of them
+            interval: Only compact this interval, default all of them
+            force: Compact every partition with more than one file
+        """
+        compacted = 0
+        symbols = [symbol.upper()] if symbol else sorted(
+            s for s in os.listdir(self.path)
+            if os.path.isdir(os.path.join(self.path, s)))
+        for sym in symbols:
+            sym_path = os.path.join(self.path, sym)
+            if not os.path.isdir(sym_path):
+                continue
+            intervals = [interval] if interval else sorted(os.listdir(sym_path))
+            for ivl in intervals:
+                for month in self._months(sym, ivl):
+                    with self._lock:
+                        parts = self._parts(sym, ivl, month)
+                        limit = 1 if force else self.compact_threshold
+                        if len(parts) <= limit:
+                            continue
+                        frame = pandas.concat(
+                            self._read_part(p).to_pandas() for p in parts)
+                        frame = frame[~frame.index.duplicated(keep='last')]
+                        index = self._index(sym, ivl)
+                        blocks = [b for b in index['blocks']
+                                  if not b['file'].startswith(month + '/')]
+                        blocks.extend(self._write_part(
+                            sym, ivl, month, frame.sort_index()))
+                        self._save_index(sym, ivl, {'full': index['full'],
+                                                    'blocks': blocks})
+                        self._replaced.extend(parts)
+                        if not self._readers:
+                            self._remove_replaced()
+                    compacted += 1
+        return compacted
+
+    def start_compaction(self, every=300):
+        """ Run compact() in a background thread every given seconds
+
+        Keyword Arguments:
+            every: Seconds between two compactions (default 300)
+        """
+        if self._compaction is not None:
+            return
+        stop = threading.Event()
+
+        def _run():
+            while not stop.wait(every):
+                self.compact()
+        thread = threading.Thread(target=_run, daemon=True,
+                                  name='alpha_vantage-store-compaction')
+        self._compaction = (thread, stop)
+        thread.start()
+
+    def stop_compaction(self):
+        """ Stop the background compaction started by start_compaction()
+        """
+        if self._compaction is not None:
+            thread, stop = self._compaction
+            stop.set()
+            thread.join()
+            self._compaction = None
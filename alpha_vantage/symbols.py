@@ -0,0 +1,381 @@
+from bisect import bisect_left
+from collections import Counter
+import csv
+import io
+import json
+import os
+import re
+import threading
+import time
+
+# The fields of the matches of the SYMBOL_SEARCH function
+FIELDS = ['1. symbol', '2. name', '3. type', '4. region', '5. marketOpen',
+          '6. marketClose', '7. timezone', '8. currency', '9. matchScore']
+_SHORT = {re.sub(r'^\d+\. ', '', field): field for field in FIELDS}
+# The columns of a LISTING_STATUS file, with their search field
+_LISTING = {'symbol': '1. symbol', 'name': '2. name', 'assetType': '3. type'}
+_WORDS = re.compile(r'[^A-Z0-9.\-]+')
+
+
+def _terms(match):
+    """ The terms a match is found by, its symbol and the words of its name
+    """
+    terms = {match['1. symbol']}
+    terms.update(w for w in _WORDS.split(match.get('2. name', '').upper())
+                 if w)
+    return terms
+
+
+def _grams(term):
+    """ The trigrams of a term, padded so that its start counts more
+    """
+    term = '  {} '.format(term)
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def _match(record):
+    """ A match in the fields of the api, from a match with short or full
+    field names (a row of a search, a data frame or a listing)
+    """
+    match = {}
+    for key, value in record.items():
+        field = key if key in FIELDS else _SHORT.get(key) or _LISTING.get(key)
+        if field is not None and field != '9. matchScore' and \
+                value not in (None, ''):
+            match[field] = str(value)
+    if not match.get('1. symbol'):
+        return None
+    match['1. symbol'] = match['1. symbol'].upper()
+    return match
+
+
+def _records(result):
+    """ The matches of a search result in any output format: a data frame,
+    a list of dictionaries or a csv reader (its first row as header)
+    """
+    if hasattr(result, 'to_dict'):
+        return result.to_dict('records')
+    rows = iter(result)
+    for row in rows:
+        if isinstance(row, dict):
+            return [row] + list(rows)
+        return [dict(zip(row, values)) for values in rows]
+    return []
+
+
+class SymbolIndex(object):
+    """ Local index of the symbols answering the prefix and fuzzy searches
+    in microseconds. It is populated with the matches of SYMBOL_SEARCH calls
+    and can be seeded with a listing of all the symbols (the csv of the
+    LISTING_STATUS function).
+
+    A query matches the symbols and the names whose words start with each
+    of its words. A query matching nothing is compared to all the terms by
+    their trigrams, so that typos are still found.
+
+    With a path, the matches and the keywords already searched are kept in
+    a json file and survive the process. A seed is saved right away, the
+    api searches at most every save_interval seconds: call save() before
+    the process exits to keep the last ones.
+    """
+
+    def __init__(self, path=None, fuzzy=0.4, save_interval=30.):
+        """ Initialize the index
+
+        Keyword Arguments:
+            path: The json file where the index is kept, None to keep it in
+                memory only (default None)
+            fuzzy: The minimal trigram similarity of a fuzzy match, between 0
+                and 1, None to disable the fuzzy search (default 0.4)
+            save_interval: The minimal time in seconds between two saves
+                of the recorded searches, 0 to save each of them
+                (default 30)
+        """
+        self.path = path
+        self.fuzzy = fuzzy
+        self.save_interval = save_interval
+        self._matches = {}
+        self._searched = {}
+        self._terms = []
+        self._grams = {}
+        self._sizes = {}
+        self._dirty = False
+        # Whether the index changed since it was last saved, and when
+        self._unsaved = False
+        self._saved = None
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            self._searched = saved['searched']
+            self.add(saved['matches'])
+
+    def __len__(self):
+        return len(self._matches)
+
+    def __contains__(self, symbol):
+        return symbol.upper() in self._matches
+
+    @staticmethod
+    def normalize(keywords):
+        """ The form of keywords the index is queried with
+        """
+        return ' '.join(w for w in _WORDS.split(keywords.upper()) if w)
+
+    def add(self, matches):
+        """ Merge matches in the index, the fields of a known symbol being
+        updated. Return the number of new symbols
+
+        Keyword Arguments:
+            matches: The matches, as returned by get_symbol_search in any
+                output format or as a list of dictionaries
+        """
+        added = 0
+        with self._lock:
+            for record in _records(matches):
+                match = _match(record)
+                if match is None:
+                    continue
+                known = self._matches.get(match['1. symbol'])
+                if known is None:
+                    self._matches[match['1. symbol']] = match
+                    added += 1
+                else:
+                    known.update(match)
+                self._dirty = True
+                self._unsaved = True
+        return added
+
+    def seed(self, listing):
+        """ Add all the symbols of a listing and save the index, return the
+        number of new ones
+
+        Keyword Arguments:
+            listing: The csv of the LISTING_STATUS function, as a path, an
+                open file, its text or its rows
+        """
+        if isinstance(listing, str):
+            if '\n' in listing:
+                listing = io.StringIO(listing)
+            else:
+                with open(listing, newline='') as f:
+                    added = self.add(csv.DictReader(f))
+                self.save()
+                return added
+        if hasattr(listing, 'read'):
+            listing = csv.DictReader(listing)
+        added = self.add(listing)
+        self.save()
+        return added
+
+    def _build(self):
+        """ Sort the terms and index their trigrams, once per change
+        """
+        terms = sorted({(term, symbol) for symbol, match
+                        in self._matches.items() for term in _terms(match)})
+        grams, sizes = {}, {}
+        for term in {term for term, _ in terms}:
+            term_grams = _grams(term)
+            sizes[term] = len(term_grams)
+            for gram in term_grams:
+                grams.setdefault(gram, []).append(term)
+        self._terms, self._grams, self._sizes = terms, grams, sizes
+        self._dirty = False
+
+    def _prefixed(self, word):
+        """ The symbols with a term starting with word, with the shortest
+        such term
+        """
+        found = {}
+        i = bisect_left(self._terms, (word,))
+        while i < len(self._terms) and self._terms[i][0].startswith(word):
+            term, symbol = self._terms[i]
+            if len(term) < len(found.get(symbol, term + ' ')):
+                found[symbol] = term
+            i += 1
+        return found
+
+    def _similar(self, word):
+        """ The terms similar to word, with their trigram similarity
+        """
+        grams = _grams(word)
+        shared = Counter(term for gram in grams
+                         for term in self._grams.get(gram, ()))
+        similar = {}
+        for term, count in shared.items():
+            score = count / (len(grams) + self._sizes[term] - count)
+            if score >= self.fuzzy:
+                similar[term] = score
+        return similar
+
+    def search(self, keywords, limit=10):
+        """ Return the best matches of keywords in the index, in the format
+        of get_symbol_search in json (a list of dictionaries), the local
+        score being given as matchScore
+
+        Keyword Arguments:
+            keywords: The keywords to search
+            limit: The maximum number of matches (default 10)
+        """
+        words = self.normalize(keywords).split()
+        if not words:
+            return []
+        with self._lock:
+            if self._dirty:
+                self._build()
+            scores = self._score(words)
+            if not scores and self.fuzzy is not None:
+                scores = self._score_fuzzy(words)
+            # The matches the api returned for the same keywords
+            for symbol, score in self._searched.get(' '.join(words),
+                                                    {}).items():
+                if symbol in self._matches:
+                    scores[symbol] = max(scores.get(symbol, 0.), score)
+            best = sorted(scores, key=lambda s: (-scores[s], len(s), s))
+            return [dict(self._matches[symbol],
+                         **{'9. matchScore': '{:.4f}'.format(scores[symbol])})
+                    for symbol in best[:limit]]
+
+    def _score(self, words):
+        """ Score the symbols with a term starting with each word, by the
+        part of the terms matched, the symbol counting twice the name
+        """
+        scores = None
+        for word in words:
+            found = self._prefixed(word)
+            if scores is not None:
+                found = {s: t for s, t in found.items() if s in scores}
+            scores = {s: (scores or {}).get(s, 0.) + len(word) / len(t) *
+                      (1. if t == s else .5) for s, t in found.items()}
+            if not scores:
+                return {}
+        return {s: score / len(words) for s, score in scores.items()}
+
+    def _score_fuzzy(self, words):
+        """ Score the symbols with a term similar to each word
+        """
+        scores = None
+        for word in words:
+            found = {}
+            for term, similarity in self._similar(word).items():
+                for symbol in self._prefixed(term):
+                    found[symbol] = max(found.get(symbol, 0.), similarity)
+            if scores is not None:
+                found = {s: v + scores[s] for s, v in found.items()
+                         if s in scores}
+            scores = found
+            if not scores:
+                return {}
+        return {s: .5 * score / len(words) for s, score in scores.items()}
+
+    def searched(self, keywords):
+        """ Whether the api was already searched with keywords
+
+        Keyword Arguments:
+            keywords: The keywords of the search
+        """
+        return self.normalize(keywords) in self._searched
+
+    def record(self, keywords, result):
+        """ Merge the result of an api search in the index and remember its
+        keywords with the scores of its matches, which are returned by the
+        next searches of the same keywords. The index is saved when the last
+        save is older than save_interval. Return the number of new symbols
+
+        Keyword Arguments:
+            keywords: The keywords of the search
+            result: The matches returned by get_symbol_search
+        """
+        records = _records(result)
+        added = self.add(records)
+        scores = {}
+        for record in records:
+            match = _match(record)
+            if match is not None:
+                score = record.get('9. matchScore', record.get('matchScore'))
+                try:
+                    scores[match['1. symbol']] = float(score)
+                except (TypeError, ValueError):
+                    scores[match['1. symbol']] = 0.
+        with self._lock:
+            self._searched[self.normalize(keywords)] = scores
+            self._unsaved = True
+            due = self._saved is None or \
+                time.monotonic() - self._saved >= self.save_interval
+        if due:
+            self.save()
+        return added
+
+    def save(self):
+        """ Write the index to its file, if it has one and it changed since
+        the last save
+        """
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._unsaved:
+                return
+            saved = {'matches': list(self._matches.values()),
+                     'searched': dict(self._searched)}
+            self._unsaved = False
+            self._saved = time.monotonic()
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(saved, f)
+        os.replace(temporary, self.path)
+
+
+class SymbolSearch(object):
+    """
+    Symbol search answering from a SymbolIndex and calling the
+    SYMBOL_SEARCH function of a TimeSeries client only on a miss, i.e. for
+    keywords never searched which match fewer than min_matches symbols in
+    the index. The matches of the calls are merged into the index.
+
+        search = SymbolSearch(ts, SymbolIndex('symbols.json'))
+        search.index.seed('listing_status.csv')
+        matches = search.search('micro')
+    """
+
+    def __init__(self, client, index=None, min_matches=1):
+        """ Initialize the search
+
+        Keyword Arguments:
+            client: The TimeSeries client calling the api on a miss
+            index: The SymbolIndex answering the searches, a new one in
+                memory by default (default None)
+            min_matches: The matches in the index below which the api is
+                called (default 1)
+        """
+        self.client = client
+        self.index = SymbolIndex() if index is None else index
+        self.min_matches = min_matches
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def _hit(self, keywords, limit):
+        """ The matches of the index, None on a miss
+        """
+        matches = self.index.search(keywords, limit=limit)
+        if len(matches) >= min(self.min_matches, limit) or \
+                self.index.searched(keywords):
+            self.stats['hits'] += 1
+            self.client._report_cached('SYMBOL_SEARCH')
+            return matches
+        self.stats['misses'] += 1
+        return None
+
+    def search(self, keywords, limit=10):
+        """ Return the best matches of keywords as a list of dictionaries
+        in the format of the SYMBOL_SEARCH function. It raises ValueError
+        when the api call fails
+
+        Keyword Arguments:
+            keywords: The keywords to search
+            limit: The maximum number of matches (default 10)
+        """
+        matches = self._hit(keywords, limit)
+        if matches is None:
+            result, _ = self.client.get_symbol_search(keywords)
+            self.index.record(keywords, result)
+            matches = self.index.search(keywords, limit=limit)
+        return matches
@@ -20,7 +20,9 @@ class TimeSeries(av):
             outputsize:  The size of the call, supported values are
                 'compact' and 'full; the first returns the last 100 points in the
                 data series, and 'full' returns the full-length intraday times
-                series, commonly above 1MB (default 'compact')
+                series, commonly above 1MB. 'auto' picks the cheapest of
+                both given the cached data and the start date of the call
+                (default 'compact')
             month: If not None, specify a year and month to get data, supported
                 format is YYYY-MM. For example "2009-01" (default None)
             extended_hours: By default, extended_hours=true and the output time series 
@@ -67,7 +69,9 @@ class TimeSeries(av):
             outputsize:  The size of the call, supported values are
                 'compact' and 'full; the first returns the last 100 points in the
                 data series, and 'full' returns the full-length daily times
-                series, commonly above 1MB (default 'compact')
+                series, commonly above 1MB. 'auto' picks the cheapest of
+                both given the cached data and the start date of the call
+                (default 'compact')
         """
         _FUNCTION_KEY = "TIME_SERIES_DAILY"
         return _FUNCTION_KEY, 'Time Series (Daily)', 'Meta Data'
@@ -85,7 +89,9 @@ class TimeSeries(av):
             outputsize:  The size of the call, supported values are
                 'compact' and 'full; the first returns the last 100 points in the
                 data series, and 'full' returns the full-length daily times
-                series, commonly above 1MB (default 'compact')
+                series, commonly above 1MB. 'auto' picks the cheapest of
+                both given the cached data and the start date of the call
+                (default 'compact')
         """
         _FUNCTION_KEY = "TIME_SERIES_DAILY_ADJUSTED"
         return _FUNCTION_KEY, 'Time Series (Daily)', 'Meta Data'
@@ -0,0 +1,261 @@
+from contextvars import ContextVar, copy_context
+import itertools
+import threading
+import time
+# OpenTelemetry is optional, the clients trace with it when tracer=True
+try:
+    from opentelemetry import trace as _otel_trace
+    _OPENTELEMETRY_FOUND = True
+except ImportError:
+    _OPENTELEMETRY_FOUND = False
+
+# The trace of the api call running in the current thread or task
+_current_trace = ContextVar('alpha_vantage_call_trace', default=None)
+
+
+class _NoopContext(object):
+    """ Context used instead of a span when tracing is disabled
+    """
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP = _NoopContext()
+
+
+def get_tracer(tracer):
+    """ Return the tracer given to a client
+
+    Keyword Arguments:
+        tracer: None to disable tracing, True to trace with OpenTelemetry
+            (its global tracer provider) or a tracer object, either an
+            OpenTelemetry tracer or a SpanRecorder
+    """
+    if tracer is True:
+        if not _OPENTELEMETRY_FOUND:
+            raise ValueError("The opentelemetry library was not found, "
+                             "therefore tracer=True can not be used, please "
+                             "install opentelemetry-api or give a tracer")
+        return _otel_trace.get_tracer('alpha_vantage')
+    return tracer or None
+
+
+class _CallTrace(object):
+    """ The tracer and span of an api call, with the moment its response
+    was handed to the output formatting
+    """
+    __slots__ = ('tracer', 'span', 'formatting')
+
+    def __init__(self, tracer, span):
+        self.tracer = tracer
+        self.span = span
+        self.formatting = None
+
+
+class _TracedCall(object):
+    """ Context of a traced api call, it opens the parent span of the call
+    and closes it with the span of the output formatting
+    """
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self._context = self.tracer.start_as_current_span(self.name)
+        span = self._context.__enter__()
+        self._trace = _CallTrace(self.tracer, span)
+        self._token = _current_trace.set(self._trace)
+        return span
+
+    def __exit__(self, *exc_info):
+        _current_trace.reset(self._token)
+        if self._trace.formatting is not None:
+            self.tracer.start_span('format',
+                                   start_time=self._trace.formatting).end()
+        return self._context.__exit__(*exc_info)
+
+
+def trace_call(tracer, name):
+    """ Return the context of an api call, a span named after the method
+    called when the client has a tracer. Calls nested in a traced call (the
+    inner decorators) are not traced again.
+
+    Keyword Arguments:
+        tracer: The tracer of the client, None when tracing is disabled
+        name: The name of the span
+    """
+    if tracer is None or _current_trace.get() is not None:
+        return _NOOP
+    return _TracedCall(tracer, name)
+
+
+def stage(name):
+    """ Return the context of a stage of the current api call, a child span
+    when the call is traced
+
+    Keyword Arguments:
+        name: The name of the stage (i.e. 'http')
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP
+    return trace.tracer.start_as_current_span(name)
+
+
+def stage_since(name, start_time):
+    """ Record a stage of the current api call that started at start_time
+    (nanoseconds since the epoch, see time.time_ns) and ends now
+
+    Keyword Arguments:
+        name: The name of the stage (i.e. 'url_build')
+        start_time: The start of the stage
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tracer.start_span(name, start_time=start_time).end()
+
+
+def set_attributes(**attributes):
+    """ Set attributes (prefixed with alpha_vantage.) on the span of the
+    current api call, when it is traced
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        for key, value in attributes.items():
+            if value is not None:
+                trace.span.set_attribute('alpha_vantage.' + key, value)
+
+
+def trace_response():
+    """ Mark the moment the response of the current api call is handed to
+    the output formatting
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.formatting = time.time_ns()
+
+
+def is_tracing():
+    """ Return whether the current api call is traced
+    """
+    return _current_trace.get() is not None
+
+
+def propagate(func):
+    """ Return a callable running func in a copy of the current context, so
+    that the spans opened by func in another thread (i.e. submitted to a
+    thread pool) are children of the current span
+    """
+    context = copy_context()
+
+    def _propagated(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+    return _propagated
+
+
+class RecordedSpan(object):
+    """ A span kept in memory by a SpanRecorder
+    """
+
+    def __init__(self, name, span_id, parent_id, start_time, attributes):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start_time = start_time
+        self.end_time = None
+        self.attributes = dict(attributes or {})
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, end_time=None):
+        self.end_time = end_time if end_time is not None else time.time_ns()
+
+    @property
+    def duration(self):
+        """ Duration of the span in seconds, None while it is open
+        """
+        if self.end_time is None:
+            return None
+        return (self.end_time - self.start_time) / 1e9
+
+    def as_dict(self):
+        return {'name': self.name, 'span_id': self.span_id,
+                'parent_id': self.parent_id, 'start_time': self.start_time,
+                'end_time': self.end_time, 'attributes': self.attributes}
+
+
+class _RecordedSpanContext(object):
+
+    def __init__(self, recorder, name, attributes):
+        self.recorder = recorder
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self._span = self.recorder.start_span(self.name,
+                                              attributes=self.attributes)
+        self._token = self.recorder._current.set(self._span)
+        return self._span
+
+    def __exit__(self, *exc_info):
+        self.recorder._current.reset(self._token)
+        if exc_info[1] is not None:
+            self._span.set_attribute('error', repr(exc_info[1]))
+        self._span.end()
+        return False
+
+
+class SpanRecorder(object):
+    """ Minimal tracer keeping the spans in memory, for when OpenTelemetry
+    is not installed or to inspect the spans of a few calls. It implements
+    the part of the OpenTelemetry tracer interface used by the clients.
+    """
+
+    def __init__(self, max_spans=10000):
+        """ Initialize the recorder
+
+        Keyword Arguments:
+            max_spans: Number of spans kept, the oldest go first (default
+                10000)
+        """
+        self.max_spans = max_spans
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._current = ContextVar('alpha_vantage_recorded_span',
+                                   default=None)
+        self._lock = threading.Lock()
+
+    def start_span(self, name, start_time=None, attributes=None):
+        """ Start a span, child of the current span
+        """
+        parent = self._current.get()
+        span = RecordedSpan(name, next(self._ids),
+                            parent.span_id if parent is not None else None,
+                            start_time if start_time is not None
+                            else time.time_ns(), attributes)
+        with self._lock:
+            self.spans.append(span)
+            if len(self.spans) > self.max_spans:
+                del self.spans[:len(self.spans) - self.max_spans]
+        return span
+
+    def start_as_current_span(self, name, attributes=None):
+        """ Return a context starting a span and making it the current span
+        """
+        return _RecordedSpanContext(self, name, attributes)
+
+    def children(self, span):
+        """ Return the spans whose parent is span
+        """
+        return [s for s in self.spans if s.parent_id == span.span_id]
+
+    def export(self):
+        """ Return the recorded spans as a list of dictionaries
+        """
+        return [span.as_dict() for span in self.spans]
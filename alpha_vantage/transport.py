@@ -0,0 +1,176 @@
+from collections import namedtuple
+import os
+import time
+from urllib.parse import urlsplit, parse_qsl
+import requests
+
+TransportResponse = namedtuple('TransportResponse',
+                               ['status', 'body', 'headers', 'timings'])
+TransportResponse.__new__.__defaults__ = (None,)
+TransportResponse.__doc__ = """ Answer of a transport: the http status, the
+raw body (bytes), a dictionary with the headers of the response and,
+optionally, a dictionary with the durations of the dns, connect (or ttfb)
+and transfer steps of the call in seconds """
+
+
+def check_status(response):
+    """ Return a TransportResponse, raising a ValueError with the http
+    status when the call failed (i.e. 404 or 5xx), before its body reaches
+    the decoding
+
+    Keyword Arguments:
+        response: The TransportResponse of the call
+    """
+    if response.status >= 400:
+        raise ValueError('Error getting data from the api, http status '
+                         '{}: {}'.format(response.status,
+                                         response.body[:200].decode(
+                                             'utf-8', 'replace')))
+    return response
+
+
+class RequestsTransport(object):
+    """ Transport sending the calls with the requests library, the default
+    transport of the clients
+    """
+
+    def __init__(self, session=None):
+        """ Initialize the transport
+
+        Keyword Arguments:
+            session: A requests.Session reused for the calls, to keep the
+                connections alive. None to use a new connection per call
+        """
+        self.session = session
+
+    def send(self, url, headers=None, proxy=None):
+        """ Send a call and return its TransportResponse. It raises a
+        ValueError when the http status tells the call failed
+
+        Keyword Arguments:
+            url: The url of the call
+            headers: Dictionary with the headers of the call
+            proxy: Dictionary mapping protocol or protocol and hostname to
+                the URL of the proxy.
+        """
+        get = self.session.get if self.session is not None else requests.get
+        start = time.perf_counter()
+        response = get(url, proxies=proxy or {}, headers=headers or {})
+        # requests only tells the time until the headers of the response
+        # arrived, the dns and connect steps are part of it
+        ttfb = response.elapsed.total_seconds()
+        timings = {'dns': None, 'connect': None, 'ttfb': ttfb,
+                   'transfer': max(0., time.perf_counter() - start - ttfb)}
+        return check_status(TransportResponse(
+            response.status_code, response.content, dict(response.headers),
+            timings))
+
+
+class ReplayTransport(object):
+    """ Transport answering the calls from responses held in memory (i.e.
+    the fixture files of the tests), without any network. Useful to run the
+    parsing pipeline in isolation and at full speed.
+    """
+
+    def __init__(self, responses=None):
+        """ Initialize the transport
+
+        Keyword Arguments:
+            responses: Dictionary mapping either a full url or an api
+                function name (i.e. 'TIME_SERIES_DAILY') to the body of its
+                response (bytes or str)
+        """
+        self.responses = {}
+        self.calls = []
+        for match, body in (responses or {}).items():
+            self.add(match, body)
+
+    def add(self, match, body=None, path=None):
+        """ Add a response to replay
+
+        Keyword Arguments:
+            match: A full url or an api function name
+            body: The body of the response (bytes or str)
+            path: A file holding the body, read once into memory
+        """
+        if path is not None:
+            with open(path, 'rb') as f:
+                body = f.read()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.responses[match] = body
+
+    @classmethod
+    def from_directory(cls, path, files):
+        """ Build a transport replaying the files of a directory
+
+        Keyword Arguments:
+            path: The directory holding the files
+            files: Dictionary mapping a full url or an api function name to
+                the name of its file in the directory
+        """
+        transport = cls()
+        for match, name in files.items():
+            transport.add(match, path=os.path.join(path, name))
+        return transport
+
+    def _lookup(self, url):
+        body = self.responses.get(url)
+        if body is None:
+            function = dict(parse_qsl(urlsplit(url).query)).get('function')
+            body = self.responses.get(function)
+        if body is None:
+            return TransportResponse(404, b'', {})
+        content_type = 'application/json' if body.lstrip().startswith(b'{') \
+            else 'text/csv'
+        return TransportResponse(200, body, {'Content-Type': content_type})
+
+    def send(self, url, headers=None, proxy=None):
+        """ Return the TransportResponse recorded for a call. It raises a
+        ValueError (http status 404) when none was recorded
+
+        Keyword Arguments:
+            url: The url of the call
+            headers: Dictionary with the headers of the call (ignored)
+            proxy: The proxy configuration (ignored)
+        """
+        self.calls.append(url)
+        return check_status(self._lookup(url))
+
+
+class EndpointTransport(object):
+    """ Transport sending the calls to another endpoint, such as a local
+    stand-in server or a replay server, through another transport. The query
+    of the calls is kept, the scheme, host and path are replaced.
+    """
+
+    def __init__(self, endpoint, transport=None):
+        """ Initialize the transport
+
+        Keyword Arguments:
+            endpoint: The url the calls are sent to (i.e.
+                http://localhost:8080/query)
+            transport: The transport used to send them, default a
+                RequestsTransport
+        """
+        self.endpoint = endpoint.rstrip('?&')
+        self.transport = transport if transport is not None \
+            else RequestsTransport()
+
+    def rewrite(self, url):
+        """ Return the url of a call pointed to the endpoint
+        """
+        query = urlsplit(url).query
+        return '{}{}{}'.format(self.endpoint, '&' if '?' in self.endpoint
+                               else '?', query)
+
+    def send(self, url, headers=None, proxy=None):
+        """ Send a call to the endpoint and return its TransportResponse
+
+        Keyword Arguments:
+            url: The url of the call
+            headers: Dictionary with the headers of the call
+            proxy: The proxy configuration of the client
+        """
+        return self.transport.send(self.rewrite(url), headers=headers,
+                                   proxy=proxy)
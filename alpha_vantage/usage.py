@@ -0,0 +1,172 @@
+from collections import deque
+import csv
+import io
+import json
+import threading
+import time
+
+DIMENSIONS = ('function', 'symbol', 'key', 'tag')
+COUNTERS = ('calls', 'api_requests', 'cache_served', 'coalesced', 'reused',
+            'throttled', 'errors')
+
+
+class UsageMeter(object):
+    """ Hook accounting for the usage of the quota of the keys. It counts
+    the calls made, the requests that reached the api, the calls served by
+    a cache (the caching proxy or the local caches of the clients) or
+    coalesced with an identical call, the responses whose conversion was
+    reused (the sector snapshots) and the throttled answers,
+    broken down by function, symbol, key (masked) and tag. Calls are tagged
+    with the tag option of the api calls, i.e.
+    ts.get_daily('MSFT', tag='reports').
+
+    A meter may be shared by all the clients using the same keys, give it to
+    them with usage=meter.
+    """
+
+    def __init__(self, calls_per_day=None, rate_window=900.):
+        """ Initialize the meter
+
+        Keyword Arguments:
+            calls_per_day: The daily quota of the keys, used to project when
+                it runs out (default None, no projection)
+            rate_window: Seconds over which the current rate of requests is
+                measured for the projection (default 900)
+        """
+        self.calls_per_day = calls_per_day
+        self.rate_window = rate_window
+        self._counters = {}
+        # Requests that reached the api, per minute, over the last day
+        self._minutes = deque()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _clock():
+        return time.time()
+
+    def __call__(self, event):
+        served = event.cache in ('hit', 'coalesced')
+        requests = 0 if served else event.requests
+        row = (event.function, event.symbol, event.key, event.tag)
+        with self._lock:
+            counters = self._counters.get(row)
+            if counters is None:
+                counters = self._counters[row] = dict.fromkeys(COUNTERS, 0)
+            counters['calls'] += 1
+            counters['api_requests'] += requests
+            counters['cache_served'] += event.cache == 'hit'
+            counters['coalesced'] += event.cache == 'coalesced'
+            counters['reused'] += event.cache == 'reused'
+            counters['throttled'] += event.throttled
+            counters['errors'] += event.error is not None
+            if requests:
+                minute = int(self._clock() // 60)
+                if self._minutes and self._minutes[-1][0] == minute:
+                    self._minutes[-1][1] += requests
+                else:
+                    self._minutes.append([minute, requests])
+                self._expire(minute)
+
+    def _expire(self, minute):
+        while self._minutes and self._minutes[0][0] <= minute - 1440:
+            self._minutes.popleft()
+
+    def reset(self):
+        """ Forget the usage counted so far
+        """
+        with self._lock:
+            self._counters.clear()
+            self._minutes.clear()
+
+    def rows(self, by=DIMENSIONS):
+        """ Return the counters grouped by some of the dimensions, as a list
+        of dictionaries sorted by requests made to the api
+
+        Keyword Arguments:
+            by: The dimensions kept, among function, symbol, key and tag
+                (default all of them)
+        """
+        unknown = set(by) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError('Usage dimensions: {} not supported, only {} '
+                             'are'.format(sorted(unknown), DIMENSIONS))
+        positions = [DIMENSIONS.index(d) for d in by]
+        grouped = {}
+        with self._lock:
+            for row, counters in self._counters.items():
+                group = tuple(row[p] for p in positions)
+                totals = grouped.setdefault(group, dict.fromkeys(COUNTERS, 0))
+                for name in COUNTERS:
+                    totals[name] += counters[name]
+        rows = [dict(zip(by, group), **totals)
+                for group, totals in grouped.items()]
+        return sorted(rows, key=lambda r: (-r['api_requests'], -r['calls']))
+
+    def projection(self, now=None):
+        """ Return the requests made over the last 24 hours, the current
+        rate (requests per minute over the rate window) and, when the daily
+        quota is known, the requests left and the seconds and time (epoch)
+        at which it runs out at the current rate (None if it does not)
+
+        Keyword Arguments:
+            now: The current time (epoch seconds), default now
+        """
+        now = self._clock() if now is None else now
+        minute = int(now // 60)
+        with self._lock:
+            self._expire(minute)
+            used = sum(count for _, count in self._minutes)
+            first = minute - int(self.rate_window // 60)
+            recent = sum(count for m, count in self._minutes if m > first)
+        rate = recent / (self.rate_window / 60.)
+        projection = {'used': used, 'rate_per_minute': rate,
+                      'calls_per_day': self.calls_per_day, 'remaining': None,
+                      'exhausted_in': None, 'exhausted_at': None}
+        if self.calls_per_day is not None:
+            remaining = max(0, self.calls_per_day - used)
+            projection['remaining'] = remaining
+            if remaining == 0:
+                projection['exhausted_in'] = 0.
+            elif rate > 0:
+                projection['exhausted_in'] = remaining / rate * 60.
+            if projection['exhausted_in'] is not None:
+                projection['exhausted_at'] = now + projection['exhausted_in']
+        return projection
+
+    def snapshot(self, by=DIMENSIONS):
+        """ Return a dictionary with the time, the totals, the rows grouped
+        by the given dimensions and the quota projection
+
+        Keyword Arguments:
+            by: The dimensions kept in the rows (default all of them)
+        """
+        totals = self.rows(by=())
+        return {'time': self._clock(),
+                'totals': totals[0] if totals else dict.fromkeys(COUNTERS, 0),
+                'rows': self.rows(by=by), 'projection': self.projection()}
+
+    def export(self, path=None, output_format='json', by=DIMENSIONS):
+        """ Return the usage as a json document (the snapshot) or as csv
+        (the rows), writing it to a file when a path is given
+
+        Keyword Arguments:
+            path: The file written, None to only return the content
+            output_format: 'json' or 'csv' (default 'json')
+            by: The dimensions kept in the rows (default all of them)
+        """
+        if output_format == 'json':
+            content = json.dumps(self.snapshot(by=by), indent=2)
+        elif output_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=list(by) +
+                                    list(COUNTERS))
+            writer.writeheader()
+            writer.writerows(self.rows(by=by))
+            content = buffer.getvalue()
+        else:
+            raise ValueError('Export format: {} is not supported, only json '
+                             'and csv are'.format(output_format))
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(content)
+        return content
@@ -0,0 +1,46 @@
+""" Full size payloads for the benchmarks, built by scaling up the fixtures
+of the tests (test_alpha_vantage/test_data) to the number of rows returned
+by the api with outputsize='full'.
+"""
+from datetime import datetime, timedelta
+from itertools import cycle
+import json
+import os
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'test_alpha_vantage', 'test_data')
+
+# name: (fixture file, data key of the fixture, api function, data key of
+# the payload, spacing of the rows, format of the dates)
+SCENARIOS = {
+    'intraday': ('mock_time_series', 'Time Series (1min)',
+                 'TIME_SERIES_INTRADAY', 'Time Series (1min)',
+                 timedelta(minutes=1), '%Y-%m-%d %H:%M:%S'),
+    'daily': ('mock_time_series', 'Time Series (1min)',
+              'TIME_SERIES_DAILY', 'Time Series (Daily)',
+              timedelta(days=1), '%Y-%m-%d'),
+    'sma': ('mock_technical_indicator', 'Technical Analysis: SMA',
+            'SMA', 'Technical Analysis: SMA',
+            timedelta(minutes=15), '%Y-%m-%d %H:%M'),
+}
+
+
+def scale_fixture(scenario, rows, last=datetime(2020, 12, 18, 16)):
+    """ Return the body (bytes) of a response of the scenario holding the
+    given number of rows. The values of the fixture are repeated on
+    consecutive dates going back from last.
+
+    Keyword Arguments:
+        scenario: The name of the scenario (a key of SCENARIOS)
+        rows: The number of rows of the payload
+        last: The date of the most recent row
+    """
+    name, source_key, _, data_key, step, date_format = SCENARIOS[scenario]
+    with open(os.path.join(TEST_DATA, name)) as f:
+        fixture = json.load(f)
+    values = cycle(list(fixture.pop(source_key).values()))
+    data = {}
+    for row in range(rows):
+        data[(last - row * step).strftime(date_format)] = next(values)
+    fixture[data_key] = data
+    return json.dumps(fixture, indent=4).encode('utf-8')
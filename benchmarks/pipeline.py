@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+""" Benchmark of the request -> DataFrame pipeline of the clients, offline.
+
+The calls are answered by a local mock server (or, with --transport replay,
+directly from memory) with the fixtures of the tests scaled up to full size
+payloads. Every call is split in stages, timed separately:
+
+    url_build       from the call to the request (argument handling, url)
+    http            round trip to the server
+    json_decode     decoding and checking of the response
+    dataframe       building of the output (DataFrame or dictionary)
+    datetime_index  conversion of the index to datetimes
+
+Run it from the root of the repository, for the sync and the async clients:
+
+    python -m benchmarks.pipeline --rows 100 5000 --output results.json
+    python -m benchmarks.pipeline --compare results.json
+"""
+import argparse
+import asyncio
+from contextlib import contextmanager
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+
+from aiohttp import web
+import pandas
+
+from alpha_vantage.timeseries import TimeSeries
+from alpha_vantage.techindicators import TechIndicators
+from alpha_vantage.transport import ReplayTransport
+from alpha_vantage.async_support.timeseries import TimeSeries as \
+    AsyncTimeSeries
+from alpha_vantage.async_support.techindicators import TechIndicators as \
+    AsyncTechIndicators
+from alpha_vantage.async_support.transport import ReplayTransport as \
+    AsyncReplayTransport
+from benchmarks.fixtures import SCENARIOS, scale_fixture
+
+STAGES = ('url_build', 'http', 'json_decode', 'dataframe', 'datetime_index',
+          'total')
+
+# name: (sync client, async client, method, arguments)
+CALLS = {
+    'intraday': (TimeSeries, AsyncTimeSeries, 'get_intraday',
+                 {'symbol': 'MSFT', 'interval': '1min', 'outputsize': 'full'}),
+    'daily': (TimeSeries, AsyncTimeSeries, 'get_daily',
+              {'symbol': 'MSFT', 'outputsize': 'full'}),
+    'sma': (TechIndicators, AsyncTechIndicators, 'get_sma',
+            {'symbol': 'MSFT', 'interval': '15min'}),
+}
+
+
+def replay_transport(rows):
+    """ A ReplayTransport answering every scenario with payloads of the
+    given number of rows
+    """
+    transport = ReplayTransport()
+    for scenario in SCENARIOS:
+        transport.add(SCENARIOS[scenario][2], scale_fixture(scenario, rows))
+    return transport
+
+
+class MockServer(object):
+    """ Local http server answering the /query calls from a ReplayTransport,
+    running in a thread of its own
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.replay = ReplayTransport()
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+
+    async def _handle(self, request):
+        response = self.replay._lookup(request.path_qs)
+        return web.Response(status=response.status, body=response.body,
+                            content_type=response.headers.get(
+                                'Content-Type', 'application/json'))
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get('/query', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start())
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+
+    def start(self):
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    @property
+    def url(self):
+        return 'http://{}:{}/query?'.format(self.host, self.port)
+
+
+class _Probe(object):
+    """ Collects the timestamps of the stages of a call
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.request = [0., 0.]
+        self.http = 0.
+        self.to_datetime = 0.
+
+
+class _TimedTransport(object):
+    """ Transport timing the round trips of another transport
+    """
+
+    def __init__(self, transport, probe):
+        self.transport = transport
+        self.probe = probe
+
+    def send(self, url, headers=None, proxy=None):
+        start = time.perf_counter()
+        try:
+            return self.transport.send(url, headers=headers, proxy=proxy)
+        finally:
+            self.probe.http += time.perf_counter() - start
+
+
+class _AsyncTimedTransport(_TimedTransport):
+
+    async def send(self, url, headers=None, proxy=None):
+        start = time.perf_counter()
+        try:
+            return await self.transport.send(url, headers=headers,
+                                             proxy=proxy)
+        finally:
+            self.probe.http += time.perf_counter() - start
+
+    async def close(self):
+        await self.transport.close()
+
+
+def _instrument(client, probe, is_async):
+    """ Time the request of the client, the frame building is what comes
+    after it
+    """
+    request = client._request
+
+    if is_async:
+        async def _timed_request(*args, **kwargs):
+            probe.request[0] = time.perf_counter()
+            try:
+                return await request(*args, **kwargs)
+            finally:
+                probe.request[1] = time.perf_counter()
+    else:
+        def _timed_request(*args, **kwargs):
+            probe.request[0] = time.perf_counter()
+            try:
+                return request(*args, **kwargs)
+            finally:
+                probe.request[1] = time.perf_counter()
+    client._request = _timed_request
+
+
+@contextmanager
+def _timed_to_datetime(probe):
+    """ Time the conversions of the index to datetimes while benchmarking
+    """
+    to_datetime = pandas.to_datetime
+
+    def _to_datetime(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return to_datetime(*args, **kwargs)
+        finally:
+            probe.to_datetime += time.perf_counter() - start
+    pandas.to_datetime = _to_datetime
+    try:
+        yield
+    finally:
+        pandas.to_datetime = to_datetime
+
+
+def _stages(probe, start, end):
+    request = probe.request[1] - probe.request[0]
+    formatting = end - probe.request[1]
+    return {'url_build': probe.request[0] - start,
+            'http': probe.http,
+            'json_decode': request - probe.http,
+            'dataframe': formatting - probe.to_datetime,
+            'datetime_index': probe.to_datetime,
+            'total': end - start}
+
+
+def _summary(samples):
+    """ Statistics of a list of durations, in milliseconds
+    """
+    samples = sorted(s * 1000 for s in samples)
+    return {'min': samples[0], 'median': statistics.median(samples),
+            'mean': statistics.mean(samples),
+            'p95': samples[min(len(samples) - 1, int(.95 * len(samples)))]}
+
+
+def _client(scenario, is_async, transport, base_url, output_format, probe):
+    sync_class, async_class, _, _ = CALLS[scenario]
+    cls = async_class if is_async else sync_class
+    timed = _AsyncTimedTransport if is_async else _TimedTransport
+    client = cls(key='benchmark', output_format=output_format,
+                 base_url=base_url, transport=transport)
+    # Default transport of the client when none is given
+    client.transport = timed(client.transport, probe)
+    _instrument(client, probe, is_async)
+    return client
+
+
+def run_sync(scenario, repeat, transport, base_url, output_format):
+    probe = _Probe()
+    client = _client(scenario, False, transport, base_url, output_format,
+                     probe)
+    method = getattr(client, CALLS[scenario][2])
+    samples = []
+    with _timed_to_datetime(probe):
+        for _ in range(repeat):
+            probe.reset()
+            start = time.perf_counter()
+            method(**CALLS[scenario][3])
+            samples.append(_stages(probe, start, time.perf_counter()))
+    return samples
+
+
+def run_async(scenario, repeat, transport, base_url, output_format):
+    async def _run():
+        probe = _Probe()
+        client = _client(scenario, True, transport, base_url, output_format,
+                         probe)
+        method = getattr(client, CALLS[scenario][2])
+        samples = []
+        try:
+            with _timed_to_datetime(probe):
+                for _ in range(repeat):
+                    probe.reset()
+                    start = time.perf_counter()
+                    await method(**CALLS[scenario][3])
+                    samples.append(_stages(probe, start, time.perf_counter()))
+        finally:
+            await client.close()
+        return samples
+    return asyncio.run(_run())
+
+
+def _version():
+    try:
+        from importlib.metadata import version
+        return version('alpha_vantage')
+    except Exception:
+        return 'unknown'
+
+
+def benchmark(scenarios, rows, repeat=20, transport='http',
+              output_format='pandas', modes=('sync', 'async')):
+    """ Run the benchmarks and return their results as a dictionary, with
+    the statistics of every stage in milliseconds
+
+    Keyword Arguments:
+        scenarios: The names of the scenarios to run
+        rows: The sizes of the payloads (number of rows)
+        repeat: The number of calls timed for each scenario and size
+        transport: 'http' to go through the local mock server, 'replay' to
+            answer the calls from memory
+        output_format: The output format of the clients
+        modes: The clients to benchmark, 'sync' and/or 'async'
+    """
+    server = MockServer().start() if transport == 'http' else None
+    results = []
+    try:
+        for size in rows:
+            replay = replay_transport(size)
+            if server is not None:
+                server.replay = replay
+            for mode in modes:
+                run = run_async if mode == 'async' else run_sync
+                for scenario in scenarios:
+                    if server is None:
+                        client_replay = AsyncReplayTransport(
+                            replay.responses) if mode == 'async' else replay
+                        samples = run(scenario, repeat, client_replay, None,
+                                      output_format)
+                    else:
+                        samples = run(scenario, repeat, None, server.url,
+                                      output_format)
+                    for stage in STAGES:
+                        results.append(dict(
+                            _summary([s[stage] for s in samples]),
+                            mode=mode, scenario=scenario, rows=size,
+                            stage=stage))
+    finally:
+        if server is not None:
+            server.stop()
+    return {'meta': {'version': _version(),
+                     'python': platform.python_version(),
+                     'pandas': pandas.__version__,
+                     'platform': platform.platform(),
+                     'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'transport': transport,
+                     'output_format': output_format,
+                     'repeat': repeat},
+            'results': results}
+
+
+def _key(result):
+    return result['mode'], result['scenario'], result['rows'], result['stage']
+
+
+def report(results, baseline=None, out=sys.stdout):
+    """ Print the median of every stage, with its ratio to the baseline
+    results when given
+    """
+    previous = {_key(r): r for r in (baseline or {}).get('results', [])}
+    header = '{:<6} {:<9} {:>6} {:<15} {:>10}'.format(
+        'mode', 'scenario', 'rows', 'stage', 'median ms')
+    if previous:
+        header += ' {:>10} {:>7}'.format('baseline', 'ratio')
+    print(header, file=out)
+    for result in results['results']:
+        line = '{:<6} {:<9} {:>6} {:<15} {:>10.3f}'.format(
+            result['mode'], result['scenario'], result['rows'],
+            result['stage'], result['median'])
+        old = previous.get(_key(result))
+        if old is not None:
+            ratio = result['median'] / old['median'] if old['median'] \
+                else float('nan')
+            line += ' {:>10.3f} {:>7.2f}'.format(old['median'], ratio)
+        print(line, file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Offline benchmark of the request -> DataFrame pipeline')
+    parser.add_argument('--scenario', nargs='+', choices=sorted(CALLS),
+                        default=sorted(CALLS))
+    parser.add_argument('--rows', nargs='+', type=int, default=[100, 5000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--transport', choices=['http', 'replay'],
+                        default='http')
+    parser.add_argument('--output-format', choices=['pandas', 'json'],
+                        default='pandas')
+    parser.add_argument('--mode', nargs='+', choices=['sync', 'async'],
+                        default=['sync', 'async'])
+    parser.add_argument('--output', help='file the results are saved to')
+    parser.add_argument('--compare', help='results of a previous run to '
+                                          'compare with')
+    args = parser.parse_args(argv)
+    results = benchmark(args.scenario, args.rows, repeat=args.repeat,
+                        transport=args.transport,
+                        output_format=args.output_format, modes=args.mode)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
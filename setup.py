@@ -23,14 +23,13 @@ setup(
         'Intended Audience :: Developers',
         'Topic :: Office/Business :: Financial :: Investment',
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8'
     ],
     url='https://github.com/RomelTorres/alpha_vantage',
+    python_requires='>=3.7',
     install_requires=[
         'aiohttp',
         'requests'
@@ -42,11 +41,13 @@ setup(
     ],
     extras_requires={
         'pandas': ['pandas'],
+        'store': ['pandas', 'pyarrow'],
+        'tracing': ['opentelemetry-api'],
     },
     keywords=['stocks', 'market', 'finance', 'alpha_vantage', 'quotes',
               'shares'],
     packages=find_packages(
-        exclude=['helpers', 'test_alpha_vantage', 'images']),
+        exclude=['helpers', 'test_alpha_vantage', 'images', 'benchmarks']),
     package_data={
         'alpha_vantage': [],
     }
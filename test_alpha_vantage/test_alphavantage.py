@@ -4,14 +4,35 @@ from ..alpha_vantage.timeseries import TimeSeries
 from ..alpha_vantage.techindicators import TechIndicators
 from ..alpha_vantage.sectorperformance import SectorPerformances
 from ..alpha_vantage.foreignexchange import ForeignExchange
-from ..alpha_vantage.fundamentaldata import FundamentalData
+from ..alpha_vantage.fundamentaldata import FundamentalData, parse_reports, \
+    reports_panel
+from ..alpha_vantage.cryptocurrencies import CryptoCurrencies, \
+    parse_digital_currency
+from ..alpha_vantage.cache import choose_outputsize, FundamentalsCache, \
+    SeriesCache
+from ..alpha_vantage.sectors import SectorHistory, SectorRecorder
+from ..alpha_vantage.store import SeriesStore
+from ..alpha_vantage.symbols import SymbolIndex, SymbolSearch
+from ..alpha_vantage.scheduler import RequestScheduler, DeadlineExceeded
+from ..alpha_vantage.keypool import KeyPool
+from ..alpha_vantage.transport import ReplayTransport, EndpointTransport
+from ..alpha_vantage.hooks import PrometheusHook
+from ..alpha_vantage.tracing import SpanRecorder
+from ..alpha_vantage.usage import UsageMeter
+from ..alpha_vantage.fxrates import cross_rates, spanning_pairs
 
-from pandas import DataFrame as df, Timestamp
+from pandas import DataFrame as df, Timestamp, date_range
 
+import numpy
 import unittest
 import sys
 import collections
+import json
 from os import path
+from datetime import datetime
+import tempfile
+import threading
+import time
 import requests_mock
 
 
@@ -133,6 +154,467 @@ class TestAlphaVantage(unittest.TestCase):
                 "MSFT", interval='1min', outputsize='full')
             assert type(data.index[0]) == int
 
+    @requests_mock.Mocker()
+    def test_time_series_intraday_outputsize_auto(self, mock_request):
+        """ Test that outputsize auto asks for the full series when nothing
+        is cached and that the result is merged into the cache
+        """
+        events = []
+        ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST, cache=True,
+                        hooks=[events.append])
+        url = "https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol=MSFT&interval=1min&outputsize=full&apikey=test&datatype=json"
+        path_file = self.get_file_from_url("mock_time_series")
+        with open(path_file) as f:
+            mock_request.get(url, text=f.read())
+            data, _ = ts.get_intraday(
+                "MSFT", interval='1min', outputsize='auto', start='2017-01-01')
+            self.assertEqual(events[0].outputsize, 'full')
+            key = ts.cache.make_key('TIME_SERIES_INTRADAY', {
+                'symbol': 'MSFT', 'interval': '1min', 'extended_hours': 'true',
+                'adjusted': 'true', 'month': None})
+            self.assertEqual(ts.cache.get(key), data)
+
+    def test_series_cache(self):
+        """ Test that only the auto calls get the merged series, that the
+        adjusted series are replaced once their past changed and that the
+        cache is bounded
+        """
+        cache = SeriesCache(max_entries=2)
+        key = cache.make_key('TIME_SERIES_DAILY', {'symbol': 'MSFT'})
+        full = {'data': {'2020-01-02': {'close': '1'},
+                         '2020-01-03': {'close': '2'}}}
+        compact = {'data': {'2020-01-03': {'close': '2'},
+                            '2020-01-06': {'close': '3'}}}
+        cache.update(key, full, 'data', 'full')
+        self.assertIs(cache.update(key, compact, 'data', 'compact'), compact)
+        merged = cache.update(key, compact, 'data', 'compact', merge=True)
+        self.assertEqual(list(merged['data']),
+                         ['2020-01-06', '2020-01-03', '2020-01-02'])
+        self.assertEqual(cache.coverage(key),
+                         ('2020-01-02', '2020-01-06', True))
+        empty = {'data': {}}
+        self.assertIs(cache.update(('EMPTY',), empty, 'data', 'full'), empty)
+        adjusted = cache.make_key('TIME_SERIES_DAILY_ADJUSTED',
+                                  {'symbol': 'MSFT'})
+        cache.update(adjusted, full, 'data', 'full')
+        split = {'data': {'2020-01-02': {'close': '0.5'},
+                          '2020-01-03': {'close': '1'},
+                          '2020-01-06': {'close': '1.5'}}}
+        cache.update(adjusted, split, 'data', 'compact')
+        self.assertEqual(cache.coverage(adjusted),
+                         ('2020-01-02', '2020-01-06', False))
+        self.assertEqual(cache.get(adjusted), split['data'])
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.coverage(('EMPTY',)))
+        cache.update(('OTHER',), full, 'data', 'full')
+        self.assertIsNone(cache.coverage(key))
+        cache = SeriesCache(max_age=0.)
+        cache.update(key, full, 'data', 'full')
+        time.sleep(0.01)
+        self.assertIsNone(cache.get(key))
+
+    def test_choose_outputsize(self):
+        """ Test the choice of the outputsize given the cached coverage
+        """
+        now = datetime(2017, 12, 20)
+        self.assertEqual(choose_outputsize('TIME_SERIES_DAILY', now=now), 'full')
+        self.assertEqual(choose_outputsize(
+            'TIME_SERIES_DAILY', start='2017-12-01', now=now), 'compact')
+        coverage = ('2010-01-04', '2017-12-18', True)
+        self.assertEqual(choose_outputsize(
+            'TIME_SERIES_DAILY', coverage=coverage, now=now), 'compact')
+        # The full history is cached, the api has nothing older
+        self.assertEqual(choose_outputsize(
+            'TIME_SERIES_DAILY', coverage=coverage, start='2001-01-01',
+            now=now), 'compact')
+        self.assertEqual(choose_outputsize(
+            'TIME_SERIES_DAILY', coverage=coverage[:2] + (False,),
+            start='2001-01-01', now=now), 'full')
+        self.assertEqual(choose_outputsize(
+            'TIME_SERIES_INTRADAY', interval='1min',
+            start='2017-12-19 23:00', now=now), 'compact')
+        self.assertEqual(choose_outputsize(
+            'TIME_SERIES_INTRADAY', interval='1min', coverage=coverage,
+            now=now), 'full')
+
+    @requests_mock.Mocker()
+    def test_time_series_store(self, mock_request):
+        """ Test that the time series are appended to the store and read
+        back by range
+        """
+        with tempfile.TemporaryDirectory() as store_path:
+            store = SeriesStore(store_path)
+            ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST, store=store)
+            url = "https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol=MSFT&interval=1min&outputsize=full&apikey=test&datatype=json"
+            path_file = self.get_file_from_url("mock_time_series")
+            with open(path_file) as f:
+                mock_request.get(url, text=f.read())
+                data, _ = ts.get_intraday(
+                    "MSFT", interval='1min', outputsize='full')
+                ts.get_intraday("MSFT", interval='1min', outputsize='full')
+            stored = store.read('MSFT', '1min')
+            self.assertEqual(len(stored), len(data))
+            subset = store.read('MSFT', '1min', start='2017-12-18 14:50:00',
+                                end='2017-12-18 14:55:00')
+            self.assertEqual(len(subset), 6)
+            self.assertEqual(store.compact(force=True), 1)
+            self.assertEqual(len(store.read('MSFT', '1min')), len(data))
+
+    def test_time_series_store_gaps(self):
+        """ Test that an append fills the gaps inside the stored range and
+        that compacted files are kept until the reads holding them end
+        """
+        dates = date_range('2019-01-01', '2020-12-31', freq='D')
+        frame = df({'close': numpy.arange(len(dates), dtype=float)},
+                   index=dates)
+        with tempfile.TemporaryDirectory() as store_path:
+            store = SeriesStore(store_path)
+            store.append('MSFT', 'daily', frame['2020-01':'2020-04'])
+            store.append('MSFT', 'daily', frame['2020-08':'2020-12'])
+            # 2019, the gap of May to July 2020 and the last stored bar
+            self.assertEqual(store.append('MSFT', 'daily', frame, full=True),
+                             365 + 92 + 1)
+            stored = store.read('MSFT', 'daily')
+            self.assertEqual(len(stored), len(dates))
+            self.assertEqual(len(stored['2020-05':'2020-07']), 92)
+            store._readers += 1
+            store.compact(force=True)
+            self.assertTrue(store._replaced)
+            store._readers -= 1
+            self.assertEqual(len(store.read('MSFT', 'daily')), len(dates))
+            self.assertFalse(store._replaced)
+
+    @requests_mock.Mocker()
+    def test_time_series_store_memory_mapped(self, mock_request):
+        """ Test that the time series can be stored in arrow files and read
+        back from memory mapped files
+        """
+        with tempfile.TemporaryDirectory() as store_path:
+            store = SeriesStore(store_path, file_format='arrow')
+            ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST,
+                            output_format='pandas', store=store)
+            url = "https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol=MSFT&interval=1min&outputsize=full&apikey=test&datatype=json"
+            path_file = self.get_file_from_url("mock_time_series")
+            with open(path_file) as f:
+                mock_request.get(url, text=f.read())
+                data, _ = ts.get_intraday(
+                    "MSFT", interval='1min', outputsize='full')
+            table = store.read_table('MSFT', '1min', start='2017-12-18 14:50:00')
+            self.assertEqual(table.num_rows, 7)
+            stored = store.read('MSFT', '1min')
+            self.assertListEqual(list(stored.index), sorted(data.index))
+
+    @requests_mock.Mocker()
+    def test_time_series_store_index(self, mock_request):
+        """ Test that the store index answers coverage questions and that
+        range reads only load the overlapping blocks
+        """
+        with tempfile.TemporaryDirectory() as store_path:
+            store = SeriesStore(store_path, block_size=10)
+            ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST, store=store)
+            url = "https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol=MSFT&interval=1min&outputsize=full&apikey=test&datatype=json"
+            path_file = self.get_file_from_url("mock_time_series")
+            with open(path_file) as f:
+                mock_request.get(url, text=f.read())
+                data, _ = ts.get_intraday(
+                    "MSFT", interval='1min', outputsize='full')
+            first, last, full = store.coverage('MSFT', '1min')
+            self.assertEqual(last, Timestamp(max(data)))
+            self.assertEqual(first, Timestamp(min(data)))
+            self.assertTrue(full)
+            loaded = []
+            read_blocks = store._read_blocks
+
+            def _read_blocks(part, blocks=None):
+                loaded.extend(blocks)
+                return read_blocks(part, blocks)
+            store._read_blocks = _read_blocks
+            subset = store.read('MSFT', '1min', start='2017-12-18 14:50:00',
+                                end='2017-12-18 14:55:00')
+            self.assertEqual(len(subset), 6)
+            self.assertEqual(len(loaded), 1)
+
+    def test_scheduler_priority_and_deadline(self):
+        """ Test that the scheduler dispatches by priority within the rate
+        limit and drops the calls whose deadline passed
+        """
+        scheduler = RequestScheduler(calls_per_minute=1, period=0.2)
+        scheduler.acquire()
+        order = []
+
+        def _call(priority):
+            scheduler.acquire(priority=priority)
+            order.append(priority)
+        threads = [threading.Thread(target=_call, args=(p,)) for p in (0, 5)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02)
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.acquire(priority=10, deadline=0.01)
+        for thread in threads:
+            thread.join()
+        self.assertListEqual(order, [5, 0])
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics['dispatched'], 3)
+        self.assertEqual(metrics['expired'], 1)
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(metrics['wait_by_priority'][5]['count'], 1)
+
+    @requests_mock.Mocker()
+    def test_global_quote_scheduler(self, mock_request):
+        """ Test that the calls of a client go through its scheduler
+        """
+        scheduler = RequestScheduler(calls_per_minute=5)
+        ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST,
+                        scheduler=scheduler)
+        url = "https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol=MSFT&apikey=test&datatype=json"
+        path_file = self.get_file_from_url("global_quote")
+        with open(path_file) as f:
+            mock_request.get(url, text=f.read())
+            data, _ = ts.get_quote_endpoint("MSFT", priority=10, deadline=1)
+            self.assertIsInstance(
+                data, dict, 'Result Data must be a dictionary')
+        self.assertEqual(scheduler.metrics()['dispatched'], 1)
+
+    @requests_mock.Mocker()
+    def test_hooks(self, mock_request):
+        """ Test that the hooks of a client get the event of every call
+        """
+        events = []
+        prometheus = PrometheusHook()
+        ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST,
+                        output_format='pandas', hooks=[events.append])
+        ts.add_hook(prometheus)
+        url = "https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol=MSFT&interval=1min&outputsize=full&apikey=test&datatype=json"
+        path_file = self.get_file_from_url("mock_time_series")
+        with open(path_file) as f:
+            mock_request.get(url, text=f.read())
+            ts.get_intraday("MSFT", interval='1min', outputsize='full')
+        event = events[0]
+        self.assertEqual(event.function, 'TIME_SERIES_INTRADAY')
+        self.assertEqual(event.symbol, 'MSFT')
+        self.assertGreater(event.bytes, 0)
+        self.assertGreater(event.format, 0)
+        self.assertIsNone(event.connect)
+        self.assertIsNotNone(event.ttfb)
+        self.assertEqual(event.retries, 0)
+        self.assertIsNone(event.error)
+        self.assertIn('alpha_vantage_calls_total{function="TIME_SERIES_'
+                      'INTRADAY",status="ok"} 1', prometheus.render())
+        mock_request.get(url, status_code=503, text='Service Unavailable')
+        with self.assertRaisesRegex(ValueError, '503'):
+            ts.get_intraday("MSFT", interval='1min', outputsize='full')
+
+    @requests_mock.Mocker()
+    def test_tracing(self, mock_request):
+        """ Test that a traced call opens a span with a child span per stage
+        """
+        recorder = SpanRecorder()
+        ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST,
+                        output_format='pandas', tracer=recorder)
+        url = "https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol=MSFT&interval=1min&outputsize=full&apikey=test&datatype=json"
+        path_file = self.get_file_from_url("mock_time_series")
+        with open(path_file) as f:
+            mock_request.get(url, text=f.read())
+            ts.get_intraday("MSFT", interval='1min', outputsize='full')
+        call = recorder.spans[0]
+        self.assertEqual(call.name, 'get_intraday')
+        self.assertEqual(call.attributes['alpha_vantage.function'],
+                         'TIME_SERIES_INTRADAY')
+        self.assertGreater(call.attributes['alpha_vantage.bytes'], 0)
+        self.assertEqual([s.name for s in recorder.children(call)],
+                         ['url_build', 'http', 'decode', 'format'])
+
+    @requests_mock.Mocker()
+    def test_profiling(self, mock_request):
+        """ Test that the profiler aggregates the calls per endpoint
+        """
+        ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST,
+                        output_format='pandas')
+        profiler = ts.enable_profiling()
+        url = "https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol=MSFT&interval=1min&outputsize=full&apikey=test&datatype=json"
+        path_file = self.get_file_from_url("mock_time_series")
+        with open(path_file) as f:
+            mock_request.get(url, text=f.read())
+            for _ in range(3):
+                ts.get_intraday("MSFT", interval='1min', outputsize='full')
+        report = profiler.report()
+        self.assertEqual(report['TIME_SERIES_INTRADAY']['calls'], 3)
+        self.assertEqual(report['TIME_SERIES_INTRADAY']['stats']['format']
+                         ['count'], 3)
+        self.assertTrue(profiler.folded().startswith(
+            'alpha_vantage;TIME_SERIES_INTRADAY;'))
+        ts.disable_profiling()
+        self.assertEqual(ts.hooks, [])
+
+    @requests_mock.Mocker()
+    def test_usage(self, mock_request):
+        """ Test that the usage is accounted by function, symbol, key and tag
+        and projected against the daily quota
+        """
+        usage = UsageMeter(calls_per_day=100)
+        ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST, usage=usage)
+        url = "https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol={}&apikey=test&datatype=json"
+        path_file = self.get_file_from_url("global_quote")
+        with open(path_file) as f:
+            quote = f.read()
+        mock_request.get(url.format('MSFT'), text=quote)
+        mock_request.get(url.format('AAPL'), text=quote)
+        ts.get_quote_endpoint("MSFT", tag='ticker')
+        ts.get_quote_endpoint("MSFT", tag='ticker')
+        ts.get_quote_endpoint("AAPL", tag='reports')
+        rows = usage.rows(by=('tag',))
+        self.assertEqual(rows[0], {'tag': 'ticker', 'calls': 2,
+                                   'api_requests': 2, 'cache_served': 0,
+                                   'coalesced': 0, 'reused': 0,
+                                   'throttled': 0, 'errors': 0})
+        self.assertEqual(usage.rows()[0]['key'], 'test')
+        projection = usage.projection()
+        self.assertEqual(projection['used'], 3)
+        self.assertEqual(projection['remaining'], 97)
+        self.assertGreater(projection['exhausted_in'], 0)
+        self.assertIn('reports', usage.export(output_format='csv'))
+
+    def test_cross_rates(self):
+        """ Test that the cross rates are derived from the legs of the base
+        """
+        self.assertEqual(spanning_pairs(['EUR', 'usd', 'JPY'], 'USD'),
+                         [('USD', 'EUR'), ('USD', 'JPY')])
+        matrix = cross_rates('USD', {
+            'EUR': (0.5, '2020-01-01 10:00:00'),
+            'JPY': (100., '2020-01-01 09:00:00')})
+        self.assertEqual(matrix.currencies, ['USD', 'EUR', 'JPY'])
+        self.assertAlmostEqual(matrix.rate('EUR', 'JPY'), 200.)
+        self.assertAlmostEqual(matrix.rate('JPY', 'USD'), 0.01)
+        self.assertEqual(matrix.path('EUR', 'JPY'), ('EUR', 'USD', 'JPY'))
+        self.assertEqual(str(matrix.refreshed[1, 2]), '2020-01-01T09:00:00')
+        self.assertEqual(str(matrix.refreshed[0, 1]), '2020-01-01T10:00:00')
+
+    def test_digital_currency_batch(self):
+        """ Test that the batch fetches every pair once and derives the
+        weekly and monthly bars from the daily series
+        """
+        transport = ReplayTransport()
+        transport.add('DIGITAL_CURRENCY_DAILY',
+                      path=self.get_file_from_url("mock_digital_currency_daily"))
+        cc = CryptoCurrencies(key=TestAlphaVantage._API_KEY_TEST,
+                              transport=transport, usage=True)
+        daily, meta_data = cc.get_digital_currency_batch(['btc', 'ETH'],
+                                                         ['CNY'])
+        self.assertEqual(len(transport.calls), 2)
+        self.assertEqual(list(daily.index.names), ['symbol', 'market', 'date'])
+        self.assertIn('1a. open (market)', daily.columns)
+        self.assertEqual(set(meta_data['pairs']), {('BTC', 'CNY'),
+                                                   ('ETH', 'CNY')})
+        weekly, _ = cc.get_digital_currency_batch(['BTC', 'ETH'], ['CNY'],
+                                                  frequency='weekly')
+        self.assertEqual(len(transport.calls), 2)
+        self.assertEqual(cc.usage.rows(by=())[0]['cache_served'], 2)
+        week = weekly.loc[('BTC', 'CNY', Timestamp('2021-01-03'))]
+        days = daily.loc[('BTC', 'CNY')].loc['2021-01-01':'2021-01-03']
+        self.assertEqual(week['1a. open (market)'],
+                         days['1a. open (market)'].iloc[0])
+        self.assertEqual(week['2a. high (market)'],
+                         days['2a. high (market)'].max())
+        self.assertEqual(week['5. volume'], days['5. volume'].sum())
+        monthly, _ = cc.get_digital_currency_batch(['BTC'], ['CNY'],
+                                                   frequency='monthly')
+        self.assertEqual(list(monthly.index.get_level_values('date')),
+                         [Timestamp('2021-01-31'), Timestamp('2021-02-10')])
+
+    def test_parse_digital_currency(self):
+        """ Test that the crypto parser keeps the halves asked for, with
+        normalized field names and the dtype asked for
+        """
+        path_file = self.get_file_from_url("mock_digital_currency_daily")
+        with open(path_file) as f:
+            payload = json.load(f)
+        data = parse_digital_currency(payload, 'CNY')
+        self.assertEqual(list(data.columns.names), ['currency', 'field'])
+        self.assertEqual(data.shape, (41, 10))
+        self.assertIn(('CNY', 'open'), data.columns)
+        self.assertIn(('USD', 'market_cap'), data.columns)
+        self.assertIn(('', 'volume'), data.columns)
+        data = parse_digital_currency(
+            payload['Time Series (Digital Currency Daily)'], 'CNY',
+            currencies=['USD'], dtype='float32')
+        self.assertEqual(set(data.columns.get_level_values('currency')),
+                         {'USD', ''})
+        self.assertTrue((data.dtypes == 'float32').all())
+        self.assertEqual(data.loc['2021-01-01', ('USD', 'open')], 29000.)
+
+    @requests_mock.Mocker()
+    def test_key_pool(self, mock_request):
+        """ Test that the calls are spread across the keys of a pool and
+        that throttled calls are retried with another key
+        """
+        pool = KeyPool(['key1', 'key2'])
+        ts = TimeSeries(key=pool)
+        url = "https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol=MSFT&apikey={}&datatype=json"
+        path_file = self.get_file_from_url("global_quote")
+        with open(path_file) as f:
+            quote = f.read()
+        mock_request.get(url.format('key1'), text=quote)
+        mock_request.get(url.format('key2'), text=quote)
+        ts.get_quote_endpoint("MSFT")
+        ts.get_quote_endpoint("MSFT")
+        status = pool.status()
+        self.assertEqual(status['key1']['calls'], 1)
+        self.assertEqual(status['key2']['calls'], 1)
+        mock_request.get(url.format('key1'), text='{"Note": "Our standard '
+                         'API call frequency is 5 calls per minute"}')
+        data, _ = ts.get_quote_endpoint("MSFT")
+        self.assertIsInstance(data, dict, 'Result Data must be a dictionary')
+        status = pool.status()
+        self.assertEqual(status['key1']['throttled'], 1)
+        self.assertFalse(status['key1']['healthy'])
+        self.assertEqual(status['key2']['calls'], 2)
+
+    @requests_mock.Mocker()
+    def test_key_pool_rapidapi(self, mock_request):
+        """ Test that a pool of RapidAPI keys sends the keys as headers
+        """
+        ts = TimeSeries(key=KeyPool(['key1']), rapidapi=True)
+        url = "https://alpha-vantage.p.rapidapi.com/query?function=GLOBAL_QUOTE&symbol=MSFT&datatype=json"
+        path_file = self.get_file_from_url("global_quote")
+        with open(path_file) as f:
+            mock_request.get(url, text=f.read(),
+                             request_headers={'x-rapidapi-key': 'key1'})
+            data, _ = ts.get_quote_endpoint("MSFT")
+            self.assertIsInstance(
+                data, dict, 'Result Data must be a dictionary')
+
+    def test_replay_transport(self):
+        """ Test that the calls can be answered from fixtures in memory
+        """
+        transport = ReplayTransport()
+        transport.add('TIME_SERIES_INTRADAY',
+                      path=self.get_file_from_url("mock_time_series"))
+        ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST,
+                        output_format='pandas', transport=transport)
+        data, _ = ts.get_intraday("MSFT", interval='1min')
+        self.assertIsInstance(
+            data, df, 'Result Data must be a pandas data frame')
+        self.assertEqual(len(transport.calls), 1)
+        with self.assertRaisesRegex(ValueError, '404'):
+            ts.get_daily("MSFT")
+
+    @requests_mock.Mocker()
+    def test_endpoint_transport(self, mock_request):
+        """ Test that the endpoint transport sends the calls to another
+        endpoint keeping their query
+        """
+        transport = EndpointTransport('http://localhost:8080/query')
+        ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST,
+                        transport=transport)
+        url = "http://localhost:8080/query?function=GLOBAL_QUOTE&symbol=MSFT&apikey=test&datatype=json"
+        path_file = self.get_file_from_url("global_quote")
+        with open(path_file) as f:
+            mock_request.get(url, text=f.read())
+            data, _ = ts.get_quote_endpoint("MSFT")
+            self.assertIsInstance(
+                data, dict, 'Result Data must be a dictionary')
+
     @requests_mock.Mocker()
     def test_time_series_intraday_extended(self, mock_request):
         """ Test that api call returns a csv-reader as requested
@@ -203,6 +685,110 @@ class TestAlphaVantage(unittest.TestCase):
             self.assertIsInstance(
                 data, df, 'Result Data must be a pandas data frame')
 
+    def test_sector_parser(self):
+        """ Test that the ranks are converted with an ordered categorical
+        index and that a snapshot already parsed is served from the parser
+        """
+        transport = ReplayTransport()
+        transport.add('SECTOR', path=self.get_file_from_url("mock_sector"))
+        sp = SectorPerformances(key=TestAlphaVantage._API_KEY_TEST,
+                                output_format='pandas', transport=transport,
+                                usage=True)
+        data, meta_data = sp.get_sector()
+        self.assertTrue(data.index.ordered)
+        self.assertEqual(list(data.index.categories),
+                         sorted(data.index.categories))
+        self.assertAlmostEqual(
+            data.loc['Energy', 'Rank A: Real-Time Performance'], 0.0138)
+        data.iloc[0, 0] = 1.
+        again, _ = sp.get_sector()
+        self.assertEqual(sp.sector_parser.stats, {'hits': 1, 'misses': 1})
+        totals = sp.usage.rows(by=())[0]
+        self.assertEqual((totals['api_requests'], totals['reused']), (2, 1))
+        self.assertAlmostEqual(
+            again.loc['Energy', 'Rank A: Real-Time Performance'], 0.0138)
+
+    def test_sector_recorder(self):
+        """ Test that the recorder appends the new snapshots only and that
+        the history is read back by range
+        """
+        path_file = self.get_file_from_url("mock_sector")
+        with open(path_file) as f:
+            payload = json.load(f)
+        transport = ReplayTransport({'SECTOR': json.dumps(payload)})
+        sp = SectorPerformances(key=TestAlphaVantage._API_KEY_TEST,
+                                transport=transport)
+        history_path = tempfile.TemporaryDirectory()
+        self.addCleanup(history_path.cleanup)
+        history = SectorHistory(history_path.name)
+        recorder = SectorRecorder(sp, history, interval=0)
+        recorder.run(cycles=3)
+        self.assertEqual(recorder.stats['polls'], 3)
+        self.assertEqual(len(history), 1)
+        payload['Meta Data']['Last Refreshed'] = '02:13 PM ET 12/20/2017'
+        payload['Rank B: 1 Day Performance']['Energy'] = '5.00%'
+        transport.add('SECTOR', json.dumps(payload))
+        self.assertTrue(recorder.poll())
+        history = SectorHistory(history.path)
+        self.assertEqual(len(history), 2)
+        self.assertEqual(len(history.read(start='2017-12-20 14:10')), 11)
+        energy = history.rank('Rank B: 1 Day Performance')['Energy']
+        self.assertEqual(list(energy.index), [Timestamp('2017-12-20 14:08'),
+                                              Timestamp('2017-12-20 14:13')])
+        self.assertAlmostEqual(energy.iloc[1], 0.05, places=6)
+        # A row being written by the recorder is ignored, not truncated
+        with open(path.join(history.path, 'time.bin'), 'ab') as f:
+            f.write(b'\0' * 8)
+        self.assertEqual(len(SectorHistory(history.path).read()), 22)
+        self.assertEqual(path.getsize(path.join(history.path, 'time.bin')),
+                         23 * 8)
+
+        def _fail(*args, **kwargs):
+            raise ConnectionError('Connection reset')
+        transport.send = _fail
+        recorder.run(cycles=2)
+        self.assertEqual(recorder.stats['errors'], 2)
+
+    def test_symbol_search(self):
+        """ Test that the symbol search calls the api only on a miss and
+        answers the prefix and fuzzy searches from its index
+        """
+        transport = ReplayTransport()
+        transport.add('SYMBOL_SEARCH',
+                      path=self.get_file_from_url("symbol_search"))
+        ts = TimeSeries(key=TestAlphaVantage._API_KEY_TEST,
+                        transport=transport, usage=True)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        index_path = path.join(directory.name, 'symbols.json')
+        search = SymbolSearch(ts, SymbolIndex(index_path))
+        matches = search.search('ba')
+        self.assertEqual(len(transport.calls), 1)
+        self.assertEqual(matches[0]['1. symbol'], 'BA')
+        self.assertEqual([m['1. symbol'] for m in search.search('bank of')],
+                         ['BAC', '6190.HKG'])
+        self.assertEqual(search.search('barick')[0]['2. name'],
+                         'Barrick Gold Corporation')
+        self.assertEqual(len(transport.calls), 1)
+        self.assertEqual(search.stats, {'hits': 2, 'misses': 1})
+        totals = ts.usage.rows(by=())[0]
+        self.assertEqual((totals['calls'], totals['api_requests'],
+                          totals['cache_served']), (3, 1, 2))
+        index = SymbolIndex(index_path)
+        self.assertEqual(len(index), 10)
+        self.assertEqual(len(index.search('BA')), 10)
+        # A search recorded within the save interval waits for save()
+        search.search('qqqq')
+        self.assertEqual(len(transport.calls), 2)
+        self.assertFalse(SymbolIndex(index_path).searched('qqqq'))
+        search.index.save()
+        self.assertTrue(SymbolIndex(index_path).searched('qqqq'))
+        index.seed("symbol,name,exchange,assetType,ipoDate,delistingDate,"
+                   "status\nMSFT,Microsoft Corporation,NASDAQ,Stock,"
+                   "1986-03-13,null,Active\n")
+        self.assertEqual(index.search('micro')[0]['3. type'], 'Stock')
+        self.assertIn('MSFT', SymbolIndex(index_path))
+
     @requests_mock.Mocker()
     def test_foreign_exchange(self, mock_request):
         """ Test that api call returns a json file as requested
@@ -229,6 +815,89 @@ class TestAlphaVantage(unittest.TestCase):
             data, _ = fd.get_income_statement_annual(symbol='IBM')
             self.assertIsInstance(data, df, 'Result Data must be a pandas data frame')
 
+    def test_fundamentals_bundle(self):
+        """ Test that the bundle calls each function once per symbol and
+        splits the annual and quarterly reports
+        """
+        transport = ReplayTransport()
+        transport.add('OVERVIEW',
+                      path=self.get_file_from_url("mock_company_overview"))
+        transport.add('INCOME_STATEMENT',
+                      path=self.get_file_from_url("mock_fundamental_data"))
+        fd = FundamentalData(key=TestAlphaVantage._API_KEY_TEST,
+                             transport=transport)
+        bundles, meta_data = fd.get_fundamentals_bundle(
+            ['IBM', 'msft'], statements=['overview', 'income_statement',
+                                         'cash_flow'])
+        self.assertEqual(len(transport.calls), 6)
+        self.assertEqual(set(bundles), {'IBM', 'MSFT'})
+        bundle = bundles['IBM']
+        self.assertEqual(bundle['overview']['Symbol'], 'IBM')
+        self.assertEqual(len(bundle['income_statement_annual']), 5)
+        self.assertEqual(len(bundle['income_statement_quarterly']), 20)
+        self.assertNotIn('cash_flow_annual', bundle)
+        self.assertIn(('IBM', 'cash_flow'), meta_data['errors'])
+
+    def test_parse_reports(self):
+        """ Test that the reports are typed and that the panel of several
+        companies is indexed by symbol and fiscal date ending
+        """
+        path_file = self.get_file_from_url("mock_fundamental_data")
+        with open(path_file) as f:
+            payload = json.load(f)
+        data = parse_reports(payload['annualReports'])
+        self.assertEqual(str(data['totalRevenue'].dtype), 'Int64')
+        self.assertEqual(data['totalRevenue'].iloc[0], 77147000000)
+        self.assertTrue(data['nonRecurring'].isna().all())
+        self.assertEqual(data['fiscalDateEnding'].iloc[0],
+                         Timestamp('2019-12-31'))
+        self.assertEqual(data['reportedCurrency'].iloc[0], 'USD')
+        panel = reports_panel({'IBM': payload['quarterlyReports'],
+                               'MSFT': payload['quarterlyReports'][:4],
+                               'AAPL': []})
+        self.assertEqual(list(panel.index.names),
+                         ['symbol', 'fiscalDateEnding'])
+        self.assertEqual(len(panel.loc['MSFT']), 4)
+        self.assertEqual(str(panel['totalRevenue'].dtype), 'Int64')
+
+    def test_fundamentals_cache(self):
+        """ Test that the cached statements are served until a new report
+        is expected
+        """
+        transport = ReplayTransport()
+        transport.add('INCOME_STATEMENT',
+                      path=self.get_file_from_url("mock_fundamental_data"))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = FundamentalsCache(directory.name, report_lag=30)
+        clock = [datetime(2020, 8, 1).timestamp()]
+        cache._clock = lambda: clock[0]
+        fd = FundamentalData(key=TestAlphaVantage._API_KEY_TEST,
+                             transport=transport, fundamentals_cache=cache,
+                             usage=True)
+        fd.get_fundamentals_bundle('IBM', statements=['income_statement'])
+        self.assertEqual(cache.latest('IBM'), '2020-06-30')
+        _, meta_data = fd.get_fundamentals_bundle(
+            'IBM', statements=['income_statement'])
+        self.assertEqual(len(transport.calls), 1)
+        self.assertEqual(meta_data['cached'], [('IBM', 'income_statement')])
+        self.assertEqual(fd.usage.rows(by=('function', 'symbol'))[0],
+                         {'function': 'INCOME_STATEMENT', 'symbol': 'IBM',
+                          'calls': 2, 'api_requests': 1, 'cache_served': 1,
+                          'coalesced': 0, 'reused': 0, 'throttled': 0,
+                          'errors': 0})
+        # The cache is kept on disk between the runs
+        self.assertIsNotNone(FundamentalsCache(cache.path).get(
+            'IBM', 'income_statement', now=clock[0]))
+        # The report of the quarter ending on 2020-09-30 is expected
+        clock[0] = datetime(2020, 11, 2).timestamp()
+        fd.get_fundamentals_bundle('IBM', statements=['income_statement'])
+        self.assertEqual(len(transport.calls), 2)
+        cache.expect({'IBM': '2020-11-05'})
+        clock[0] = datetime(2020, 11, 6).timestamp()
+        fd.get_fundamentals_bundle('IBM', statements=['income_statement'])
+        self.assertEqual(len(transport.calls), 3)
+
     @requests_mock.Mocker()
     def test_company_overview(self, mock_request):
         """Test that api call returns a json file as requested
@@ -4,10 +4,23 @@ from ..alpha_vantage.async_support.timeseries import TimeSeries
 from ..alpha_vantage.async_support.techindicators import TechIndicators
 from ..alpha_vantage.async_support.sectorperformance import SectorPerformances
 from ..alpha_vantage.async_support.foreignexchange import ForeignExchange
+from ..alpha_vantage.async_support.cryptocurrencies import CryptoCurrencies
+from ..alpha_vantage.async_support.fundamentaldata import FundamentalData
+from ..alpha_vantage.async_support.proxyserver import CachingProxy
+from ..alpha_vantage.async_support.transport import ReplayTransport
+from ..alpha_vantage.keypool import KeyPool
+from ..alpha_vantage.tracing import SpanRecorder
+from ..alpha_vantage.async_support.quotestream import QuoteStream
+from ..alpha_vantage.async_support.fxrates import RateFeed
+from ..alpha_vantage.async_support.sectors import SectorRecorder
+from ..alpha_vantage.async_support.symbols import SymbolSearch
 
 from pandas import DataFrame as df, Timestamp
 
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from aiohttp.test_utils import TestServer, make_mocked_request
 from aioresponses import aioresponses
 from functools import wraps
 import json
@@ -233,3 +246,359 @@ class TestAlphaVantageAsync(unittest.TestCase):
             self.assertIsInstance(
                 data, dict, 'Result Data must be a dictionary')
         await fe.close()
+
+    @make_async
+    async def test_caching_proxy(self):
+        """
+        Test that the clients pointing to the local proxy share its cache
+        and that identical calls in flight reach the api only once
+        """
+        path_file = self.get_file_from_url("global_quote")
+        with open(path_file) as f:
+            quote = f.read()
+        upstream_calls = []
+
+        async def _upstream(request):
+            upstream_calls.append(dict(request.query))
+            await asyncio.sleep(0.05)
+            return web.Response(text=quote, content_type='application/json')
+        upstream_app = web.Application()
+        upstream_app.router.add_get('/query', _upstream)
+        upstream = TestServer(upstream_app)
+        await upstream.start_server()
+        proxy = CachingProxy(key='proxy_key',
+                             upstream_url=str(upstream.make_url('/query?')))
+        proxy_server = TestServer(proxy.make_app())
+        await proxy_server.start_server()
+        ts = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                        base_url=str(proxy_server.make_url('/query')))
+        results = await asyncio.gather(*[ts.get_quote_endpoint('MSFT')
+                                         for _ in range(3)])
+        data, _ = await ts.get_quote_endpoint('MSFT')
+        self.assertEqual(data, results[0][0])
+        self.assertEqual(len(upstream_calls), 1)
+        self.assertEqual(upstream_calls[0]['apikey'], 'proxy_key')
+        self.assertEqual(proxy.stats['coalesced'], 2)
+        self.assertEqual(proxy.stats['hits'], 1)
+        await ts.close()
+        await proxy_server.close()
+        await upstream.close()
+
+    @make_async
+    async def test_caching_proxy_keys(self):
+        """
+        Test that the proxy reports the throttled keys to its pool and that
+        the coalesced calls survive the cancellation of the first one
+        """
+        class SlowTransport(ReplayTransport):
+            async def send(self, url, headers=None, proxy=None):
+                await asyncio.sleep(0.05)
+                return await super(SlowTransport, self).send(url, headers,
+                                                             proxy)
+        transport = SlowTransport()
+        transport.add('GLOBAL_QUOTE', path=self.get_file_from_url(
+            "global_quote"))
+        transport.add('SMA', json.dumps({'Note': 'Our standard API call '
+                                         'frequency is 5 calls per minute'}))
+        pool = KeyPool(['key1', 'key2'], calls_per_minute=100)
+        proxy = CachingProxy(key=pool, transport=transport)
+        await proxy.handle_query(make_mocked_request(
+            'GET', '/query?function=SMA&symbol=MSFT'))
+        self.assertEqual(sum(s.throttled for s in pool._states.values()), 1)
+        query = '/query?function=GLOBAL_QUOTE&symbol=MSFT'
+        first = asyncio.ensure_future(proxy.handle_query(
+            make_mocked_request('GET', query)))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(proxy.handle_query(
+            make_mocked_request('GET', query)))
+        await asyncio.sleep(0)
+        first.cancel()
+        response = await second
+        self.assertEqual(response.headers['X-Cache'], 'COALESCED')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len(transport.calls), 2)
+
+    @make_async
+    async def test_replay_transport(self):
+        """
+        Test that the async calls can be answered from fixtures in memory
+        """
+        transport = ReplayTransport()
+        transport.add('TIME_SERIES_INTRADAY',
+                      path=self.get_file_from_url("mock_time_series"))
+        ts = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                        output_format='pandas', transport=transport)
+        data, _ = await ts.get_intraday("MSFT", interval='1min')
+        self.assertIsInstance(
+            data, df, 'Result Data must be a pandas data frame')
+        with self.assertRaisesRegex(ValueError, '404'):
+            await ts.get_daily("MSFT")
+        await ts.close()
+
+    @make_async
+    async def test_session(self):
+        """
+        Test that the session of the async client is the one of its transport
+        """
+        ts = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST)
+        self.assertIsNone(ts.session)
+        session = object()
+        ts.session = session
+        self.assertIs(ts.transport.session, session)
+        self.assertIs(ts.session, session)
+
+    @make_async
+    async def test_hooks(self):
+        """
+        Test that the hooks of an async client get the event of every call
+        """
+        events = []
+        transport = ReplayTransport()
+        transport.add('TIME_SERIES_INTRADAY',
+                      path=self.get_file_from_url("mock_time_series"))
+        ts = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                        transport=transport, hooks=[events.append])
+        await ts.get_intraday("MSFT", interval='1min')
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].function, 'TIME_SERIES_INTRADAY')
+        self.assertGreater(events[0].bytes, 0)
+        await ts.close()
+
+    @make_async
+    async def test_tracing(self):
+        """
+        Test that concurrent traced calls keep their spans apart
+        """
+        recorder = SpanRecorder()
+        transport = ReplayTransport()
+        transport.add('TIME_SERIES_INTRADAY',
+                      path=self.get_file_from_url("mock_time_series"))
+        ts = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                        transport=transport, tracer=recorder)
+        await asyncio.gather(ts.get_intraday("MSFT", interval='1min'),
+                             ts.get_intraday("AAPL", interval='1min'))
+        calls = [s for s in recorder.spans if s.parent_id is None]
+        self.assertEqual(len(calls), 2)
+        for call in calls:
+            self.assertEqual(len(recorder.children(call)), 4)
+        await ts.close()
+
+    @make_async
+    async def test_quote_stream(self):
+        """
+        Test that the quote stream only emits the quotes that changed
+        """
+        path_file = self.get_file_from_url("global_quote")
+        with open(path_file) as f:
+            quote = f.read()
+        transport = ReplayTransport({'GLOBAL_QUOTE': quote})
+        ts = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                        transport=transport)
+        stream = QuoteStream(ts, ['MSFT'], interval=0.01)
+        async with stream:
+            first = await asyncio.wait_for(stream.get(), 1)
+            self.assertEqual(first.symbol, 'MSFT')
+            self.assertEqual(first.price, 112.13)
+            transport.add('GLOBAL_QUOTE', quote.replace('112.1300',
+                                                        '112.5000'))
+            second = await asyncio.wait_for(stream.get(), 1)
+            self.assertEqual(second.price, 112.5)
+            await asyncio.sleep(0.05)
+        self.assertGreater(stream.stats['polls'], stream.stats['changes'])
+        with self.assertRaises(ValueError):
+            await stream.get()
+        await ts.close()
+
+    @make_async
+    async def test_quote_stream_failure(self):
+        """
+        Test that a failure of the polling reaches the waiting consumer
+        """
+        ts = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                        transport=ReplayTransport())
+        stream = QuoteStream(ts, ['MSFT'], interval=0.01)
+        select = stream._select
+
+        def _select(now):
+            if stream.stats['cycles']:
+                raise RuntimeError('Polling failed')
+            return select(now)
+        stream._select = _select
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(stream.get(), 1)
+        await stream.close()
+        await ts.close()
+
+    @make_async
+    async def test_rate_feed(self):
+        """
+        Test that the rate feed polls one leg per currency
+        """
+        transport = ReplayTransport()
+        transport.add('CURRENCY_EXCHANGE_RATE',
+                      path=self.get_file_from_url("mock_foreign_exchange"))
+        fe = ForeignExchange(key=TestAlphaVantageAsync._API_KEY_TEST,
+                             transport=transport)
+        feed = RateFeed(fe, ['EUR', 'JPY', 'GBP'], interval=0)
+        matrix = await feed.__anext__()
+        self.assertEqual(len(transport.calls), 3)
+        self.assertEqual(matrix.rates.shape, (4, 4))
+        self.assertAlmostEqual(matrix.rate('EUR', 'JPY'), 1.)
+        await fe.close()
+
+    @make_async
+    async def test_digital_currency_batch(self):
+        """
+        Test that the batch fetches the pairs concurrently and reports the
+        pairs which failed
+        """
+        transport = ReplayTransport()
+        transport.add('DIGITAL_CURRENCY_DAILY',
+                      path=self.get_file_from_url("mock_digital_currency_daily"))
+        cc = CryptoCurrencies(key=TestAlphaVantageAsync._API_KEY_TEST,
+                              transport=transport)
+        weekly, meta_data = await cc.get_digital_currency_batch(
+            ['BTC', 'ETH'], ['CNY'], frequency='weekly', workers=2)
+        self.assertEqual(len(transport.calls), 2)
+        self.assertEqual(list(weekly.index.get_level_values('symbol')
+                              .unique()), ['BTC', 'ETH'])
+        self.assertEqual(meta_data['errors'], {})
+        _, meta_data = await cc.get_digital_currency_batch(
+            ['BTC'], ['CNY'], frequency='weekly', derive=False)
+        self.assertEqual(list(meta_data['errors']), [('BTC', 'CNY')])
+        await cc.close()
+
+    @make_async
+    async def test_time_series_intraday_extended(self):
+        """
+        Test that the csv slices are parsed by chunks while the other tasks
+        of the loop keep running
+        """
+        transport = ReplayTransport()
+        transport.add('TIME_SERIES_INTRADAY_EXTENDED',
+                      path=self.get_file_from_url("mock_time_series_extended"))
+        transport.add('TIME_SERIES_INTRADAY',
+                      '{"Error Message": "Invalid API call"}')
+        ts = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                        output_format='csv', transport=transport)
+        ticks = []
+
+        async def _tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0)
+        ticker = asyncio.ensure_future(_tick())
+        await asyncio.sleep(0)
+        data, _ = await ts.get_intraday_extended("MSFT", interval='1min')
+        ticker.cancel()
+        rows = list(data)
+        self.assertEqual(rows[0], ['time', 'open', 'high', 'low', 'close',
+                                   'volume'])
+        self.assertEqual(len(rows), 11191)
+        self.assertGreater(len(ticks), 5)
+        with self.assertRaises(ValueError):
+            await ts.get_intraday("MSFT", interval='1min')
+        await ts.close()
+
+    @make_async
+    async def test_parse_executor(self):
+        """
+        Test that the large responses are decoded and converted in the parse
+        executor, into the same data frames
+        """
+        class CountingExecutor(ThreadPoolExecutor):
+            submitted = 0
+
+            def submit(self, *args, **kwargs):
+                CountingExecutor.submitted += 1
+                return super(CountingExecutor, self).submit(*args, **kwargs)
+        transport = ReplayTransport()
+        transport.add('TIME_SERIES_INTRADAY',
+                      path=self.get_file_from_url("mock_time_series"))
+        executor = CountingExecutor()
+        inline = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                            output_format='pandas', transport=transport)
+        offloaded = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                               output_format='pandas', transport=transport,
+                               parse_executor=executor, parse_bytes=1024)
+        expected, _ = await inline.get_intraday("MSFT", interval='1min')
+        data, meta_data = await offloaded.get_intraday("MSFT",
+                                                       interval='1min')
+        self.assertEqual(CountingExecutor.submitted, 1)
+        self.assertTrue(data.equals(expected))
+        self.assertEqual(meta_data['2. Symbol'], 'MSFT')
+        offloaded.parse_bytes = 1 << 20
+        await offloaded.get_intraday("MSFT", interval='1min')
+        self.assertEqual(CountingExecutor.submitted, 1)
+        await inline.close()
+        await offloaded.close()
+        executor.shutdown()
+
+    @make_async
+    async def test_empty_list_pandas(self):
+        """
+        Test that an empty list of data gives an empty data frame
+        """
+        transport = ReplayTransport(
+            {'SYMBOL_SEARCH': json.dumps({'bestMatches': []})})
+        ts = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                        output_format='pandas', transport=transport)
+        data, _ = await ts.get_symbol_search('nothing')
+        self.assertIsInstance(data, df)
+        self.assertTrue(data.empty)
+        await ts.close()
+
+    @make_async
+    async def test_fundamentals_bundle(self):
+        """
+        Test that the bundle fetches the statements of the symbols
+        concurrently
+        """
+        transport = ReplayTransport()
+        for function in ('INCOME_STATEMENT', 'BALANCE_SHEET'):
+            transport.add(function,
+                          path=self.get_file_from_url("mock_fundamental_data"))
+        fd = FundamentalData(key=TestAlphaVantageAsync._API_KEY_TEST,
+                             transport=transport)
+        bundles, meta_data = await fd.get_fundamentals_bundle(
+            ['IBM', 'MSFT', 'AAPL'],
+            statements=['income_statement', 'balance_sheet'])
+        self.assertEqual(len(transport.calls), 6)
+        self.assertEqual(meta_data['errors'], {})
+        self.assertEqual(len(bundles['AAPL']['balance_sheet_quarterly']), 20)
+        await fd.close()
+
+    @make_async
+    async def test_sector_recorder(self):
+        """
+        Test that the recorder keeps one snapshot per Last Refreshed
+        """
+        transport = ReplayTransport()
+        transport.add('SECTOR', path=self.get_file_from_url("mock_sector"))
+        sp = SectorPerformances(key=TestAlphaVantageAsync._API_KEY_TEST,
+                                output_format='pandas', transport=transport)
+        recorder = SectorRecorder(sp, interval=0)
+        await recorder.run(cycles=2)
+        self.assertEqual(recorder.stats, {'polls': 2, 'snapshots': 1,
+                                          'errors': 0})
+        self.assertEqual(len(recorder.history.read()), 11)
+        await sp.close()
+
+    @make_async
+    async def test_symbol_search(self):
+        """
+        Test that the symbol search calls the api only on a miss
+        """
+        transport = ReplayTransport()
+        transport.add('SYMBOL_SEARCH',
+                      path=self.get_file_from_url("symbol_search"))
+        ts = TimeSeries(key=TestAlphaVantageAsync._API_KEY_TEST,
+                        transport=transport)
+        search = SymbolSearch(ts)
+        matches = await search.search('ba')
+        self.assertEqual(matches[0]['1. symbol'], 'BA')
+        matches = await search.search('babA')
+        self.assertEqual(matches[0]['2. name'],
+                         'Alibaba Group Holding Limited')
+        self.assertEqual(len(transport.calls), 1)
+        await ts.close()